@@ -1,111 +1,46 @@
-from flask import Flask, request, jsonify
-from google.cloud import bigquery
-from google.oauth2 import service_account
+from flask import Flask, Response, request, jsonify, stream_with_context
 from dotenv import load_dotenv
+import atexit
+import base64
 import json
+import math
 import os
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
 
-# Local dev support
-try:
-    import streamlit as st
-except ImportError:
-    st = None
+from cachetools import TTLCache
+
+from bq_client import get_client, on_client_ready, prefetch
+from cascade_table import CASCADE_TABLE
+from dedup_index import TweetIdDedupIndex
+from model_registry import (
+    LONG_TABLE, MODEL_REGISTRY, PREDICTION_STORAGE,
+    model_version, ordered_model_ids, pivot_predictions, to_long_rows, to_wide_row,
+)
+from http_caching import cacheable
+from ingest_spool import PredictionSpool
+from metrics import Metrics
+from model_stats import COUNTERS as STATS_COUNTERS, PAIRS as MODEL_PAIRS, AgreementStats
+from rate_limit import RateLimiter
+from request_logging import RequestLogger, annotate, log_debug, log_error, log_info
+from topic_index import TopicIndex
+from write_buffer import BufferFull, PredictionWriteBuffer
 
 load_dotenv()
 app = Flask(__name__)
+# JSON access records, sampled per route (LOG_SAMPLE_RATES), written off-thread
+request_logger = RequestLogger(app)
+# Route / BigQuery latency histograms, served at /api/metrics
+metrics = Metrics()
+metrics.init_app(app)
 
-# --- Credential Loader ---
-def load_bq_credentials():
-    """
-    Load BigQuery credentials from multiple sources in priority order:
-    1. Streamlit secrets (for local Streamlit development)
-    2. GOOGLE_APPLICATION_CREDENTIALS file path
-    3. BQ_CREDS environment variable (Heroku/production)
-    4. Individual environment variables (TYPE, PROJECT_ID, PRIVATE_KEY, etc.)
-    """
-    try:
-        # ✅ Method 1: Streamlit secrets
-        if st and "bq" in st.secrets and "creds" in st.secrets["bq"]:
-            creds_dict = dict(st.secrets["bq"]["creds"])
-            if "\\n" in creds_dict.get("private_key", ""):
-                creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n")
-            print("🟢 Using Streamlit secrets for BigQuery.")
-            return creds_dict
-        
-        # ✅ Method 2: GOOGLE_APPLICATION_CREDENTIALS file path
-        credentials_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
-        if credentials_path and os.path.exists(credentials_path):
-            with open(credentials_path, 'r') as f:
-                creds_dict = json.load(f)
-                # Ensure proper newline formatting in private key
-                if "\\n" in creds_dict.get("private_key", ""):
-                    creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n")
-                print(f"🟢 Using credentials from file: {credentials_path}")
-                return creds_dict
-        
-        # ✅ Method 3: BQ_CREDS environment variable (Heroku)
-        raw_creds = os.environ.get("BQ_CREDS")
-        if raw_creds:
-            creds_dict = json.loads(raw_creds)
-            creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n")
-            print("🟡 Using BQ_CREDS environment variable for BigQuery.")
-            return creds_dict
-        
-        # ✅ Method 4: Build from individual environment variables
-        if os.environ.get("TYPE") and os.environ.get("PROJECT_ID") and os.environ.get("PRIVATE_KEY"):
-            creds_dict = {
-                "type": os.environ.get("TYPE"),
-                "project_id": os.environ.get("PROJECT_ID"),
-                "private_key_id": os.environ.get("PRIVATE_KEY_ID"),
-                "private_key": os.environ.get("PRIVATE_KEY", "").replace("\\n", "\n"),
-                "client_email": os.environ.get("CLIENT_EMAIL"),
-                "client_id": os.environ.get("CLIENT_ID"),
-                "auth_uri": os.environ.get("AUTH_URI", "https://accounts.google.com/o/oauth2/auth"),
-                "token_uri": os.environ.get("TOKEN_URI", "https://oauth2.googleapis.com/token"),
-                "auth_provider_x509_cert_url": os.environ.get("AUTH_PROVIDER_X509_CERT_URL", 
-                                                                "https://www.googleapis.com/oauth2/v1/certs"),
-                "client_x509_cert_url": os.environ.get("CLIENT_X509_CERT_URL"),
-                "universe_domain": os.environ.get("UNIVERSE_DOMAIN", "googleapis.com")
-            }
-            print("🟡 Using individual environment variables for BigQuery.")
-            return creds_dict
-
-        raise RuntimeError("❌ No valid BigQuery credentials found in any source.")
-    
-    except json.JSONDecodeError as e:
-        print(f"❌ JSON parsing error in credentials: {e}")
-        return None
-    except Exception as e:
-        print(f"❌ Failed to load BigQuery credentials: {e}")
-        return None
-
-# --- Client Initializer ---
-def init_bigquery_client():
-    """Initialize BigQuery client with loaded credentials"""
-    creds_dict = load_bq_credentials()
-    if creds_dict:
-        try:
-            creds = service_account.Credentials.from_service_account_info(creds_dict)
-            project_id = creds_dict.get("project_id")
-            client = bigquery.Client(credentials=creds, project=project_id)
-            print(f"✅ BigQuery client initialized successfully for project: {project_id}")
-            return client
-        except Exception as e:
-            print(f"❌ Failed to initialize BigQuery client: {e}")
-            return None
-    else:
-        print("❌ Cannot initialize BigQuery client - no credentials available")
-        return None
-
-# Initialize client on startup
-client = init_bigquery_client()
+# BigQuery client is created on first use (bq_client.get_client), not at import
 
 # --- Routes ---
 @app.route("/")
 def index():
     """Health check endpoint"""
-    if client:
+    if get_client():
         return jsonify({
             "status": "running",
             "message": "Emakia Tech API is running 🚀",
@@ -120,11 +55,246 @@ def index():
         }), 503
 
 
+# --- Prediction ingest helpers ---
+PREDICTIONS_TABLE = "emakia.politics2024.CoreMLpredictions"
+# Table consulted for duplicate tweet_ids
+DEDUP_TABLE = LONG_TABLE if PREDICTION_STORAGE == "long" else PREDICTIONS_TABLE
+MAX_BATCH_ITEMS = int(os.environ.get("PREDICTION_BATCH_MAX_ITEMS", 1000))
+# Directory for the durable ingest spool; empty disables it
+SPOOL_PATH = os.environ.get("PREDICTION_SPOOL_PATH", "")
+# With a spool, rows are safe once accepted, so acknowledge without waiting
+FLUSH_TIMEOUT = float(os.environ.get("PREDICTION_FLUSH_TIMEOUT", 0 if SPOOL_PATH else 10))
+MAX_QUEUED_ROWS = int(os.environ.get("PREDICTION_QUEUE_MAX_ROWS", 10_000))
+
+
+class PayloadError(ValueError):
+    """Prediction payload failed validation; ``body`` is the 400 response."""
+
+    def __init__(self, body):
+        super().__init__(body.get("error"))
+        self.body = body
+
+
+def build_prediction_row(data):
+    """
+    Validate a single prediction payload and build its CoreMLpredictions row.
+    Returns (row_data, models_added); raises PayloadError on invalid payloads.
+    """
+    # Validate required fields
+    required_fields = ["tweet_id", "text", "predictions"]
+    missing_fields = [field for field in required_fields if field not in data]
+
+    if missing_fields:
+        error_msg = f"Missing required fields: {', '.join(missing_fields)}"
+        raise PayloadError({
+            "error": error_msg,
+            "received_keys": list(data.keys())
+        })
+
+    # Extract and validate predictions
+    predictions = data.get("predictions", {})
+    if not isinstance(predictions, dict):
+        raise PayloadError({"error": f"predictions must be a dict, got {type(predictions).__name__}"})
+
+    if not predictions:
+        raise PayloadError({"error": "predictions dict is empty"})
+
+    tweet_id = str(data.get("tweet_id"))
+    tweet_text = str(data.get("text"))
+
+    # Build row data with REQUIRED fields
+    row_data = {
+        "tweet_id": tweet_id,
+        "text": tweet_text,
+        "created_at": datetime.utcnow().isoformat(),
+        "possibly_sensitive": data.get("possibly_sensitive", False)
+    }
+
+    # Process each model's predictions, registered models first (primary = first stored)
+    models_added = []
+    for model_id in ordered_model_ids(predictions):
+        model_prediction = predictions[model_id]
+        if not isinstance(model_prediction, dict):
+            continue
+        if PREDICTION_STORAGE == "wide" and not MODEL_REGISTRY.get(model_id, {}).get("wide"):
+            log_debug("model has no wide columns, skipped", tweet_id=tweet_id, model_id=model_id)
+            continue
+
+        label = str(model_prediction.get("prediction", ""))
+        score = float(model_prediction.get("score", 0.0))
+        if not label:  # Only add if prediction exists
+            continue
+
+        row_data[f"prediction_{model_id}"] = label
+        row_data[f"score_{model_id}"] = score
+
+        if not models_added:
+            row_data["prediction"] = label
+            row_data["score"] = score
+            row_data["model_version"] = model_version(model_id)
+        models_added.append(model_id)
+
+    # Validate we got at least one model
+    if not models_added:
+        raise PayloadError({"error": "No valid model predictions found in payload"})
+
+    log_debug(
+        "prediction row built",
+        tweet_id=tweet_id,
+        text_length=len(tweet_text),
+        predictions=lambda: {m: (row_data[f"prediction_{m}"], row_data[f"score_{m}"]) for m in models_added},
+        primary=row_data["prediction"],
+    )
+    return row_data, models_added
+
+
+def lookup_existing_tweet_ids(tweet_ids):
+    """Return the subset of tweet_ids already stored (one query job)."""
+    from google.cloud import bigquery
+
+    if not tweet_ids:
+        return set()
+    query = f"""
+        SELECT DISTINCT tweet_id
+        FROM `{DEDUP_TABLE}`
+        WHERE tweet_id IN UNNEST(@tweet_ids)
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("tweet_ids", "STRING", list(tweet_ids))
+        ]
+    )
+    rows = metrics.run_query(get_client(), "dedup_lookup", query, job_config)
+    return {row.tweet_id for row in rows}
+
+
+def scan_prediction_tweet_ids(since=None):
+    """Yield (tweet_id, created_at) of stored predictions, optionally only rows after `since`."""
+    from google.cloud import bigquery
+
+    query = f"SELECT tweet_id, created_at FROM `{DEDUP_TABLE}`"
+    query_parameters = []
+    if since is not None:
+        query += " WHERE created_at > @since"
+        query_parameters.append(bigquery.ScalarQueryParameter("since", "TIMESTAMP", since))
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+    for row in metrics.run_query(get_client(), "dedup_scan", query, job_config, page_size=50000):
+        yield row.tweet_id, row.created_at
+
+
+def write_prediction_rows(rows):
+    """
+    Write prediction rows in the configured storage layout (wide, long or both).
+    Returns insert_rows_json-style errors indexed by position in `rows`.
+    """
+    client = get_client(required=True)
+    errors = {}
+    if PREDICTION_STORAGE in ("wide", "both"):
+        with metrics.bigquery_call("insert_predictions"):
+            wide_errors = client.insert_rows_json(PREDICTIONS_TABLE, [to_wide_row(row) for row in rows])
+        for error in wide_errors:
+            errors.setdefault(error["index"], []).extend(error["errors"])
+
+    if PREDICTION_STORAGE in ("long", "both"):
+        long_rows, sources = [], []
+        for i, row in enumerate(rows):
+            for long_row in to_long_rows(row):
+                long_rows.append(long_row)
+                sources.append(i)
+        with metrics.bigquery_call("insert_predictions_long"):
+            long_errors = client.insert_rows_json(LONG_TABLE, long_rows)
+        for error in long_errors:
+            errors.setdefault(sources[error["index"]], []).extend(error["errors"])
+
+    return [{"index": index, "errors": row_errors} for index, row_errors in sorted(errors.items())]
+
+
+def insert_prediction_rows(rows):
+    """Store prediction rows and update the dedup index and model stats."""
+    try:
+        errors = write_prediction_rows(rows)
+    except Exception:
+        if not write_buffer.spool:  # spooled rows are retried, keep them marked
+            dedup_index.discard([row["tweet_id"] for row in rows])
+        raise
+    failed = {error["index"] for error in errors}
+    dedup_index.discard([rows[i]["tweet_id"] for i in failed])
+    model_stats.record([row for i, row in enumerate(rows) if i not in failed])
+    return errors
+
+
+# Local duplicate index; only ambiguous tweet_ids fall back to a BigQuery lookup
+dedup_index = TweetIdDedupIndex(
+    lookup_existing_tweet_ids,
+    scan_prediction_tweet_ids,
+    recent_size=int(os.environ.get("DEDUP_RECENT_SIZE", 100_000)),
+    bloom_capacity=int(os.environ.get("DEDUP_BLOOM_CAPACITY", 5_000_000)),
+    refresh_seconds=float(os.environ.get("DEDUP_REFRESH_SECONDS", 60)),
+    lookback_seconds=float(os.environ.get("DEDUP_LOOKBACK_SECONDS", 3600)),
+)
+on_client_ready(lambda client: dedup_index.start_warmup())
+
+# Model agreement counters, updated as predictions are stored
+model_stats = AgreementStats(
+    sync_seconds=float(os.environ.get("MODEL_STATS_SYNC_SECONDS", 60)),
+    compact_seconds=float(os.environ.get("MODEL_STATS_COMPACT_SECONDS", 3600)),
+)
+
+
+def start_model_stats(client):
+    model_stats.start_sync(client)
+    atexit.register(model_stats.flush, client)
+
+
+on_client_ready(start_model_stats)
+
+
+# Rows from concurrent requests are coalesced into bulk streaming inserts
+write_buffer = PredictionWriteBuffer(
+    insert_prediction_rows,
+    max_rows=int(os.environ.get("PREDICTION_BUFFER_MAX_ROWS", 500)),
+    max_pending=MAX_QUEUED_ROWS,
+    spool=PredictionSpool(SPOOL_PATH) if SPOOL_PATH else None,
+)
+atexit.register(write_buffer.flush)
+# Re-queue rows a previous process accepted but never stored
+on_client_ready(lambda client: write_buffer.recover())
+
+# Per-client admission control for the ingest routes (0 disables)
+ingest_limiter = RateLimiter(
+    rate=float(os.environ.get("INGEST_RATE_PER_SECOND", 20)),
+    burst=int(os.environ.get("INGEST_BURST", 100)),
+)
+
+
+def ingest_client_key():
+    """X-Client-Id if the app sends one, else the caller's address."""
+    client_id = request.headers.get("X-Client-Id")
+    if client_id:
+        return f"id:{client_id[:128]}"
+    # Heroku's router appends the connecting address last; earlier entries are client-supplied
+    forwarded = request.headers.get("X-Forwarded-For", "")
+    return f"ip:{forwarded.split(',')[-1].strip() or request.remote_addr}"
+
+
+def too_many_requests(message, retry_after):
+    """429 with Retry-After (whole seconds, at least 1)."""
+    retry_after = max(1, math.ceil(retry_after))
+    annotate(outcome="throttled", retry_after=retry_after)
+    response = jsonify({"error": message, "retry_after": retry_after})
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 429
+
+
+def queue_full_response():
+    return too_many_requests("Prediction queue is full, retry later", write_buffer.retry_after())
+
+
 @app.route("/api/prediction", methods=["POST"])
 def receive_prediction():
     """
     Receive and store ML prediction results in BigQuery
-    Supports multiple model versions (llm0, llm3, llm4) in a single request
+    Supports any number of models (llm0, llm3, llm4, plus EXTRA_PREDICTION_MODELS) in a single request
     
     Expected JSON payload:
     {
@@ -137,154 +307,62 @@ def receive_prediction():
         }
     }
     """
+    client = get_client()
     if client is None:
         return jsonify({"error": "BigQuery client not initialized"}), 500
 
+    allowed, retry_after = ingest_limiter.acquire(ingest_client_key())
+    if not allowed:
+        return too_many_requests("Rate limit exceeded", retry_after)
+
     try:
-        # Get and log raw request
-        raw_data = request.get_data(as_text=True)
-        print("=" * 80)
-        print("🔍 RAW REQUEST:")
-        print(raw_data[:500])  # First 500 chars
-        print("=" * 80)
-        
         data = request.get_json(force=True)
         if not data:
+            annotate(outcome="invalid")
             return jsonify({"error": "No JSON payload provided"}), 400
+        log_debug("prediction payload", keys=lambda: list(data.keys()),
+                  raw=lambda: request.get_data(as_text=True)[:500])
 
-        print(f"✅ Parsed JSON successfully")
-        print(f"   Keys received: {list(data.keys())}")
-        
-        # Validate required fields
-        required_fields = ["tweet_id", "text", "predictions"]
-        missing_fields = [field for field in required_fields if field not in data]
-        
-        if missing_fields:
-            error_msg = f"Missing required fields: {', '.join(missing_fields)}"
-            print(f"❌ {error_msg}")
-            return jsonify({
-                "error": error_msg,
-                "received_keys": list(data.keys())
-            }), 400
-
-        # Extract and validate predictions
-        predictions = data.get("predictions", {})
-        if not isinstance(predictions, dict):
-            return jsonify({"error": f"predictions must be a dict, got {type(predictions).__name__}"}), 400
-        
-        if not predictions:
-            return jsonify({"error": "predictions dict is empty"}), 400
-        
-        print(f"   Predictions keys: {list(predictions.keys())}")
+        try:
+            row_data, models_added = build_prediction_row(data)
+        except PayloadError as e:
+            annotate(outcome="invalid", error=e.body["error"])
+            return jsonify(e.body), 400
+        tweet_id = row_data["tweet_id"]
+        annotate(tweet_id=tweet_id, models=models_added)
 
-        # Prepare base row data
-        table_id = "emakia.politics2024.CoreMLpredictions"
-        tweet_id = str(data.get("tweet_id"))
-        tweet_text = str(data.get("text"))
-        
-        print(f"📝 Processing tweet_id: {tweet_id}")
-        print(f"   Text length: {len(tweet_text)} chars")
-        
         # Check if tweet already exists
-        check_query = f"""
-            SELECT COUNT(*) as count 
-            FROM `{table_id}` 
-            WHERE tweet_id = '{tweet_id}'
-        """
-        
+        with metrics.timed("prediction.dedup_check"):
+            existing_ids = dedup_index.find_existing([tweet_id])
+        if tweet_id in existing_ids:
+            annotate(outcome="skipped")
+            return jsonify({
+                "status": "skipped",
+                "message": "Tweet already exists in database",
+                "tweet_id": tweet_id
+            }), 200
+
+        # Insert into BigQuery through the shared write buffer
+        dedup_index.add([tweet_id])
         try:
-            result = list(client.query(check_query).result())
-            if result[0].count > 0:
-                print(f"⚠️ Tweet {tweet_id} already exists, skipping...")
-                return jsonify({
-                    "status": "skipped",
-                    "message": "Tweet already exists in database",
-                    "tweet_id": tweet_id
-                }), 200
-        except Exception as e:
-            print(f"⚠️ Error checking for duplicates: {e}")
-        
-        # Build row data with REQUIRED fields
-        row_data = {
-            "tweet_id": tweet_id,
-            "text": tweet_text,
-            "created_at": datetime.utcnow().isoformat(),
-            "possibly_sensitive": data.get("possibly_sensitive", False)
-        }
-        
-        # Process each model's predictions
-        models_added = []
-        primary_prediction_set = False
-        
-        # Process llm0
-        if "llm0" in predictions and isinstance(predictions["llm0"], dict):
-            llm0_pred = str(predictions["llm0"].get("prediction", ""))
-            llm0_score = float(predictions["llm0"].get("score", 0.0))
-            
-            if llm0_pred:  # Only add if prediction exists
-                row_data["prediction_llm0"] = llm0_pred
-                row_data["score_llm0"] = llm0_score
-                models_added.append("llm0")
-                print(f"   ✅ llm0: {llm0_pred} ({llm0_score:.3f})")
-                
-                # Set as primary if first
-                if not primary_prediction_set:
-                    row_data["prediction"] = llm0_pred
-                    row_data["score"] = llm0_score
-                    row_data["model_version"] = "ToxicityTextClassifier0"
-                    primary_prediction_set = True
-        
-        # Process llm3
-        if "llm3" in predictions and isinstance(predictions["llm3"], dict):
-            llm3_pred = str(predictions["llm3"].get("prediction", ""))
-            llm3_score = float(predictions["llm3"].get("score", 0.0))
-            
-            if llm3_pred:
-                row_data["prediction_llm3"] = llm3_pred
-                row_data["score_llm3"] = llm3_score
-                models_added.append("llm3")
-                print(f"   ✅ llm3: {llm3_pred} ({llm3_score:.3f})")
-                
-                if not primary_prediction_set:
-                    row_data["prediction"] = llm3_pred
-                    row_data["score"] = llm3_score
-                    row_data["model_version"] = "ToxicityTextClassifier3"
-                    primary_prediction_set = True
-        
-        # Process llm4
-        if "llm4" in predictions and isinstance(predictions["llm4"], dict):
-            llm4_pred = str(predictions["llm4"].get("prediction", ""))
-            llm4_score = float(predictions["llm4"].get("score", 0.0))
-            
-            if llm4_pred:
-                row_data["prediction_llm4"] = llm4_pred
-                row_data["score_llm4"] = llm4_score
-                models_added.append("llm4")
-                print(f"   ✅ llm4: {llm4_pred} ({llm4_score:.3f})")
-                
-                if not primary_prediction_set:
-                    row_data["prediction"] = llm4_pred
-                    row_data["score"] = llm4_score
-                    row_data["model_version"] = "ToxicityTextClassifier4"
-                    primary_prediction_set = True
-        
-        # Validate we got at least one model
-        if not models_added:
-            return jsonify({"error": "No valid model predictions found in payload"}), 400
-        
-        # Verify REQUIRED fields are present
-        if "prediction" not in row_data or "score" not in row_data:
-            return jsonify({"error": "Failed to set required prediction/score fields"}), 500
-        
-        print(f"   📊 Primary: {row_data['prediction']} ({row_data['score']:.3f})")
-        print(f"   🎯 Models stored: {', '.join(models_added)}")
-        
-        # Insert into BigQuery
-        rows_to_insert = [row_data]
-        errors = client.insert_rows_json(table_id, rows_to_insert)
-        
-        if errors == []:
-            print(f"✅ Successfully inserted prediction for tweet {tweet_id}")
+            ticket = write_buffer.submit([row_data])
+        except BufferFull:
+            dedup_index.discard([tweet_id])
+            return queue_full_response()
+        with metrics.timed("prediction.flush_wait"):
+            flushed = ticket.wait(FLUSH_TIMEOUT)
+        if not flushed:
+            annotate(outcome="queued")
+            return jsonify({
+                "status": "queued",
+                "message": "Prediction accepted and queued for storage",
+                "tweet_id": tweet_id,
+                "models_stored": models_added,
+                "primary_prediction": row_data["prediction"]
+            }), 202
+
+        if not ticket.errors:
+            annotate(outcome="success")
             return jsonify({
                 "status": "success",
                 "message": "Prediction stored successfully",
@@ -293,162 +371,582 @@ def receive_prediction():
                 "primary_prediction": row_data["prediction"]
             }), 200
         else:
-            print(f"❌ BigQuery insert errors: {errors}")
+            log_error("BigQuery insert errors", tweet_id=tweet_id, details=ticket.errors)
             return jsonify({
                 "status": "error",
                 "message": "Failed to insert into BigQuery",
-                "details": errors
+                "details": ticket.errors
             }), 500
 
     except ValueError as e:
-        print(f"❌ ValueError: {e}")
-        import traceback
-        traceback.print_exc()
+        annotate(outcome="invalid", error=f"Invalid data type: {e}")
         return jsonify({"error": f"Invalid data type: {str(e)}"}), 400
     
     except Exception as e:
-        print(f"❌ Unexpected error: {e}")
-        import traceback
-        traceback.print_exc()
+        log_error(f"Unexpected error: {e}", exc_info=True)
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+
+@app.route("/api/predictions/batch", methods=["POST"])
+def receive_predictions_batch():
+    """
+    Receive many ML prediction results in one request (e.g. offline queue flush)
+
+    Expected JSON payload: a list of /api/prediction payloads, or {"items": [...]}
+
+    Query parameters:
+    - wait: "false" to return 202 once rows are queued. Only honoured with a spool
+      (PREDICTION_SPOOL_PATH), where queued rows are durable and retried; without one
+      the request always waits, so a failed insert is reported instead of lost.
+    """
+    client = get_client()
+    if client is None:
+        return jsonify({"error": "BigQuery client not initialized"}), 500
+
+    try:
+        data = request.get_json(force=True)
+        items = data.get("items") if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "Expected a non-empty list of prediction payloads"}), 400
+        if len(items) > MAX_BATCH_ITEMS:
+            return jsonify({
+                "error": f"Batch too large: {len(items)} items (max {MAX_BATCH_ITEMS})"
+            }), 413
+        allowed, retry_after = ingest_limiter.acquire(ingest_client_key(), cost=len(items))
+        if not allowed:
+            return too_many_requests("Rate limit exceeded", retry_after)
+
+        results = []
+        accepted = []  # (result, row_data)
+        seen_ids = set()
+        for index, item in enumerate(items):
+            result = {"index": index}
+            results.append(result)
+            try:
+                if not isinstance(item, dict):
+                    raise PayloadError({"error": f"item must be an object, got {type(item).__name__}"})
+                row_data, models_added = build_prediction_row(item)
+            except PayloadError as e:
+                result.update(status="error", **e.body)
+                continue
+            except ValueError as e:
+                result.update(status="error", error=f"Invalid data type: {str(e)}")
+                continue
+
+            tweet_id = row_data["tweet_id"]
+            result["tweet_id"] = tweet_id
+            if tweet_id in seen_ids:
+                result.update(status="skipped", message="Duplicate tweet_id in batch")
+                continue
+            seen_ids.add(tweet_id)
+            result.update(status="queued", models_stored=models_added)
+            accepted.append((result, row_data))
+
+        # At most one duplicate lookup for the whole batch
+        with metrics.timed("batch.dedup_check"):
+            existing_ids = dedup_index.find_existing([row["tweet_id"] for _, row in accepted])
+        if existing_ids:
+            for result, row_data in accepted:
+                if row_data["tweet_id"] in existing_ids:
+                    result.update(status="skipped", message="Tweet already exists in database")
+                    result.pop("models_stored", None)
+            accepted = [(r, row) for r, row in accepted if row["tweet_id"] not in existing_ids]
+
+        dedup_index.add([row["tweet_id"] for _, row in accepted])
+        try:
+            ticket = write_buffer.submit([row for _, row in accepted])
+        except BufferFull:
+            dedup_index.discard([row["tweet_id"] for _, row in accepted])
+            return queue_full_response()
+        wait = not write_buffer.spool or request.args.get("wait", "false").lower() == "true"
+        with metrics.timed("batch.flush_wait"):
+            flushed = ticket.done or (wait and ticket.wait(FLUSH_TIMEOUT))
+        if flushed:
+            failed = {error["index"]: error["errors"] for error in ticket.errors}
+            for i, (result, _) in enumerate(accepted):
+                if i in failed:
+                    result.update(status="error", error="Failed to insert into BigQuery", details=failed[i])
+                else:
+                    result["status"] = "success"
+
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        annotate(items=len(items), counts=counts, flushed=flushed)
+
+        return jsonify({
+            "status": "processed" if flushed else "queued",
+            "received": len(items),
+            "counts": counts,
+            "results": results
+        }), 200 if flushed else 202
+
+    except Exception as e:
+        log_error(f"Batch ingest error: {e}", exc_info=True)
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+# --- Tweet cascade helpers ---
+# Models readers may ask for: wide columns only, or every registered model with long storage
+CASCADE_MODELS = tuple(
+    model_id for model_id, entry in MODEL_REGISTRY.items()
+    if entry["wide"] or PREDICTION_STORAGE != "wide"
+)
+CASCADE_MAX_LIMIT = 1000
+# Rows fetched per BigQuery result page by the NDJSON export
+CASCADE_EXPORT_PAGE_SIZE = int(os.environ.get("CASCADE_EXPORT_PAGE_SIZE", 5000))
+
+# "live" joins tweets/users/predictions per request; "materialized" reads the
+# pre-joined table maintained by cascade_table.py
+CASCADE_SOURCE = os.environ.get("CASCADE_SOURCE", "live").lower()
+if CASCADE_SOURCE not in ("live", "materialized"):
+    raise ValueError(f"CASCADE_SOURCE must be 'live' or 'materialized', got {CASCADE_SOURCE!r}")
+
+CASCADE_SELECT_LIVE = """
+        SELECT DISTINCT
+            t.id AS tweet_id,
+            t.text AS content,
+            t.author_id,
+            t.possibly_sensitive,
+            t.created_at,
+            t.lang,
+            u.username,
+            u.name,
+            u.profile_image_url,
+            p.prediction_llm0,
+            p.score_llm0,
+            p.prediction_llm3,
+            p.score_llm3,
+            p.prediction_llm4,
+            p.score_llm4
+        FROM `emakia.politics2024.NoRetweets-political2024` AS t
+        LEFT JOIN `emakia.politics2024.users` AS u
+            ON t.author_id = u.id
+        LEFT JOIN `emakia.politics2024.CoreMLpredictions` AS p
+            ON t.id = p.tweet_id
+"""
+
+CASCADE_SELECT_MATERIALIZED = f"""
+        SELECT
+            c.tweet_id,
+            c.content,
+            c.author_id,
+            c.possibly_sensitive,
+            c.created_at,
+            c.lang,
+            c.username,
+            c.name,
+            c.profile_image_url,
+            c.prediction_llm0,
+            c.score_llm0,
+            c.prediction_llm3,
+            c.score_llm3,
+            c.prediction_llm4,
+            c.score_llm4
+        FROM `{CASCADE_TABLE}` AS c
+"""
+
+# Column expressions used by the filters, per source
+CASCADE_COLUMNS = {
+    "live": {
+        "tweet_id": "t.id", "text": "t.text", "lang": "t.lang",
+        "possibly_sensitive": "t.possibly_sensitive", "created_at": "t.created_at",
+        "prediction_prefix": "p.prediction_",
+    },
+    "materialized": {
+        "tweet_id": "c.tweet_id", "text": "c.content", "lang": "c.lang",
+        "possibly_sensitive": "c.possibly_sensitive", "created_at": "c.created_at",
+        "prediction_prefix": "c.prediction_",
+    },
+}
+
+# Result cache for identical feed requests (the app polls with the same filters)
+cascade_cache = TTLCache(
+    maxsize=int(os.environ.get("CASCADE_CACHE_MAX_ENTRIES", 256)),
+    ttl=float(os.environ.get("CASCADE_CACHE_TTL_SECONDS", 30)),
+)
+cascade_cache_lock = threading.Lock()
+
+# Optional local token index: topic filters resolve to candidate tweet_ids first
+TOPIC_INDEX_MAX_CANDIDATES = int(os.environ.get("TOPIC_INDEX_MAX_CANDIDATES", 2000))
+# Candidates are hydrated from the same source as the feed unless overridden; with the
+# day-partitioned tweet_cascade table, the candidates' created_at range prunes partitions
+# and the tweet_id list prunes clusters
+TOPIC_INDEX_SOURCE = os.environ.get("TOPIC_INDEX_SOURCE", CASCADE_SOURCE).lower()
+if TOPIC_INDEX_SOURCE not in ("live", "materialized"):
+    raise ValueError(f"TOPIC_INDEX_SOURCE must be 'live' or 'materialized', got {TOPIC_INDEX_SOURCE!r}")
+topic_index = TopicIndex(
+    os.environ["TOPIC_INDEX_PATH"],
+    lookback_seconds=float(os.environ.get("TOPIC_INDEX_LOOKBACK_SECONDS", 3600)),
+) if os.environ.get("TOPIC_INDEX_PATH") else None
+if topic_index:
+    on_client_ready(lambda client: topic_index.start_refresher(
+        client, float(os.environ.get("TOPIC_INDEX_REFRESH_SECONDS", 300))
+    ))
+
+
+def encode_cascade_cursor(created_at, tweet_id):
+    """Opaque keyset cursor for the (created_at, tweet_id) position of a row."""
+    raw = json.dumps([created_at.isoformat() if created_at else None, tweet_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cascade_cursor(cursor):
+    """Inverse of encode_cascade_cursor; raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, tweet_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), str(tweet_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def normalize_cascade_filters(args):
+    """Parse tweet-cascade query parameters into a canonical (hashable) filter dict."""
+    sensitive_filter = (args.get("sensitive_filter") or "").lower() or None
+    if sensitive_filter not in (None, "true", "false"):
+        raise ValueError("sensitive_filter must be 'true' or 'false'")
+
+    model_filter = args.get("model") or None
+    if model_filter and model_filter not in CASCADE_MODELS:
+        raise ValueError(f"model must be one of: {', '.join(CASCADE_MODELS)}")
+
+    models = tuple(m.strip() for m in args.get("models", "").split(",") if m.strip()) or CASCADE_MODELS
+    unknown = [m for m in models if m not in CASCADE_MODELS]
+    if unknown:
+        raise ValueError(f"Unknown models: {', '.join(unknown)} (available: {', '.join(CASCADE_MODELS)})")
+
+    return {
+        "topic": args.get("topic", "").strip().lower(),
+        "lang": args.get("lang", "en"),
+        "sensitive_filter": sensitive_filter,
+        "model": model_filter,
+        "prediction_type": args.get("prediction_type") or None,
+        "models": models,
+    }
+
+
+def reads_long_predictions(model_ids):
+    """Whether predictions for these models must come from the long-format table."""
+    return PREDICTION_STORAGE == "long" or any(not MODEL_REGISTRY[m]["wide"] for m in model_ids)
+
+
+def build_cascade_query(filters, limit, cursor=None, source=None,
+                        candidate_ids=None, index_watermark=None, candidates_since=None):
+    """
+    Build the cascade query and its parameters, newest first, after `cursor` if given.
+    `limit=None` leaves the result unbounded (export). `candidate_ids` (from the topic index) replace the topic
+    text filter: those tweets match as-is, and only tweets newer than `index_watermark` are matched on text.
+    `candidates_since` (the oldest candidate's created_at) bounds the scan to the partitions they span.
+    """
+    from google.cloud import bigquery
+
+    source = source or CASCADE_SOURCE
+    col = CASCADE_COLUMNS[source]
+    conditions = []
+    query_parameters = []
+
+    if filters["lang"]:
+        conditions.append(f"{col['lang']} = @lang")
+        query_parameters.append(bigquery.ScalarQueryParameter("lang", "STRING", filters["lang"]))
+
+    if filters["topic"]:
+        query_parameters.append(bigquery.ScalarQueryParameter("topic", "STRING", filters["topic"]))
+        if candidate_ids is None:
+            conditions.append(f"LOWER({col['text']}) LIKE CONCAT('%', @topic, '%')")
+        else:
+            # Candidates already matched in the index; only the unindexed tail is text-filtered
+            conditions.append(f"{col['created_at']} >= @candidates_since")
+            conditions.append(
+                f"({col['tweet_id']} IN UNNEST(@candidate_ids)"
+                f" OR ({col['created_at']} > @index_watermark"
+                f" AND LOWER({col['text']}) LIKE CONCAT('%', @topic, '%')))"
+            )
+            query_parameters.extend([
+                bigquery.ArrayQueryParameter("candidate_ids", "STRING", list(candidate_ids)),
+                bigquery.ScalarQueryParameter("index_watermark", "TIMESTAMP", index_watermark),
+                bigquery.ScalarQueryParameter("candidates_since", "TIMESTAMP", candidates_since or index_watermark),
+            ])
+
+    if filters["sensitive_filter"] == "true":
+        conditions.append(f"{col['possibly_sensitive']} = TRUE")
+    elif filters["sensitive_filter"] == "false":
+        conditions.append(f"{col['possibly_sensitive']} = FALSE")
+
+    # Filter by model prediction (model is validated against CASCADE_MODELS)
+    if filters["model"] and filters["prediction_type"]:
+        if reads_long_predictions([filters["model"]]):
+            conditions.append(
+                f"EXISTS (SELECT 1 FROM `{LONG_TABLE}` AS l WHERE l.tweet_id = {col['tweet_id']}"
+                " AND l.model_id = @filter_model AND l.label = @prediction_type)"
+            )
+            query_parameters.append(bigquery.ScalarQueryParameter("filter_model", "STRING", filters["model"]))
+        else:
+            conditions.append(f"{col['prediction_prefix']}{filters['model']} = @prediction_type")
+        query_parameters.append(
+            bigquery.ScalarQueryParameter("prediction_type", "STRING", filters["prediction_type"])
+        )
+
+    # Keyset pagination: strictly after the last (created_at, tweet_id) seen
+    if cursor:
+        cursor_created_at, cursor_tweet_id = cursor
+        conditions.append(
+            f"({col['created_at']} < @cursor_created_at"
+            f" OR ({col['created_at']} = @cursor_created_at AND {col['tweet_id']} < @cursor_tweet_id))"
+        )
+        query_parameters.extend([
+            bigquery.ScalarQueryParameter("cursor_created_at", "TIMESTAMP", cursor_created_at),
+            bigquery.ScalarQueryParameter("cursor_tweet_id", "STRING", cursor_tweet_id),
+        ])
+
+    query = CASCADE_SELECT_MATERIALIZED if source == "materialized" else CASCADE_SELECT_LIVE
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += f" ORDER BY {col['created_at']} DESC, {col['tweet_id']} DESC"
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    return query, query_parameters
+
+
+def fetch_model_predictions(tweet_ids, model_ids):
+    """Predictions for only the requested models from the long table, pivoted per tweet."""
+    from google.cloud import bigquery
+
+    if not tweet_ids:
+        return {}
+    query = f"""
+        SELECT tweet_id, model_id, label, score, created_at
+        FROM `{LONG_TABLE}`
+        WHERE tweet_id IN UNNEST(@tweet_ids) AND model_id IN UNNEST(@model_ids)
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("tweet_ids", "STRING", list(tweet_ids)),
+        bigquery.ArrayQueryParameter("model_ids", "STRING", list(model_ids)),
+    ])
+    rows = [dict(row) for row in metrics.run_query(get_client(), "cascade_long_predictions", query, job_config)]
+    return pivot_predictions(rows, model_ids)
+
+
+def format_cascade_row(row, model_ids=CASCADE_MODELS, long_predictions=None):
+    """
+    Shape one cascade result row for the API response. Predictions come from the
+    row's wide columns, or from `long_predictions` (tweet_id -> model -> prediction).
+    """
+    tweet_data = {
+        "tweet_id": row.tweet_id,
+        "content": row.content,
+        "author_id": row.author_id,
+        "possibly_sensitive": row.possibly_sensitive,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "username": row.username,
+        "name": row.name,
+        "profile_image_url": row.profile_image_url,
+        "predictions": {}
+    }
+
+    if long_predictions is not None:
+        tweet_data["predictions"] = long_predictions.get(row.tweet_id, {})
+        return tweet_data
+
+    # Add model predictions if available
+    for model in model_ids:
+        prediction = getattr(row, f"prediction_{model}")
+        if prediction:
+            tweet_data["predictions"][model] = {
+                "prediction": prediction,
+                "score": getattr(row, f"score_{model}")
+            }
+    return tweet_data
+
+
+def fetch_cascade_page(filters, limit, cursor=None):
+    """Run the cascade query for one page. Returns (tweets, next_cursor)."""
+    from google.cloud import bigquery
+
+    candidates = None
+    if filters["topic"] and topic_index is not None and topic_index.ready:
+        index_watermark = topic_index.watermark
+        candidates = topic_index.search(filters["topic"], TOPIC_INDEX_MAX_CANDIDATES, cursor)
+
+    source = CASCADE_SOURCE
+    if candidates is None:
+        query, query_parameters = build_cascade_query(filters, limit + 1, cursor)
+    else:
+        annotate(topic_candidates=len(candidates))
+        source = TOPIC_INDEX_SOURCE
+        query, query_parameters = build_cascade_query(
+            filters, limit + 1, cursor, source=source,
+            candidate_ids=[tweet_id for tweet_id, _ in candidates],
+            index_watermark=index_watermark,
+            candidates_since=candidates[-1][1] if candidates else None,
+        )
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+
+    log_debug("cascade query", source=source, limit=limit, lang=filters["lang"], topic=filters["topic"])
+    rows = list(metrics.run_query(get_client(), f"cascade_{source}", query, job_config))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cascade_cursor(rows[-1].created_at, rows[-1].tweet_id)
+    elif candidates and len(candidates) >= TOPIC_INDEX_MAX_CANDIDATES:
+        # Candidate list was truncated: continue after the last candidate considered
+        last_id, last_created_at = candidates[-1]
+        last_created_at = datetime.fromisoformat(last_created_at).replace(tzinfo=timezone.utc)
+        next_cursor = encode_cascade_cursor(last_created_at, last_id)
+
+    model_ids = filters["models"]
+    long_predictions = None
+    if reads_long_predictions(model_ids):
+        long_predictions = fetch_model_predictions([row.tweet_id for row in rows], model_ids)
+    return [format_cascade_row(row, model_ids, long_predictions) for row in rows], next_cursor
+
+
 @app.route("/api/tweet-cascade", methods=["GET"])
+@cacheable
 def get_tweet_cascade():
     """
     Retrieve tweets with predictions from all models
     
     Query parameters:
-    - topic: Filter tweets containing this text (case-insensitive)
+    - topic: Filter tweets containing this text (case-insensitive). With the topic
+      index enabled, indexed tweets must contain every word of the topic as a whole
+      word; a word the index has never seen falls back to the substring match
     - limit: Maximum number of tweets to return (default: 50, max: 1000)
     - sensitive_filter: Filter by sensitivity ("true", "false", or omit for all)
     - lang: Filter by language (default: "en" for English only)
     - model: Filter by specific model prediction (llm0, llm3, llm4)
     - prediction_type: Filter by prediction type (harassment, neutral, etc.)
+    - models: Comma-separated models to return predictions for (default: all)
+    - cursor: Opaque `next_cursor` from the previous page (keyset pagination)
     """
+    client = get_client()
     if client is None:
         return jsonify({"error": "BigQuery client not initialized"}), 500
 
     # Parse query parameters
-    topic = request.args.get("topic", "").strip()
-    limit = min(request.args.get("limit", default=50, type=int), 1000)
-    sensitive_filter = request.args.get("sensitive_filter")
-    lang = request.args.get("lang", "en")
-    model_filter = request.args.get("model")
-    prediction_type = request.args.get("prediction_type")
+    limit = max(1, min(request.args.get("limit", default=50, type=int), CASCADE_MAX_LIMIT))
+    cursor_param = request.args.get("cursor") or None
+    try:
+        filters = normalize_cascade_filters(request.args)
+        cursor = decode_cascade_cursor(cursor_param) if cursor_param else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     try:
-        # Build dynamic filters
-        filters = []
-        
-        if lang:
-            filters.append(f"t.lang = '{lang}'")
-        
-        if topic:
-            topic_escaped = topic.replace("'", "\\'").lower()
-            filters.append(f"LOWER(t.text) LIKE '%{topic_escaped}%'")
-        
-        if sensitive_filter == "true":
-            filters.append("t.possibly_sensitive = TRUE")
-        elif sensitive_filter == "false":
-            filters.append("t.possibly_sensitive = FALSE")
-        
-        # Filter by model prediction
-        if model_filter and prediction_type:
-            model_column = f"p.prediction_{model_filter}"
-            filters.append(f"{model_column} = '{prediction_type}'")
-
-        # ✅ Build query with predictions from all models
-        query = """
-            SELECT DISTINCT
-                t.id AS tweet_id,
-                t.text AS content,
-                t.author_id,
-                t.possibly_sensitive,
-                t.created_at,
-                t.lang,
-                u.username,
-                u.name,
-                u.profile_image_url,
-                p.prediction_llm0,
-                p.score_llm0,
-                p.prediction_llm3,
-                p.score_llm3,
-                p.prediction_llm4,
-                p.score_llm4
-            FROM `emakia.politics2024.NoRetweets-political2024` AS t
-            LEFT JOIN `emakia.politics2024.users` AS u
-                ON t.author_id = u.id
-            LEFT JOIN `emakia.politics2024.CoreMLpredictions` AS p
-                ON t.id = p.tweet_id
-        """
-
-        if filters:
-            query += " WHERE " + " AND ".join(filters)
-        
-        query += f" ORDER BY t.created_at DESC LIMIT {limit}"
-
-        print(f"📊 Executing query (limit: {limit}, lang: {lang})")
-        query_job = client.query(query)
-        results = query_job.result()
-
-        tweets = []
-        for row in results:
-            tweet_data = {
-                "tweet_id": row.tweet_id,
-                "content": row.content,
-                "author_id": row.author_id,
-                "possibly_sensitive": row.possibly_sensitive,
-                "created_at": row.created_at.isoformat() if row.created_at else None,
-                "username": row.username,
-                "name": row.name,
-                "profile_image_url": row.profile_image_url,
-                "predictions": {}
-            }
-            
-            # Add model predictions if available
-            if row.prediction_llm0:
-                tweet_data["predictions"]["llm0"] = {
-                    "prediction": row.prediction_llm0,
-                    "score": row.score_llm0
-                }
-            if row.prediction_llm3:
-                tweet_data["predictions"]["llm3"] = {
-                    "prediction": row.prediction_llm3,
-                    "score": row.score_llm3
-                }
-            if row.prediction_llm4:
-                tweet_data["predictions"]["llm4"] = {
-                    "prediction": row.prediction_llm4,
-                    "score": row.score_llm4
-                }
-            
-            tweets.append(tweet_data)
-
-        print(f"📊 Found {len(tweets)} tweets")
+        cache_key = (tuple(sorted(filters.items())), limit, cursor_param)
+        with cascade_cache_lock:
+            cached = cascade_cache.get(cache_key)
 
-        return jsonify({
+        if cached is None:
+            cached = fetch_cascade_page(filters, limit, cursor)
+            with cascade_cache_lock:
+                cascade_cache[cache_key] = cached
+            cache_status = "MISS"
+        else:
+            cache_status = "HIT"
+        tweets, next_cursor = cached
+
+        annotate(count=len(tweets), cache=cache_status.lower())
+
+        response = jsonify({
             "count": len(tweets),
             "data": tweets,
+            "next_cursor": next_cursor,
             "filters_applied": {
-                "topic": topic if topic else "all",
-                "sensitive_filter": sensitive_filter,
+                "topic": filters["topic"] if filters["topic"] else "all",
+                "sensitive_filter": filters["sensitive_filter"],
                 "limit": limit,
-                "lang": lang,
-                "model": model_filter,
-                "prediction_type": prediction_type
+                "lang": filters["lang"],
+                "model": filters["model"],
+                "prediction_type": filters["prediction_type"],
+                "models": list(filters["models"])
             }
-        }), 200
+        })
+        response.headers["X-Cache"] = cache_status
+        return response, 200
 
     except Exception as e:
-        print(f"❌ Query error: {e}")
-        import traceback
-        traceback.print_exc()
+        log_error(f"Query error: {e}", exc_info=True)
         return jsonify({
             "error": "Failed to fetch tweets",
             "details": str(e)
         }), 500
 
 
+@app.route("/api/tweet-cascade/export", methods=["GET"])
+def export_tweet_cascade():
+    """
+    Stream every tweet matching the tweet-cascade filters as NDJSON (one tweet per line)
+
+    Takes the same filters as /api/tweet-cascade plus `cursor`, but no page limit:
+    rows are written as BigQuery result pages arrive, so memory stays constant.
+    Optional `max_rows` caps the export. If the stream fails part-way, the last line
+    is {"error": ..., "resume_cursor": ...}; pass that cursor to continue.
+    """
+    client = get_client()
+    if client is None:
+        return jsonify({"error": "BigQuery client not initialized"}), 500
+
+    from google.cloud import bigquery
+
+    max_rows = request.args.get("max_rows", type=int)
+    cursor_param = request.args.get("cursor") or None
+    try:
+        filters = normalize_cascade_filters(request.args)
+        cursor = decode_cascade_cursor(cursor_param) if cursor_param else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query, query_parameters = build_cascade_query(filters, max_rows, cursor)
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+    try:
+        rows = metrics.run_query(
+            client, f"cascade_export_{CASCADE_SOURCE}", query, job_config,
+            page_size=CASCADE_EXPORT_PAGE_SIZE,
+        )
+    except Exception as e:
+        log_error(f"Export query error: {e}", exc_info=True)
+        return jsonify({"error": "Failed to fetch tweets", "details": str(e)}), 500
+
+    model_ids = filters["models"]
+    long_storage = reads_long_predictions(model_ids)
+
+    def generate():
+        exported = 0
+        last_row = None
+        try:
+            for page in rows.pages:
+                page = list(page)
+                long_predictions = None
+                if long_storage:
+                    long_predictions = fetch_model_predictions([row.tweet_id for row in page], model_ids)
+                chunk = "".join(
+                    json.dumps(format_cascade_row(row, model_ids, long_predictions)) + "\n"
+                    for row in page
+                )
+                if page:
+                    last_row = page[-1]
+                exported += len(page)
+                yield chunk
+        except Exception as e:
+            log_error(f"Export stream failed after {exported} rows: {e}", exc_info=True)
+            resume = encode_cascade_cursor(last_row.created_at, last_row.tweet_id) if last_row else cursor_param
+            yield json.dumps({"error": str(e), "resume_cursor": resume}) + "\n"
+        log_info("export finished", rows=exported)
+
+    annotate(source=CASCADE_SOURCE, max_rows=max_rows)
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+HEALTH_PROBE_SECONDS = float(os.environ.get("HEALTH_PROBE_SECONDS", 60))
+
+
 @app.route("/api/health", methods=["GET"])
 def health_check():
     """Detailed health check endpoint"""
@@ -458,21 +956,42 @@ def health_check():
         "bigquery": "disconnected"
     }
     
+    client = get_client()
     if client:
-        try:
-            query = "SELECT 1 as test"
-            result = list(client.query(query).result())
-            health_status["bigquery"] = "connected"
-            health_status["bigquery_project"] = client.project
-            return jsonify(health_status), 200
-        except Exception as e:
-            health_status["bigquery"] = "error"
-            health_status["bigquery_error"] = str(e)
+        # Reuse the outcome of recent BigQuery traffic; probe only when it is stale
+        state = metrics.bigquery_state()
+        checked_at = state["checked_at"]
+        if checked_at is None or (datetime.now(timezone.utc) - checked_at).total_seconds() > HEALTH_PROBE_SECONDS:
+            try:
+                list(metrics.run_query(client, "health_probe", "SELECT 1 as test"))
+            except Exception:
+                pass
+            state = metrics.bigquery_state()
+
+        health_status["bigquery"] = state["status"]
+        health_status["bigquery_checked_at"] = state["checked_at"].isoformat()
+        if state["error"]:
+            health_status["bigquery_error"] = state["error"]
             return jsonify(health_status), 503
-    
+        health_status["bigquery_project"] = client.project
+        return jsonify(health_status), 200
+
     return jsonify(health_status), 503
 
 
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    """Latency histograms per route and BigQuery job metrics (bytes processed, cache hits)"""
+    snapshot = metrics.snapshot()
+    snapshot["write_buffer"] = {
+        "pending_rows": write_buffer.pending_count(),
+        "max_pending_rows": write_buffer.max_pending,
+        "retry_in_seconds": round(write_buffer.retry_after(), 1),
+        "spooled_rows": write_buffer.spool.depth() if write_buffer.spool else None,
+    }
+    return jsonify(snapshot), 200
+
+
 @app.route("/api/test-prediction", methods=["POST"])
 def test_prediction():
     """
@@ -480,17 +999,6 @@ def test_prediction():
     Use this to debug payload issues
     """
     try:
-        raw_data = request.get_data(as_text=True)
-        
-        print("=" * 80)
-        print("TEST PREDICTION ENDPOINT")
-        print("=" * 80)
-        print(f"Content-Type: {request.content_type}")
-        print(f"Content-Length: {request.content_length}")
-        print(f"\nRaw Data:")
-        print(raw_data)
-        print("=" * 80)
-        
         data = request.get_json(force=True)
         
         response = {
@@ -504,68 +1012,92 @@ def test_prediction():
             }
         }
         
-        print(f"\nParsed JSON Response:")
-        print(json.dumps(response, indent=2))
-        print("=" * 80)
-        
+        # Echo payloads are always part of this route's access record
+        annotate(raw=lambda: request.get_data(as_text=True), parsed=response["received"])
         return jsonify(response), 200
         
     except Exception as e:
-        print(f"❌ Test endpoint error: {e}")
         import traceback
-        traceback.print_exc()
+        log_error(f"Test endpoint error: {e}", exc_info=True)
         return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
 
 
+def agreement_summary(counters):
+    """Counts and percentages in the /api/model-comparison response shape."""
+    total = counters["total"]
+
+    def pct(count):
+        return round(count / total * 100, 2) if total > 0 else 0
+
+    summary = {
+        "total_predictions": total,
+        "all_models_agree": counters["all_agree"],
+        "all_models_agree_pct": pct(counters["all_agree"]),
+    }
+    for a, b in MODEL_PAIRS:
+        key = f"{a}_{b}_agree"
+        summary[key] = counters[key]
+        summary[f"{key}_pct"] = pct(counters[key])
+    return summary
+
+
+def query_model_comparison_totals():
+    """Full-table aggregation, used only until the incremental stats are loaded."""
+    query = """
+        SELECT 
+            COUNT(*) as total,
+            SUM(CASE WHEN prediction_llm0 = prediction_llm3 AND prediction_llm3 = prediction_llm4 THEN 1 ELSE 0 END) as all_agree,
+            SUM(CASE WHEN prediction_llm0 = prediction_llm3 THEN 1 ELSE 0 END) as llm0_llm3_agree,
+            SUM(CASE WHEN prediction_llm0 = prediction_llm4 THEN 1 ELSE 0 END) as llm0_llm4_agree,
+            SUM(CASE WHEN prediction_llm3 = prediction_llm4 THEN 1 ELSE 0 END) as llm3_llm4_agree
+        FROM `emakia.politics2024.CoreMLpredictions`
+        WHERE prediction_llm0 IS NOT NULL 
+            AND prediction_llm3 IS NOT NULL 
+            AND prediction_llm4 IS NOT NULL
+    """
+    row = list(metrics.run_query(get_client(), "model_comparison_totals", query))[0]
+    return {key: row[key] or 0 for key in STATS_COUNTERS}
+
+
 @app.route("/api/model-comparison", methods=["GET"])
+@cacheable
 def model_comparison():
     """
     Compare predictions across different models
     Returns statistics on agreement/disagreement between models
+
+    Query parameters:
+    - window: "hour" or "day" to add a time-windowed breakdown (omit for totals only)
+    - buckets: Number of windows to return, newest first (default: 24, max: 720)
     """
+    client = get_client()
     if client is None:
         return jsonify({"error": "BigQuery client not initialized"}), 500
-    
+
+    window = request.args.get("window")
+    if window not in (None, "hour", "day"):
+        return jsonify({"error": "window must be 'hour' or 'day'"}), 400
+    buckets = max(1, min(request.args.get("buckets", default=24, type=int), 720))
+
     try:
-        limit = min(request.args.get("limit", default=100, type=int), 10000)
-        
-        query = f"""
-            SELECT 
-                COUNT(*) as total_predictions,
-                SUM(CASE WHEN prediction_llm0 = prediction_llm3 AND prediction_llm3 = prediction_llm4 THEN 1 ELSE 0 END) as all_agree,
-                SUM(CASE WHEN prediction_llm0 = prediction_llm3 THEN 1 ELSE 0 END) as llm0_llm3_agree,
-                SUM(CASE WHEN prediction_llm0 = prediction_llm4 THEN 1 ELSE 0 END) as llm0_llm4_agree,
-                SUM(CASE WHEN prediction_llm3 = prediction_llm4 THEN 1 ELSE 0 END) as llm3_llm4_agree
-            FROM `emakia.politics2024.CoreMLpredictions`
-            WHERE prediction_llm0 IS NOT NULL 
-                AND prediction_llm3 IS NOT NULL 
-                AND prediction_llm4 IS NOT NULL
-            LIMIT {limit}
-        """
-        
-        query_job = client.query(query)
-        results = list(query_job.result())
-        
-        if results:
-            row = results[0]
-            total = row.total_predictions
-            
-            return jsonify({
-                "total_predictions": total,
-                "all_models_agree": row.all_agree,
-                "all_models_agree_pct": round(row.all_agree / total * 100, 2) if total > 0 else 0,
-                "llm0_llm3_agree": row.llm0_llm3_agree,
-                "llm0_llm3_agree_pct": round(row.llm0_llm3_agree / total * 100, 2) if total > 0 else 0,
-                "llm0_llm4_agree": row.llm0_llm4_agree,
-                "llm0_llm4_agree_pct": round(row.llm0_llm4_agree / total * 100, 2) if total > 0 else 0,
-                "llm3_llm4_agree": row.llm3_llm4_agree,
-                "llm3_llm4_agree_pct": round(row.llm3_llm4_agree / total * 100, 2) if total > 0 else 0
-            }), 200
+        if model_stats.ready:
+            response = agreement_summary(model_stats.totals())
         else:
-            return jsonify({"error": "No data found"}), 404
-            
+            log_info("model stats not loaded yet, falling back to full aggregation")
+            response = agreement_summary(query_model_comparison_totals())
+        response["stats_source"] = "incremental" if model_stats.ready else "query"
+
+        if window:
+            response["window"] = window
+            response["windows"] = [
+                {"start": start.isoformat(), **agreement_summary(counters)}
+                for start, counters in model_stats.windows(window, buckets)
+            ]
+
+        return jsonify(response), 200
+
     except Exception as e:
-        print(f"❌ Model comparison error: {e}")
+        log_error(f"Model comparison error: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 
@@ -578,6 +1110,9 @@ def not_found(error):
 def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
+# Build the client in the background so imports (and dyno boot) don't wait on auth
+prefetch()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5001))
     debug = os.environ.get("FLASK_DEBUG", "False").lower() == "true"
@@ -0,0 +1,163 @@
+"""
+ASGI serving mode for the Emakia backend.
+
+Serves the same Flask routes from an asyncio event loop: connections and
+request bodies are handled on the loop, while each route (and its blocking
+BigQuery calls) runs on a bounded thread pool. Requests beyond the pool size
+wait on the loop without tying up a thread, so one process can hold hundreds
+of in-flight requests.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+
+_END = object()
+
+
+class AsgiBridge:
+    """Run a WSGI app under ASGI with bounded, off-loop concurrency."""
+
+    def __init__(self, wsgi_app, max_concurrency=64, queue_timeout=30.0):
+        self.wsgi_app = wsgi_app
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="asgi-worker")
+        self._slots = None  # created lazily on the serving loop
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # Wait for running routes off the loop so in-flight responses keep streaming
+                await asyncio.to_thread(self.executor.shutdown, wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.extend(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"), (b"retry-after", b"1")],
+            })
+            await send({"type": "http.response.body", "body": b'{"error": "Server busy, retry shortly"}'})
+            return
+
+        loop = asyncio.get_running_loop()
+        iterator = None
+        try:
+            environ = build_environ(scope, bytes(body))
+            status, headers, iterator = await loop.run_in_executor(self.executor, self._start, environ)
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, iterator, _END)
+                if chunk is _END:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if iterator is not None and hasattr(iterator, "close"):
+                await loop.run_in_executor(self.executor, iterator.close)
+            self._slots.release()
+
+    def _start(self, environ):
+        """Call the WSGI app; returns (status code, ASGI headers, body iterator)."""
+        response = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            if exc_info and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in response_headers
+            ]
+
+        result = self.wsgi_app(environ, start_response)
+        iterator = iter(result)
+        first = next(iterator, _END)  # start_response may be deferred to the first chunk
+
+        def chunks():
+            try:
+                if first is not _END:
+                    yield first
+                yield from iterator
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+
+        return response["status"], response["headers"], chunks()
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            continue
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+app = AsgiBridge(
+    flask_app,
+    max_concurrency=int(os.environ.get("ASGI_MAX_CONCURRENCY", 64)),
+    queue_timeout=float(os.environ.get("ASGI_QUEUE_TIMEOUT", 30)),
+)
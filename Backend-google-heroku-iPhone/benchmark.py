@@ -0,0 +1,286 @@
+"""
+Load and latency benchmark for the Emakia API.
+
+Replays a mix of realistic traffic (single predictions, some for tweets that
+already exist, offline-queue batch uploads, paged feed reads with filters and
+model-comparison polls) and reports req/s and p50/p95/p99 latency per endpoint.
+
+By default the app runs in-process against the local SQLite stand-in for
+BigQuery (local_bigquery.py), seeded with synthetic tweets, so no cloud
+resources are touched:
+
+    python benchmark.py --requests 5000 --concurrency 32
+    python benchmark.py --duration 60 --mix prediction=80,cascade=20
+    python benchmark.py --url http://localhost:5001 --duration 30   # a running server
+
+Exits non-zero when any request fails with a 5xx or when --max-p99-ms is exceeded,
+so it can gate a deploy.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MIX = "prediction=60,cascade=30,batch=5,model_comparison=5"
+LABELS = ["neutral", "neutral", "neutral", "harassment"]
+TOPICS = ["election", "vote", "border", "economy", "climate", "taxes", "immigration", "court"]
+
+
+def parse_mix(spec):
+    weights = {}
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition("=")
+        if name not in TrafficGenerator.ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in --mix: {name!r}")
+        weights[name] = float(weight)
+    return weights
+
+
+def prediction_payload(tweet_id, rng):
+    return {
+        "tweet_id": tweet_id,
+        "text": " ".join(rng.choices(TOPICS, k=rng.randint(3, 12))),
+        "possibly_sensitive": rng.random() < 0.1,
+        "predictions": {
+            model: {"prediction": rng.choice(LABELS), "score": round(rng.random(), 3)}
+            for model in ("llm0", "llm3", "llm4")
+        },
+    }
+
+
+class TrafficGenerator:
+    """Per-worker request generator; follows next_cursor like a scrolling client."""
+
+    ENDPOINTS = ("prediction", "cascade", "batch", "model_comparison")
+
+    def __init__(self, weights, existing_ids, duplicate_rate, seed):
+        self.names = list(weights)
+        self.weights = [weights[name] for name in self.names]
+        self.existing_ids = existing_ids
+        self.duplicate_rate = duplicate_rate
+        self.rng = random.Random(seed)
+        self.next_page = None  # (params, cursor) of the last feed page read
+
+    def new_tweet_id(self):
+        if self.existing_ids and self.rng.random() < self.duplicate_rate:
+            return self.rng.choice(self.existing_ids)
+        return f"bench-{uuid.uuid4().hex}"
+
+    def next_request(self):
+        """(endpoint, method, path, json body or None)."""
+        name = self.rng.choices(self.names, self.weights)[0]
+        if name == "prediction":
+            return name, "POST", "/api/prediction", prediction_payload(self.new_tweet_id(), self.rng)
+        if name == "batch":
+            items = [prediction_payload(self.new_tweet_id(), self.rng) for _ in range(self.rng.randint(10, 100))]
+            return name, "POST", "/api/predictions/batch", items
+        if name == "model_comparison":
+            return name, "GET", self.rng.choice(["/api/model-comparison", "/api/model-comparison?window=hour&buckets=24"]), None
+
+        if self.next_page and self.rng.random() < 0.5:
+            params, cursor = self.next_page
+            return name, "GET", f"/api/tweet-cascade?{params}&cursor={cursor}", None
+        params = [f"limit={self.rng.choice([20, 50, 50, 100])}"]
+        if self.rng.random() < 0.3:
+            params.append(f"topic={self.rng.choice(TOPICS)}")
+        if self.rng.random() < 0.2:
+            params.append(f"model=llm{self.rng.choice([0, 3, 4])}&prediction_type=harassment")
+        if self.rng.random() < 0.2:
+            params.append("sensitive_filter=false")
+        return name, "GET", "/api/tweet-cascade?" + "&".join(params), None
+
+    def observe(self, path, body):
+        """Remember the feed cursor so the next feed read may continue paging."""
+        if path.startswith("/api/tweet-cascade") and isinstance(body, dict):
+            params = path.split("?", 1)[1].split("&cursor=")[0]
+            self.next_page = (params, body["next_cursor"]) if body.get("next_cursor") else None
+
+
+class InProcessTransport:
+    """Calls the Flask app directly (no network), one test client per thread."""
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._local = threading.local()
+
+    def send(self, method, path, body):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpTransport:
+    """Sends requests to a running server over keep-alive connections."""
+
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url.rstrip("/")
+        self._requests = requests
+        self._local = threading.local()
+
+    def send(self, method, path, body):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        response = session.request(method, self.base_url + path, json=body, timeout=60)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """samples: [(endpoint, status, latency_ms)] -> report dict."""
+    report = {"elapsed_s": round(elapsed, 2), "requests": len(samples),
+              "req_per_s": round(len(samples) / elapsed, 1) if elapsed else None, "endpoints": {}}
+    for name in sorted({sample[0] for sample in samples}) + ["all"]:
+        selected = [s for s in samples if name == "all" or s[0] == name]
+        latencies = sorted(s[2] for s in selected)
+        statuses = {}
+        for _, status, _ in selected:
+            statuses[status] = statuses.get(status, 0) + 1
+        report["endpoints"][name] = {
+            "count": len(selected),
+            "req_per_s": round(len(selected) / elapsed, 1) if elapsed else None,
+            "errors": sum(1 for s in selected if s[1] >= 500),
+            "status": statuses,
+            **{f"p{int(q * 100)}_ms": round(percentile(latencies, q), 2) for q in (0.5, 0.95, 0.99)},
+            "max_ms": round(latencies[-1], 2),
+        }
+    return report
+
+
+def print_report(report):
+    print(f"\n⏱️  {report['requests']} requests in {report['elapsed_s']}s ({report['req_per_s']} req/s)")
+    print(f"{'endpoint':<18}{'count':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'5xx':>6}")
+    for name, stats in report["endpoints"].items():
+        print(f"{name:<18}{stats['count']:>8}{stats['req_per_s']:>9}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}{stats['errors']:>6}")
+
+
+def prepare_local_backend(args):
+    """Point the app at a seeded SQLite stand-in; returns sample existing tweet_ids."""
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="emakia-bench-"), "bench.db")
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["LOCAL_BIGQUERY_PATH"] = path
+    os.environ.setdefault("LOG_SAMPLE_RATES", "default=0")
+    os.environ.setdefault("INGEST_RATE_PER_SECOND", "0")  # every worker shares one address
+
+    from local_bigquery import LocalBigQueryClient, seed
+
+    is_new = not os.path.exists(path)
+    client = LocalBigQueryClient(path)
+    if is_new:
+        tweets, predictions = seed(client, tweets=args.tweets)
+        print(f"🧪 Seeded {path}: {tweets} tweets, {predictions} predictions")
+    rows = client.query("SELECT tweet_id FROM `emakia.politics2024.CoreMLpredictions` LIMIT 5000").result()
+    return [row.tweet_id for row in rows]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay realistic API traffic and report req/s and latency.")
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--requests", type=int, default=2000, help="Stop after this many requests")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds instead")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1,
+                        help="Share of predictions for tweets that already have one")
+    parser.add_argument("--db", help="SQLite stand-in file to reuse (default: a fresh seeded temp file)")
+    parser.add_argument("--tweets", type=int, default=20000, help="Tweets to seed into a new stand-in")
+    parser.add_argument("--warmup", type=int, default=50, help="Requests sent before measuring")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if overall p99 latency exceeds this")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    if args.url:
+        transport = HttpTransport(args.url)
+        existing_ids = []
+    else:
+        existing_ids = prepare_local_backend(args)
+        from app import app as flask_app
+        from bq_client import get_client
+
+        get_client(required=True)
+        transport = InProcessTransport(flask_app)
+
+    samples = []
+    samples_lock = threading.Lock()
+    remaining = [args.requests]
+    deadline = time.monotonic() + args.duration if args.duration else None
+
+    def take():
+        with samples_lock:
+            if deadline is not None:
+                return time.monotonic() < deadline
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(worker_id, measure):
+        generator = TrafficGenerator(weights, existing_ids, args.duplicate_rate, seed=worker_id)
+        budget = args.warmup // args.concurrency if not measure else None
+        while (budget is None and take()) or (budget is not None and budget > 0):
+            if budget is not None:
+                budget -= 1
+            name, method, path, body = generator.next_request()
+            started = time.perf_counter()
+            try:
+                status, response = transport.send(method, path, body)
+            except Exception as e:
+                status, response = 599, None
+                print(f"⚠️ {method} {path}: {e}", file=sys.stderr)
+            latency_ms = (time.perf_counter() - started) * 1000
+            generator.observe(path, response)
+            if measure:
+                with samples_lock:
+                    samples.append((name, status, latency_ms))
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda i: worker(i, measure=False), range(args.concurrency)))
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda i: worker(1000 + i, measure=True), range(args.concurrency)))
+    elapsed = time.monotonic() - started
+
+    if not samples:
+        print("❌ No requests completed")
+        return 1
+    report = summarize(samples, elapsed)
+    report["config"] = {"url": args.url or "in-process (sqlite)", "concurrency": args.concurrency, "mix": weights}
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    overall = report["endpoints"]["all"]
+    if overall["errors"]:
+        print(f"❌ {overall['errors']} requests failed with 5xx")
+        return 1
+    if args.max_p99_ms is not None and overall["p99_ms"] > args.max_p99_ms:
+        print(f"❌ p99 {overall['p99_ms']}ms exceeds --max-p99-ms {args.max_p99_ms}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
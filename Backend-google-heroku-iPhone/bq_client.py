@@ -0,0 +1,201 @@
+"""
+Shared, lazily created BigQuery client.
+
+Nothing BigQuery-related is imported or authenticated until the first call to
+`get_client()`; the client is then built once and shared by every thread, with
+an HTTP connection pool sized for concurrent requests (BQ_HTTP_POOL_SIZE).
+Streamlit is imported only when a `.streamlit/secrets.toml` is present.
+
+STORAGE_BACKEND=sqlite swaps in the local stand-in from local_bigquery.py
+(file: LOCAL_BIGQUERY_PATH) for load testing without BigQuery.
+
+Used by the API (app.py), the maintenance scripts in this directory, the Neo4j
+loaders and the CoreML evaluation scripts:
+
+    from bq_client import get_client
+    client = get_client(required=True)
+"""
+
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BIGQUERY_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+HTTP_POOL_SIZE = int(os.environ.get("BQ_HTTP_POOL_SIZE", 64))
+RETRY_SECONDS = float(os.environ.get("BQ_CLIENT_RETRY_SECONDS", 30))
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "bigquery").lower()
+if STORAGE_BACKEND not in ("bigquery", "sqlite"):
+    raise ValueError(f"STORAGE_BACKEND must be 'bigquery' or 'sqlite', got {STORAGE_BACKEND!r}")
+
+_lock = threading.Lock()
+_client = None
+_last_error = None
+_failed_at = None
+_ready_callbacks = []
+
+
+def _streamlit_secrets():
+    """st.secrets, importing streamlit only when a secrets file exists."""
+    candidates = [
+        os.path.join(os.getcwd(), ".streamlit", "secrets.toml"),
+        os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+    ]
+    if not any(os.path.exists(path) for path in candidates):
+        return None
+    try:
+        import streamlit as st
+    except ImportError:
+        return None
+    return st.secrets
+
+
+def _fix_private_key(creds_dict):
+    if "\\n" in creds_dict.get("private_key", ""):
+        creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n")
+    return creds_dict
+
+
+def load_bq_credentials():
+    """
+    Load service account credentials from, in priority order:
+    1. Streamlit secrets (for local Streamlit development)
+    2. GOOGLE_APPLICATION_CREDENTIALS file path
+    3. BQ_CREDS environment variable (Heroku/production)
+    4. Individual environment variables (TYPE, PROJECT_ID, PRIVATE_KEY, etc.)
+    Returns None when none is configured (the caller falls back to ADC).
+    """
+    secrets = _streamlit_secrets()
+    if secrets and "bq" in secrets and "creds" in secrets["bq"]:
+        print("🟢 Using Streamlit secrets for BigQuery.")
+        return _fix_private_key(dict(secrets["bq"]["creds"]))
+
+    credentials_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
+    if credentials_path and os.path.exists(credentials_path):
+        with open(credentials_path, "r") as f:
+            creds_dict = json.load(f)
+        if creds_dict.get("type") == "service_account":
+            print(f"🟢 Using credentials from file: {credentials_path}")
+            return _fix_private_key(creds_dict)
+
+    raw_creds = os.environ.get("BQ_CREDS")
+    if raw_creds:
+        print("🟡 Using BQ_CREDS environment variable for BigQuery.")
+        return _fix_private_key(json.loads(raw_creds))
+
+    if os.environ.get("TYPE") and os.environ.get("PROJECT_ID") and os.environ.get("PRIVATE_KEY"):
+        print("🟡 Using individual environment variables for BigQuery.")
+        return _fix_private_key({
+            "type": os.environ.get("TYPE"),
+            "project_id": os.environ.get("PROJECT_ID"),
+            "private_key_id": os.environ.get("PRIVATE_KEY_ID"),
+            "private_key": os.environ.get("PRIVATE_KEY", ""),
+            "client_email": os.environ.get("CLIENT_EMAIL"),
+            "client_id": os.environ.get("CLIENT_ID"),
+            "auth_uri": os.environ.get("AUTH_URI", "https://accounts.google.com/o/oauth2/auth"),
+            "token_uri": os.environ.get("TOKEN_URI", "https://oauth2.googleapis.com/token"),
+            "auth_provider_x509_cert_url": os.environ.get("AUTH_PROVIDER_X509_CERT_URL",
+                                                            "https://www.googleapis.com/oauth2/v1/certs"),
+            "client_x509_cert_url": os.environ.get("CLIENT_X509_CERT_URL"),
+            "universe_domain": os.environ.get("UNIVERSE_DOMAIN", "googleapis.com"),
+        })
+
+    return None
+
+
+def create_client(project=None, pool_size=HTTP_POOL_SIZE):
+    """Build a new BigQuery client (service account or ADC) with a pooled HTTP session."""
+    if STORAGE_BACKEND == "sqlite":
+        from local_bigquery import LocalBigQueryClient
+
+        path = os.environ.get("LOCAL_BIGQUERY_PATH", "local_bigquery.db")
+        print(f"🧪 Using local SQLite stand-in for BigQuery: {path}")
+        return LocalBigQueryClient(path)
+
+    import google.auth
+    import requests
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import bigquery
+    from google.oauth2 import service_account
+
+    creds_dict = load_bq_credentials()
+    if creds_dict:
+        credentials = service_account.Credentials.from_service_account_info(
+            creds_dict, scopes=BIGQUERY_SCOPES
+        )
+        project = project or creds_dict.get("project_id")
+    else:
+        print("🟡 No explicit credentials, using Application Default Credentials.")
+        credentials, default_project = google.auth.default(scopes=BIGQUERY_SCOPES)
+        project = project or os.environ.get("BQ_PROJECT") or default_project
+
+    # One keep-alive pool shared by all request threads
+    session = AuthorizedSession(credentials)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+
+    client = bigquery.Client(project=project, credentials=credentials, _http=session)
+    print(f"✅ BigQuery client initialized successfully for project: {project}")
+    return client
+
+
+def get_client(required=False, project=None):
+    """
+    The shared client, created on first use. Returns None if it cannot be
+    created (retried after BQ_CLIENT_RETRY_SECONDS), or raises when `required`.
+    """
+    global _last_error, _failed_at
+    if _client is None:
+        created = None
+        with _lock:
+            if _client is None and (_failed_at is None or time.monotonic() - _failed_at >= RETRY_SECONDS):
+                try:
+                    created = create_client(project=project)
+                except Exception as e:
+                    _last_error, _failed_at = e, time.monotonic()
+                    print(f"❌ Failed to initialize BigQuery client: {e}")
+                else:
+                    _install(created)
+        if created is not None:
+            _notify_ready(created)
+    if _client is None and required:
+        raise RuntimeError(f"BigQuery client unavailable: {_last_error}")
+    return _client
+
+
+def set_client(client):
+    """Use an existing client as the shared one (e.g. in tests)."""
+    with _lock:
+        _install(client)
+    _notify_ready(client)
+
+
+def _install(client):
+    global _client, _last_error, _failed_at
+    _client, _last_error, _failed_at = client, None, None
+
+
+def _notify_ready(client):
+    for callback in list(_ready_callbacks):
+        try:
+            callback(client)
+        except Exception as e:
+            print(f"⚠️ BigQuery client ready callback failed: {e}")
+
+
+def on_client_ready(callback):
+    """Call `callback(client)` once the shared client exists (now, if it already does)."""
+    with _lock:
+        _ready_callbacks.append(callback)
+        client = _client
+    if client is not None:
+        callback(client)
+
+
+def prefetch():
+    """Create the shared client from a daemon thread, off the import path."""
+    threading.Thread(target=get_client, name="bigquery-client-init", daemon=True).start()
@@ -0,0 +1,204 @@
+"""
+Materialized tweet/prediction join for /api/tweet-cascade.
+
+Maintains `emakia.politics2024.tweet_cascade`: one pre-joined row per tweet
+(tweet + author + latest CoreML predictions), partitioned by day and
+clustered for the feed's filters, so the endpoint reads a single table
+instead of joining three on every request.
+
+Usage:
+    python cascade_table.py --full-refresh   # (re)build the table from scratch
+    python cascade_table.py                  # merge rows changed since the last run
+    python cascade_table.py --lookback-hours 6   # re-read a wider window for late rows
+
+Run the incremental refresh on a schedule (e.g. Heroku Scheduler) and set
+CASCADE_SOURCE=materialized on the API.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import TYPE_CHECKING
+
+from dotenv import load_dotenv
+
+from bq_client import get_client
+
+if TYPE_CHECKING:
+    from google.cloud import bigquery
+
+load_dotenv()
+
+TWEETS_TABLE = "emakia.politics2024.NoRetweets-political2024"
+USERS_TABLE = "emakia.politics2024.users"
+PREDICTIONS_TABLE = "emakia.politics2024.CoreMLpredictions"
+CASCADE_TABLE = os.environ.get("CASCADE_TABLE", "emakia.politics2024.tweet_cascade")
+
+# Latest prediction per tweet joined to its tweet and author; the `*_where`
+# placeholders narrow the source rows for incremental refreshes.
+SOURCE_QUERY = """
+    WITH latest_predictions AS (
+        SELECT *
+        FROM `{predictions_table}`
+        WHERE TRUE {prediction_where}
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY tweet_id ORDER BY created_at DESC) = 1
+    ),
+    latest_users AS (
+        SELECT id, username, name, profile_image_url
+        FROM `{users_table}`
+        WHERE id IS NOT NULL
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY id) = 1
+    )
+    SELECT
+        t.id AS tweet_id,
+        t.text AS content,
+        t.author_id,
+        t.possibly_sensitive,
+        t.created_at,
+        t.lang,
+        u.username,
+        u.name,
+        u.profile_image_url,
+        p.prediction_llm0,
+        p.score_llm0,
+        p.prediction_llm3,
+        p.score_llm3,
+        p.prediction_llm4,
+        p.score_llm4,
+        p.created_at AS prediction_created_at
+    FROM `{tweets_table}` AS t
+    LEFT JOIN latest_users AS u
+        ON t.author_id = u.id
+    {prediction_join} JOIN latest_predictions AS p
+        ON t.id = p.tweet_id
+    WHERE TRUE {tweet_where}
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY t.id ORDER BY t.created_at DESC) = 1
+"""
+
+CASCADE_COLUMNS = [
+    "tweet_id", "content", "author_id", "possibly_sensitive", "created_at", "lang",
+    "username", "name", "profile_image_url",
+    "prediction_llm0", "score_llm0", "prediction_llm3", "score_llm3",
+    "prediction_llm4", "score_llm4", "prediction_created_at",
+]
+PREDICTION_COLUMNS = [
+    "prediction_llm0", "score_llm0", "prediction_llm3", "score_llm3",
+    "prediction_llm4", "score_llm4", "prediction_created_at",
+]
+
+
+def source_query(prediction_join="LEFT", prediction_where="", tweet_where=""):
+    return SOURCE_QUERY.format(
+        tweets_table=TWEETS_TABLE,
+        users_table=USERS_TABLE,
+        predictions_table=PREDICTIONS_TABLE,
+        prediction_join=prediction_join,
+        prediction_where=prediction_where,
+        tweet_where=tweet_where,
+    )
+
+
+def full_refresh(client: bigquery.Client) -> None:
+    """Rebuild the cascade table from all tweets."""
+    query = f"""
+        CREATE OR REPLACE TABLE `{CASCADE_TABLE}`
+        PARTITION BY DATE(created_at)
+        CLUSTER BY lang, possibly_sensitive, tweet_id
+        AS {source_query()}
+    """
+    job = client.query(query)
+    job.result()
+    print(f"✅ Rebuilt {CASCADE_TABLE} ({job.total_bytes_processed or 0:,} bytes processed)")
+
+
+def get_watermarks(client: bigquery.Client):
+    """Latest tweet and prediction timestamps already materialized."""
+    query = f"""
+        SELECT MAX(created_at) AS tweet_watermark,
+               MAX(prediction_created_at) AS prediction_watermark
+        FROM `{CASCADE_TABLE}`
+    """
+    row = list(client.query(query).result())[0]
+    return row.tweet_watermark, row.prediction_watermark
+
+
+def incremental_refresh(client: bigquery.Client, lookback_hours: float = 1) -> int:
+    """
+    Merge tweets and predictions created since the last refresh. Returns rows affected.
+
+    Prediction created_at is stamped at ingest, before the write buffer or spool
+    stores the row, so rows can land after newer ones were merged; `lookback_hours`
+    before each watermark are re-read. Matched rows are only updated when the
+    source prediction is newer, so re-reading the window is idempotent.
+    """
+    from google.cloud import bigquery
+
+    tweet_watermark, prediction_watermark = get_watermarks(client)
+    if tweet_watermark is None:
+        print("⚠️ Cascade table is empty, running a full refresh instead")
+        full_refresh(client)
+        return 0
+
+    query_parameters = [
+        bigquery.ScalarQueryParameter("tweet_watermark", "TIMESTAMP", tweet_watermark),
+        bigquery.ScalarQueryParameter("prediction_watermark", "TIMESTAMP", prediction_watermark),
+        bigquery.ScalarQueryParameter("lookback_minutes", "INT64", int(lookback_hours * 60)),
+    ]
+    # New predictions (for any tweet) plus new tweets (with or without predictions)
+    new_predictions = source_query(
+        prediction_join="INNER",
+        prediction_where="AND (@prediction_watermark IS NULL OR created_at > "
+                         "TIMESTAMP_SUB(@prediction_watermark, INTERVAL @lookback_minutes MINUTE))",
+    )
+    new_tweets = source_query(
+        tweet_where="AND t.created_at > TIMESTAMP_SUB(@tweet_watermark, INTERVAL @lookback_minutes MINUTE)"
+    )
+
+    update_set = ",\n                ".join(f"{col} = src.{col}" for col in PREDICTION_COLUMNS)
+    query = f"""
+        MERGE `{CASCADE_TABLE}` AS target
+        USING (
+            SELECT *
+            FROM (({new_predictions}) UNION ALL ({new_tweets}))
+            WHERE TRUE
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY tweet_id ORDER BY prediction_created_at DESC NULLS LAST
+            ) = 1
+        ) AS src
+        ON target.tweet_id = src.tweet_id
+        WHEN MATCHED AND src.prediction_created_at IS NOT NULL AND (
+            target.prediction_created_at IS NULL
+            OR src.prediction_created_at > target.prediction_created_at
+        ) THEN UPDATE SET
+                {update_set}
+        WHEN NOT MATCHED THEN INSERT ({", ".join(CASCADE_COLUMNS)})
+            VALUES ({", ".join(f"src.{col}" for col in CASCADE_COLUMNS)})
+    """
+    job = client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=query_parameters))
+    job.result()
+    affected = job.num_dml_affected_rows or 0
+    print(f"✅ Merged {affected} rows into {CASCADE_TABLE} ({job.total_bytes_processed or 0:,} bytes processed)")
+    return affected
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Refresh the materialized tweet cascade table.")
+    parser.add_argument("--full-refresh", action="store_true", help="Rebuild the table from scratch")
+    parser.add_argument("--lookback-hours", type=float, default=1,
+                        help="Re-read this many hours before the watermarks to catch late rows")
+    args = parser.parse_args()
+
+    client = get_client(required=True)
+    started = time.monotonic()
+    if args.full_refresh:
+        full_refresh(client)
+    else:
+        incremental_refresh(client, args.lookback_hours)
+    print(f"⏱️ Done in {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,148 @@
+"""
+Local duplicate index for prediction tweet_ids.
+
+Replaces the per-request ``SELECT COUNT(*)`` duplicate check with:
+- an exact, bounded LRU set of recently stored/queued tweet_ids
+- a Bloom filter of every tweet_id in the table, warmed at startup and
+  refreshed incrementally in the background. Each refresh re-scans
+  ``lookback_seconds`` before its watermark, because created_at is stamped
+  at ingest and a row can land after rows with newer timestamps (write
+  buffer, spool retries, other processes).
+
+An ID in the recent set is a known duplicate; an ID the (complete) Bloom
+filter has never seen is known to be new. Everything else is ambiguous and
+is resolved with a single batched lookup.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on blake2b)."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class TweetIdDedupIndex:
+    """
+    Answer "which of these tweet_ids are already stored?" mostly from memory.
+
+    ``lookup_fn(ids)`` returns the subset of ids present in the table (one
+    query). ``scan_fn(since)`` yields ``(tweet_id, created_at)`` for all rows,
+    or only rows created after ``since`` when it is not None.
+    """
+
+    def __init__(self, lookup_fn, scan_fn, recent_size=100_000,
+                 bloom_capacity=5_000_000, error_rate=0.001, refresh_seconds=60,
+                 lookback_seconds=3600):
+        self.lookup_fn = lookup_fn
+        self.scan_fn = scan_fn
+        self.recent_size = recent_size
+        self.refresh_seconds = refresh_seconds
+        self.lookback = timedelta(seconds=lookback_seconds)
+        self._bloom = BloomFilter(bloom_capacity, error_rate)
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._ready = False
+        self._watermark = None
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def start_warmup(self):
+        """Warm the Bloom filter in the background, then keep it refreshed."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="dedup-index-warmup", daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        """Load tweet_ids written since the last refresh (all of them on first call)."""
+        started = time.monotonic()
+        count = 0
+        watermark = self._watermark
+        since = watermark - self.lookback if watermark is not None else None
+        for tweet_id, created_at in self.scan_fn(since):
+            with self._lock:
+                self._bloom.add(str(tweet_id))
+            if created_at is not None and (watermark is None or created_at > watermark):
+                watermark = created_at
+            count += 1
+        self._watermark = watermark
+        if not self._ready:
+            self._ready = True
+            print(f"✅ Dedup index warmed with {count} tweet_ids in {time.monotonic() - started:.1f}s")
+        return count
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Dedup index refresh failed: {e}")
+            time.sleep(self.refresh_seconds)
+
+    def add(self, tweet_ids):
+        """Record tweet_ids that were just stored or queued for storage."""
+        with self._lock:
+            for tweet_id in tweet_ids:
+                self._bloom.add(tweet_id)
+                self._recent[tweet_id] = True
+                self._recent.move_to_end(tweet_id)
+            while len(self._recent) > self.recent_size:
+                self._recent.popitem(last=False)
+
+    def discard(self, tweet_ids):
+        """Forget tweet_ids whose insert failed (the Bloom filter keeps them as ambiguous)."""
+        with self._lock:
+            for tweet_id in tweet_ids:
+                self._recent.pop(tweet_id, None)
+
+    def classify(self, tweet_ids):
+        """Split tweet_ids into (known duplicates, known new, ambiguous)."""
+        known, new, ambiguous = set(), set(), set()
+        with self._lock:
+            for tweet_id in tweet_ids:
+                if tweet_id in self._recent:
+                    known.add(tweet_id)
+                elif self._ready and tweet_id not in self._bloom:
+                    new.add(tweet_id)
+                else:
+                    ambiguous.add(tweet_id)
+        return known, new, ambiguous
+
+    def find_existing(self, tweet_ids):
+        """Return the subset of tweet_ids already stored, querying only ambiguous ones."""
+        known, _, ambiguous = self.classify(tweet_ids)
+        if ambiguous:
+            try:
+                found = set(self.lookup_fn(sorted(ambiguous)))
+            except Exception as e:
+                print(f"⚠️ Error checking for duplicates: {e}")
+                found = set()
+            if found:
+                self.add(found)
+            known |= found
+        return known
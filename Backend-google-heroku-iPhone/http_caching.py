@@ -0,0 +1,70 @@
+"""
+Conditional and compressed responses for read-heavy routes.
+
+`cacheable` tags a route's 200 responses with a weak ETag (hash of the JSON
+body), answers a matching `If-None-Match` with an empty 304, and gzips the body
+for clients that accept it. Compressed bodies are kept per ETag for a short
+while, so the same feed page polled by many clients is compressed once.
+"""
+
+import functools
+import gzip
+import hashlib
+import os
+import threading
+
+from cachetools import TTLCache
+from flask import make_response, request
+
+GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", 6))
+GZIP_MIN_BYTES = int(os.environ.get("RESPONSE_GZIP_MIN_BYTES", 1024))
+
+_compressed = TTLCache(
+    maxsize=int(os.environ.get("RESPONSE_GZIP_CACHE_ENTRIES", 256)),
+    ttl=float(os.environ.get("RESPONSE_GZIP_CACHE_TTL_SECONDS", 300)),
+)
+_compressed_lock = threading.Lock()
+
+
+def body_etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def gzip_body(etag, body):
+    with _compressed_lock:
+        compressed = _compressed.get(etag)
+    if compressed is None:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        with _compressed_lock:
+            _compressed[etag] = compressed
+    return compressed
+
+
+def cacheable(view):
+    """ETag / If-None-Match (304) and gzip handling for a route's 200 responses."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+            return response
+
+        body = response.get_data()
+        etag = body_etag(body)
+        # Weak: the same ETag covers the identity and gzip encodings
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "no-cache"
+        response.vary.add("Accept-Encoding")
+
+        if request.if_none_match.contains_weak(etag):
+            response.status_code = 304
+            response.set_data(b"")
+            response.headers.pop("Content-Type", None)
+            return response
+
+        if len(body) >= GZIP_MIN_BYTES and request.accept_encodings["gzip"]:
+            response.set_data(gzip_body(etag, body))
+            response.headers["Content-Encoding"] = "gzip"
+        return response
+
+    return wrapper
@@ -0,0 +1,103 @@
+"""
+Durable local spool for accepted predictions.
+
+Rows are committed to a SQLite segment on local disk before the API
+acknowledges them, and removed once BigQuery has the outcome. Each process
+owns one segment (`spool-<host>-<pid>.db`) and holds an exclusive lock on it;
+at startup, segments whose owner is gone (crash, dyno restart) are adopted
+into the new process's segment and drained like any other pending rows.
+Recovery only hands back rows no live request owns: adopted rows, and rows
+already in this segment when it was opened (a reused pid).
+"""
+
+import fcntl
+import glob
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS spool (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        row TEXT NOT NULL,
+        enqueued_at REAL NOT NULL
+    )
+"""
+
+
+def _open(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute(SCHEMA)
+    return conn
+
+
+class PredictionSpool:
+    """Append-only row spool in `directory`, one locked segment per process."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, f"spool-{socket.gethostname()}-{os.getpid()}.db")
+        self._lock_file = open(self.path + ".lock", "w")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._lock = threading.Lock()
+        self._conn = _open(self.path)
+        # Rows up to this id were left by an earlier process with the same pid
+        self._leftover_max_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM spool").fetchone()[0]
+
+    def append(self, rows):
+        """Durably store rows; returns their spool ids."""
+        now = time.time()
+        with self._lock, self._conn:
+            return [
+                self._conn.execute(
+                    "INSERT INTO spool (row, enqueued_at) VALUES (?, ?)", (json.dumps(row), now)
+                ).lastrowid
+                for row in rows
+            ]
+
+    def remove(self, ids):
+        ids = [i for i in ids if i is not None]
+        if not ids:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM spool WHERE id = ?", [(i,) for i in ids])
+
+    def take_leftovers(self):
+        """(id, row) pairs this segment held before this process opened it; returned once."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, row FROM spool WHERE id <= ? ORDER BY id", (self._leftover_max_id,)
+            ).fetchall()
+            self._leftover_max_id = 0
+        return [(spool_id, json.loads(row)) for spool_id, row in rows]
+
+    def depth(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def adopt_orphans(self):
+        """Move rows from segments of dead processes into this one. Returns the adopted (id, row) pairs."""
+        adopted = []
+        for path in glob.glob(os.path.join(self.directory, "spool-*.db")):
+            if path == self.path:
+                continue
+            with open(path + ".lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # owner is alive
+                orphan = _open(path)
+                rows = [json.loads(row) for (row,) in orphan.execute("SELECT row FROM spool ORDER BY id")]
+                orphan.close()
+                if rows:
+                    adopted.extend(zip(self.append(rows), rows))
+                for suffix in ("", "-wal", "-shm", ".lock"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+        return adopted
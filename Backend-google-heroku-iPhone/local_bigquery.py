@@ -0,0 +1,329 @@
+"""
+Local SQLite stand-in for BigQuery, for load and latency benchmarking.
+
+`LocalBigQueryClient` implements the part of `google.cloud.bigquery.Client`
+the API uses (`query(...).result()`, `insert_rows_json`, `project`) on an
+embedded SQLite file with the same tables. The BigQuery SQL written by app.py
+is translated on the fly: backtick table names, `@param` parameters,
+`IN UNNEST(@array)` and BEGIN/COMMIT TRANSACTION scripts. TIMESTAMP columns
+come back as UTC datetimes, like BigQuery.
+
+Enable it for the whole app with:
+    STORAGE_BACKEND=sqlite LOCAL_BIGQUERY_PATH=bench.db python app.py
+
+Usage:
+    python local_bigquery.py --path bench.db --tweets 20000   # create + seed
+"""
+
+import argparse
+import functools
+import json
+import random
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+from cascade_table import CASCADE_TABLE, PREDICTIONS_TABLE, TWEETS_TABLE, USERS_TABLE
+from model_registry import LONG_TABLE
+from model_stats import COUNTERS, PAIRS, STATS_TABLE
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+PREDICTION_FIELDS = [
+    ("prediction_llm0", "STRING"), ("score_llm0", "FLOAT64"),
+    ("prediction_llm3", "STRING"), ("score_llm3", "FLOAT64"),
+    ("prediction_llm4", "STRING"), ("score_llm4", "FLOAT64"),
+]
+
+# table -> [(column, BigQuery type)]
+TABLES = {
+    TWEETS_TABLE: [
+        ("id", "STRING"), ("text", "STRING"), ("author_id", "STRING"),
+        ("possibly_sensitive", "BOOLEAN"), ("created_at", "TIMESTAMP"), ("lang", "STRING"),
+    ],
+    USERS_TABLE: [
+        ("id", "STRING"), ("username", "STRING"), ("name", "STRING"), ("profile_image_url", "STRING"),
+    ],
+    PREDICTIONS_TABLE: [
+        ("tweet_id", "STRING"), ("text", "STRING"), ("prediction", "STRING"), ("score", "FLOAT64"),
+        ("model_version", "STRING"), *PREDICTION_FIELDS,
+        ("possibly_sensitive", "BOOLEAN"), ("created_at", "TIMESTAMP"),
+    ],
+    LONG_TABLE: [
+        ("tweet_id", "STRING"), ("model_id", "STRING"), ("model_version", "STRING"),
+        ("label", "STRING"), ("score", "FLOAT64"), ("created_at", "TIMESTAMP"),
+    ],
+    CASCADE_TABLE: [
+        ("tweet_id", "STRING"), ("content", "STRING"), ("author_id", "STRING"),
+        ("possibly_sensitive", "BOOLEAN"), ("created_at", "TIMESTAMP"), ("lang", "STRING"),
+        ("username", "STRING"), ("name", "STRING"), ("profile_image_url", "STRING"),
+        *PREDICTION_FIELDS, ("prediction_created_at", "TIMESTAMP"),
+    ],
+    STATS_TABLE: [
+        ("bucket_start", "TIMESTAMP"), ("recorded_at", "TIMESTAMP"),
+        *[(counter, "INT64") for counter in COUNTERS],
+    ],
+}
+
+# Secondary indexes standing in for BigQuery clustering
+INDEXES = {
+    TWEETS_TABLE: [("created_at", "id"), ("lang", "created_at")],
+    USERS_TABLE: [("id",)],
+    PREDICTIONS_TABLE: [("tweet_id",), ("created_at",)],
+    LONG_TABLE: [("tweet_id", "model_id"), ("created_at",)],
+    CASCADE_TABLE: [("created_at", "tweet_id"), ("lang", "created_at")],
+}
+
+SQLITE_TYPES = {"STRING": "TEXT", "FLOAT64": "REAL", "INT64": "INTEGER"}
+
+
+def format_timestamp(value):
+    """Canonical UTC storage string for a datetime or ISO-8601 string."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def _parse_timestamp(raw):
+    return datetime.fromisoformat(raw.decode()).replace(tzinfo=timezone.utc)
+
+
+sqlite3.register_converter("TIMESTAMP", _parse_timestamp)
+sqlite3.register_converter("BOOLEAN", lambda raw: raw not in (b"0", b""))
+
+
+def to_sqlite_value(value, field_type):
+    if value is None:
+        return None
+    if field_type == "TIMESTAMP":
+        return format_timestamp(value)
+    if field_type in ("BOOLEAN", "BOOL"):
+        return int(bool(value))
+    return value
+
+
+@functools.lru_cache(maxsize=256)
+def translate(query):
+    """BigQuery Standard SQL (as written by this app) -> SQLite."""
+    query = re.sub(r"`([^`]+)`", r'"\1"', query)
+    query = re.sub(r"IN\s+UNNEST\(\s*@(\w+)\s*\)", r"IN (SELECT value FROM json_each(:\1))", query)
+    return re.sub(r"@(\w+)", r":\1", query)
+
+
+def _concat(*parts):
+    return None if any(part is None for part in parts) else "".join(str(part) for part in parts)
+
+
+class Row(dict):
+    """Result row with key and attribute access, like bigquery.Row."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class RowIterator:
+    def __init__(self, rows, page_size=None):
+        self._rows = rows
+        self.total_rows = len(rows)
+        self._page_size = page_size or max(len(rows), 1)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    @property
+    def pages(self):
+        for start in range(0, len(self._rows), self._page_size):
+            yield self._rows[start:start + self._page_size]
+
+
+class QueryJob:
+    total_bytes_processed = 0
+    cache_hit = False
+
+    def __init__(self, rows, affected):
+        self._rows = rows
+        self.num_dml_affected_rows = affected
+
+    def result(self, page_size=None, **_):
+        return RowIterator(self._rows, page_size)
+
+
+class LocalBigQueryClient:
+    """Duck-typed bigquery.Client over a SQLite file."""
+
+    project = "local"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._write_lock:
+            conn = self._connect()
+            with conn:
+                for table, fields in TABLES.items():
+                    columns = ", ".join(f'"{name}" {SQLITE_TYPES.get(kind, kind)}' for name, kind in fields)
+                    conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({columns})')
+                    for i, index_columns in enumerate(INDEXES.get(table, [])):
+                        conn.execute(
+                            f'CREATE INDEX IF NOT EXISTS "{table}_idx{i}" ON "{table}" '
+                            f'({", ".join(index_columns)})'
+                        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.create_function("CONCAT", -1, _concat, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def query(self, query, job_config=None):
+        params = {}
+        for param in getattr(job_config, "query_parameters", None) or []:
+            if hasattr(param, "values"):
+                params[param.name] = json.dumps(
+                    [to_sqlite_value(v, param.array_type) for v in param.values], default=str
+                )
+            else:
+                params[param.name] = to_sqlite_value(param.value, param.type_)
+
+        conn = self._connect()
+        sql = translate(query)
+        if sql.lstrip().upper().startswith("BEGIN"):
+            return self._run_script(conn, sql, params)
+        if sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            cursor = conn.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            return QueryJob([Row(zip(names, values)) for values in cursor.fetchall()], None)
+        with self._write_lock, conn:
+            cursor = conn.execute(sql, params)
+        return QueryJob([], cursor.rowcount)
+
+    def _run_script(self, conn, sql, params):
+        """A BEGIN TRANSACTION ... COMMIT TRANSACTION script, as one SQLite transaction."""
+        statements = [statement.strip() for statement in sql.split(";") if statement.strip()]
+        temp_tables = []
+        affected = 0
+        with self._write_lock, conn:
+            for statement in statements:
+                if statement.upper() in ("BEGIN TRANSACTION", "COMMIT TRANSACTION"):
+                    continue
+                match = re.match(r"CREATE TEMP TABLE (\w+)", statement, re.IGNORECASE)
+                if match:
+                    temp_tables.append(match.group(1))
+                affected += max(conn.execute(statement, params).rowcount, 0)
+            for table in temp_tables:
+                conn.execute(f"DROP TABLE temp.{table}")
+        return QueryJob([], affected)
+
+    def insert_rows_json(self, table, json_rows):
+        """Streaming-insert stand-in; returns BigQuery-style per-row errors."""
+        table = str(table)
+        fields = dict(TABLES[table])
+        errors, values = [], []
+        for index, row in enumerate(json_rows):
+            unknown = [key for key in row if key not in fields]
+            if unknown:
+                errors.append({"index": index, "errors": [
+                    {"reason": "invalid", "message": f"no such field: {', '.join(unknown)}"}
+                ]})
+                continue
+            values.append([to_sqlite_value(row.get(name), kind) for name, kind in fields.items()])
+
+        placeholders = ", ".join("?" for _ in fields)
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.executemany(f'INSERT INTO "{table}" VALUES ({placeholders})', values)
+        return errors
+
+
+TOPIC_WORDS = [
+    "election", "vote", "senate", "congress", "debate", "border", "economy", "inflation",
+    "healthcare", "climate", "taxes", "immigration", "campaign", "poll", "ballot", "court",
+]
+FILLER_WORDS = ["the", "this", "about", "today", "again", "really", "people", "news", "why", "now"]
+LABELS = ["neutral", "neutral", "neutral", "harassment"]
+LANGS = ["en"] * 8 + ["es", "fr"]
+
+
+def seed(client, tweets=10000, users=1000, predicted=0.8, days=30, rng=None):
+    """Fill tweets, users, predictions and the cascade table with synthetic data."""
+    rng = rng or random.Random(0)
+    now = datetime.now(timezone.utc)
+    user_rows = [
+        (f"u{i}", f"user{i}", f"User {i}", f"https://example.com/avatars/{i}.png") for i in range(users)
+    ]
+    tweet_rows, prediction_rows = [], []
+    for i in range(tweets):
+        tweet_id = str(10**17 + i)
+        created_at = format_timestamp(now - timedelta(seconds=rng.uniform(0, days * 86400)))
+        words = rng.sample(TOPIC_WORDS, 2) + rng.choices(FILLER_WORDS, k=rng.randint(6, 24))
+        rng.shuffle(words)
+        text = " ".join(words)
+        sensitive = int(rng.random() < 0.1)
+        tweet_rows.append((tweet_id, text, f"u{rng.randrange(users)}", sensitive, created_at, rng.choice(LANGS)))
+        if rng.random() < predicted:
+            labels = [rng.choice(LABELS) for _ in range(3)]
+            scores = [round(rng.random(), 3) for _ in range(3)]
+            prediction_rows.append((
+                tweet_id, text, labels[0], scores[0], "ToxicityTextClassifier0",
+                labels[0], scores[0], labels[1], scores[1], labels[2], scores[2],
+                sensitive, created_at,
+            ))
+
+    conn = client._connect()
+    with client._write_lock, conn:
+        conn.executemany(f'INSERT INTO "{USERS_TABLE}" VALUES (?, ?, ?, ?)', user_rows)
+        conn.executemany(f'INSERT INTO "{TWEETS_TABLE}" VALUES (?, ?, ?, ?, ?, ?)', tweet_rows)
+        conn.executemany(
+            f'INSERT INTO "{PREDICTIONS_TABLE}" VALUES ({", ".join("?" * 13)})', prediction_rows
+        )
+        conn.execute(f"""
+            INSERT INTO "{CASCADE_TABLE}"
+            SELECT t.id, t.text, t.author_id, t.possibly_sensitive, t.created_at, t.lang,
+                   u.username, u.name, u.profile_image_url,
+                   p.prediction_llm0, p.score_llm0, p.prediction_llm3, p.score_llm3,
+                   p.prediction_llm4, p.score_llm4, p.created_at
+            FROM "{TWEETS_TABLE}" AS t
+            LEFT JOIN "{USERS_TABLE}" AS u ON t.author_id = u.id
+            LEFT JOIN "{PREDICTIONS_TABLE}" AS p ON t.id = p.tweet_id
+        """)
+        # Hourly agreement counters, as `model_stats.py --backfill` would build them
+        pair_sums = ", ".join(f"SUM(prediction_{a} = prediction_{b})" for a, b in PAIRS)
+        conn.execute(f"""
+            INSERT INTO "{STATS_TABLE}"
+            SELECT strftime('%Y-%m-%d %H:00:00.000000', created_at), ?, COUNT(*),
+                   SUM(prediction_llm0 = prediction_llm3 AND prediction_llm3 = prediction_llm4),
+                   {pair_sums}
+            FROM "{PREDICTIONS_TABLE}"
+            GROUP BY 1
+        """, (format_timestamp(now),))
+    return len(tweet_rows), len(prediction_rows)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Create and seed a local BigQuery stand-in.")
+    parser.add_argument("--path", default="local_bigquery.db")
+    parser.add_argument("--tweets", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    client = LocalBigQueryClient(args.path)
+    tweets, predictions = seed(client, tweets=args.tweets, users=args.users)
+    print(f"✅ Seeded {args.path}: {tweets} tweets, {predictions} predictions")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,184 @@
+"""
+In-process latency and BigQuery job metrics for the Emakia backend.
+
+- Route histograms: every request's latency, keyed by "METHOD /rule"
+- Operation histograms: named spans inside a route (duplicate check, flush wait)
+- BigQuery calls: duration histogram, jobs, errors, bytes processed and cache hits
+  per named query/insert
+
+BigQuery calls also keep the last-known connectivity state, which /api/health
+reports instead of running a probe query on every request.
+Exposed as JSON at /api/metrics.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from flask import g, request
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is unbounded
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; quantiles are reported as bucket upper bounds."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": {
+                f"le_{bound}": count for bound, count in zip(BUCKETS_MS + ("inf",), self.counts)
+            },
+        }
+
+
+class BigQueryCallStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.bytes_processed = 0
+        self.cache_hits = 0
+
+    def snapshot(self):
+        return {
+            "latency": self.latency.snapshot(),
+            "errors": self.errors,
+            "bytes_processed": self.bytes_processed,
+            "cache_hits": self.cache_hits,
+        }
+
+
+class Metrics:
+    """Thread-safe registry of route, operation and BigQuery call metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}      # "METHOD /rule" -> {"latency": Histogram, "status": {code: n}}
+        self._operations = {}  # name -> Histogram
+        self._bigquery = {}    # name -> BigQueryCallStats
+        self._bigquery_state = {"status": "unknown", "checked_at": None, "error": None}
+        self.started_at = datetime.now(timezone.utc)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.get("metrics_started")
+        if started is not None:
+            rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+            self.observe_route(f"{request.method} {rule}", response.status_code,
+                               (time.perf_counter() - started) * 1000)
+        return response
+
+    def observe_route(self, route, status, ms):
+        with self._lock:
+            entry = self._routes.setdefault(route, {"latency": Histogram(), "status": {}})
+            entry["latency"].observe(ms)
+            entry["status"][status] = entry["status"].get(status, 0) + 1
+
+    @contextmanager
+    def timed(self, name):
+        """Record the duration of a named span inside a request."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._operations.setdefault(name, Histogram()).observe(ms)
+
+    @contextmanager
+    def bigquery_call(self, name):
+        """
+        Time a BigQuery call and update the connectivity state. The body may set
+        "job" on the yielded dict to record bytes processed and cache hits.
+        """
+        call = {"job": None}
+        started = time.perf_counter()
+        try:
+            yield call
+        except Exception as e:
+            self._record_bigquery(name, started, None, e)
+            raise
+        self._record_bigquery(name, started, call["job"], None)
+
+    def _record_bigquery(self, name, started, job, error):
+        ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self._bigquery.setdefault(name, BigQueryCallStats())
+            stats.latency.observe(ms)
+            if error is not None:
+                stats.errors += 1
+            if job is not None:
+                stats.bytes_processed += getattr(job, "total_bytes_processed", None) or 0
+                stats.cache_hits += 1 if getattr(job, "cache_hit", False) else 0
+            self._bigquery_state = {
+                "status": "error" if error is not None else "connected",
+                "checked_at": datetime.now(timezone.utc),
+                "error": str(error) if error is not None else None,
+            }
+
+    def run_query(self, client, name, query, job_config=None, **result_kwargs):
+        """client.query(...).result(...), recorded under `name`."""
+        with self.bigquery_call(name) as call:
+            job = client.query(query, job_config=job_config)
+            rows = job.result(**result_kwargs)
+            call["job"] = job
+        return rows
+
+    def bigquery_state(self):
+        """Outcome of the most recent BigQuery call: status, checked_at, error."""
+        with self._lock:
+            return dict(self._bigquery_state)
+
+    def snapshot(self):
+        with self._lock:
+            checked_at = self._bigquery_state["checked_at"]
+            return {
+                "started_at": self.started_at.isoformat(),
+                "routes": {
+                    route: {"latency": entry["latency"].snapshot(), "status": dict(entry["status"])}
+                    for route, entry in sorted(self._routes.items())
+                },
+                "operations": {name: hist.snapshot() for name, hist in sorted(self._operations.items())},
+                "bigquery": {name: stats.snapshot() for name, stats in sorted(self._bigquery.items())},
+                "bigquery_state": {
+                    **self._bigquery_state,
+                    "checked_at": checked_at.isoformat() if checked_at else None,
+                },
+            }
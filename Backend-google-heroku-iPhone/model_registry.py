@@ -0,0 +1,152 @@
+"""
+Registry of on-device prediction models and long-format prediction storage.
+
+Ingest rows carry `prediction_<model_id>` / `score_<model_id>` for every model
+in the payload. Depending on PREDICTION_STORAGE they are written as:
+- wide: one CoreMLpredictions row, with columns only for models that have them
+- long: one (tweet_id, model_id, label, score) row per model in CoreMLpredictions_long
+- both: wide and long
+
+Extra models are registered without code changes:
+    EXTRA_PREDICTION_MODELS="llm5=ToxicityTextClassifier5,llm6=ToxicityTextClassifier6"
+
+Usage:
+    python model_registry.py --create-long-table
+"""
+
+import argparse
+import os
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LONG_TABLE = os.environ.get("PREDICTIONS_LONG_TABLE", "emakia.politics2024.CoreMLpredictions_long")
+PREDICTION_STORAGE = os.environ.get("PREDICTION_STORAGE", "wide").lower()
+if PREDICTION_STORAGE not in ("wide", "long", "both"):
+    raise ValueError(f"PREDICTION_STORAGE must be 'wide', 'long' or 'both', got {PREDICTION_STORAGE!r}")
+
+# Models with prediction_<id>/score_<id> columns in CoreMLpredictions, in primary-prediction order
+WIDE_MODELS = [
+    ("llm0", "ToxicityTextClassifier0"),
+    ("llm3", "ToxicityTextClassifier3"),
+    ("llm4", "ToxicityTextClassifier4"),
+]
+
+
+def load_registry():
+    """model_id -> {"model_version", "wide"}; wide models first, then EXTRA_PREDICTION_MODELS."""
+    registry = OrderedDict(
+        (model_id, {"model_version": version, "wide": True}) for model_id, version in WIDE_MODELS
+    )
+    for entry in os.environ.get("EXTRA_PREDICTION_MODELS", "").split(","):
+        if not entry.strip():
+            continue
+        model_id, _, version = entry.strip().partition("=")
+        registry.setdefault(model_id, {"model_version": version or model_id, "wide": False})
+    return registry
+
+
+MODEL_REGISTRY = load_registry()
+
+
+def ordered_model_ids(model_ids):
+    """Registered models in registry order, then unregistered ones alphabetically."""
+    model_ids = set(model_ids)
+    registered = [m for m in MODEL_REGISTRY if m in model_ids]
+    return registered + sorted(model_ids - set(registered))
+
+
+def model_version(model_id):
+    entry = MODEL_REGISTRY.get(model_id)
+    return entry["model_version"] if entry else model_id
+
+
+def row_model_ids(row):
+    return [key[len("prediction_"):] for key in row if key.startswith("prediction_")]
+
+
+def to_wide_row(row):
+    """Drop per-model columns that CoreMLpredictions does not have."""
+    return {
+        key: value for key, value in row.items()
+        if not key.startswith(("prediction_", "score_"))
+        or MODEL_REGISTRY.get(key.split("_", 1)[1], {}).get("wide")
+    }
+
+
+def to_long_rows(row):
+    """One (tweet_id, model_id, label, score) row per model prediction in `row`."""
+    return [
+        {
+            "tweet_id": row["tweet_id"],
+            "model_id": model_id,
+            "model_version": model_version(model_id),
+            "label": row[f"prediction_{model_id}"],
+            "score": row.get(f"score_{model_id}"),
+            "created_at": row["created_at"],
+        }
+        for model_id in ordered_model_ids(row_model_ids(row))
+    ]
+
+
+def pivot_predictions(long_rows, model_ids=None):
+    """
+    Pivot long rows into {tweet_id: {model_id: {"prediction", "score"}}}.
+    The latest row per (tweet_id, model_id) wins.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(long_rows, columns=["tweet_id", "model_id", "label", "score", "created_at"])
+    if model_ids:
+        df = df[df["model_id"].isin(model_ids)]
+    if df.empty:
+        return {}
+    df = df.sort_values("created_at").drop_duplicates(["tweet_id", "model_id"], keep="last")
+    wide = df.pivot(index="tweet_id", columns="model_id", values=["label", "score"])
+
+    result = {}
+    for tweet_id, labels, scores in zip(wide.index, wide["label"].to_dict("records"), wide["score"].to_dict("records")):
+        result[tweet_id] = {
+            model_id: {"prediction": label, "score": None if pd.isna(scores[model_id]) else float(scores[model_id])}
+            for model_id, label in labels.items()
+            if isinstance(label, str)
+        }
+    return result
+
+
+def create_long_table(client):
+    """Create the long-format predictions table if it does not exist."""
+    query = f"""
+        CREATE TABLE IF NOT EXISTS `{LONG_TABLE}` (
+            tweet_id STRING NOT NULL,
+            model_id STRING NOT NULL,
+            model_version STRING,
+            label STRING,
+            score FLOAT64,
+            created_at TIMESTAMP
+        )
+        PARTITION BY DATE(created_at)
+        CLUSTER BY tweet_id, model_id
+    """
+    client.query(query).result()
+    print(f"✅ Long-format predictions table ready: {LONG_TABLE}")
+
+
+def main() -> int:
+    from bq_client import get_client
+
+    parser = argparse.ArgumentParser(description="Inspect the model registry / create storage tables.")
+    parser.add_argument("--create-long-table", action="store_true")
+    args = parser.parse_args()
+
+    for model_id, entry in MODEL_REGISTRY.items():
+        print(f"   {model_id}: {entry['model_version']} ({'wide + long' if entry['wide'] else 'long only'})")
+    if args.create_long_table:
+        create_long_table(get_client(required=True))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
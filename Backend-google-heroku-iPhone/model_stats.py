@@ -0,0 +1,272 @@
+"""
+Incremental model-agreement statistics for /api/model-comparison.
+
+Agreement counters for llm0/llm3/llm4 are updated as predictions are stored
+and kept per hour bucket. Counters are persisted as delta rows in
+`emakia.politics2024.model_agreement_stats` (created on first sync if missing);
+each process periodically flushes its deltas and reloads the aggregated table,
+so the endpoint answers from memory no matter how large CoreMLpredictions grows.
+Deltas older than COMPACT_AFTER are periodically folded into one row per hour,
+so the table (and each reload) grows with the number of hours, not of flushes.
+
+Usage:
+    python model_stats.py --backfill   # rebuild the stats table from CoreMLpredictions
+    python model_stats.py --compact    # fold old deltas into hourly rows now
+"""
+
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PREDICTIONS_TABLE = "emakia.politics2024.CoreMLpredictions"
+STATS_TABLE = os.environ.get("MODEL_STATS_TABLE", "emakia.politics2024.model_agreement_stats")
+AGREEMENT_MODELS = ("llm0", "llm3", "llm4")
+PAIRS = [
+    (a, b) for i, a in enumerate(AGREEMENT_MODELS) for b in AGREEMENT_MODELS[i + 1:]
+]
+COUNTERS = ["total", "all_agree"] + [f"{a}_{b}_agree" for a, b in PAIRS]
+# Deltas are compacted once they are older than any row still in the streaming
+# buffer (up to 90 minutes), which DML cannot delete
+COMPACT_AFTER = timedelta(hours=3)
+
+
+def hour_bucket(value):
+    """UTC hour containing `value` (datetime or ISO string)."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def empty_counters():
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def add_counters(target, delta):
+    for key in COUNTERS:
+        target[key] += delta.get(key, 0)
+
+
+class AgreementStats:
+    """Hour-bucketed agreement counters with BigQuery persistence."""
+
+    def __init__(self, sync_seconds=60, compact_seconds=3600):
+        self.sync_seconds = sync_seconds
+        self.compact_seconds = compact_seconds
+        self._persisted = {}  # bucket -> counters, as of the last load
+        self._pending = {}    # bucket -> counters recorded locally, not yet flushed
+        self._lock = threading.Lock()
+        self._ready = False
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def record(self, rows):
+        """Count stored prediction rows that carry all three model predictions."""
+        with self._lock:
+            for row in rows:
+                labels = [row.get(f"prediction_{model}") for model in AGREEMENT_MODELS]
+                if any(label is None for label in labels):
+                    continue
+                counters = self._pending.setdefault(hour_bucket(row["created_at"]), empty_counters())
+                counters["total"] += 1
+                if len(set(labels)) == 1:
+                    counters["all_agree"] += 1
+                for a, b in PAIRS:
+                    if row[f"prediction_{a}"] == row[f"prediction_{b}"]:
+                        counters[f"{a}_{b}_agree"] += 1
+
+    def _merged(self):
+        merged = {}
+        for source in (self._persisted, self._pending):
+            for bucket, counters in source.items():
+                add_counters(merged.setdefault(bucket, empty_counters()), counters)
+        return merged
+
+    def totals(self):
+        totals = empty_counters()
+        with self._lock:
+            for counters in self._merged().values():
+                add_counters(totals, counters)
+        return totals
+
+    def windows(self, window="hour", count=24, now=None):
+        """Counters for the last `count` hour or day windows, newest first."""
+        step = timedelta(hours=1) if window == "hour" else timedelta(days=1)
+        end = hour_bucket(now or datetime.now(timezone.utc))
+        if window == "day":
+            end = end.replace(hour=0)
+        starts = [end - i * step for i in range(count)]
+        result = {start: empty_counters() for start in starts}
+        with self._lock:
+            for bucket, counters in self._merged().items():
+                start = bucket.replace(hour=0) if window == "day" else bucket
+                if start in result:
+                    add_counters(result[start], counters)
+        return [(start, result[start]) for start in starts]
+
+    def load(self, client):
+        """Replace persisted counters with the aggregated stats table."""
+        sums = ", ".join(f"SUM({key}) AS {key}" for key in COUNTERS)
+        query = f"SELECT bucket_start, {sums} FROM `{STATS_TABLE}` GROUP BY bucket_start"
+        persisted = {
+            hour_bucket(row.bucket_start): {key: row[key] or 0 for key in COUNTERS}
+            for row in client.query(query).result()
+        }
+        with self._lock:
+            self._persisted = persisted
+            self._ready = True
+
+    def flush(self, client):
+        """Append pending deltas to the stats table."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        buckets = list(pending.items())
+        recorded_at = datetime.now(timezone.utc).isoformat()
+        rows = [
+            {"bucket_start": bucket.isoformat(), "recorded_at": recorded_at, **counters}
+            for bucket, counters in buckets
+        ]
+        try:
+            errors = client.insert_rows_json(STATS_TABLE, rows)
+        except Exception as e:
+            errors = [{"index": i, "errors": str(e)} for i in range(len(rows))]
+        failed = {error.get("index") for error in errors}
+        with self._lock:
+            for i, (bucket, counters) in enumerate(buckets):
+                # Failed deltas go back to pending and are retried on the next flush
+                target = self._pending if i in failed else self._persisted
+                add_counters(target.setdefault(bucket, empty_counters()), counters)
+        if errors:
+            print(f"⚠️ Failed to persist {len(failed)} model stats rows: {errors}")
+        return len(rows) - len(failed)
+
+    def sync(self, client):
+        self.flush(client)
+        self.load(client)
+
+    def start_sync(self, client):
+        """
+        Create the table if needed, load now and keep flushing/reloading from a
+        daemon thread, compacting every `compact_seconds` (0 disables).
+        """
+        def run():
+            table_ready = False
+            compacted_at = time.monotonic()
+            while True:
+                try:
+                    if not table_ready:
+                        ensure_table(client)
+                        table_ready = True
+                    self.sync(client)
+                except Exception as e:
+                    print(f"⚠️ Model stats sync failed: {e}")
+                if table_ready and self.compact_seconds and time.monotonic() - compacted_at >= self.compact_seconds:
+                    compacted_at = time.monotonic()
+                    try:
+                        compact(client)
+                    except Exception as e:
+                        # Another process may be compacting concurrently; retried next interval
+                        print(f"⚠️ Model stats compaction failed: {e}")
+                time.sleep(self.sync_seconds)
+
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=run, name="model-stats-sync", daemon=True)
+            self._thread.start()
+
+
+def ensure_table(client):
+    """Create the stats table if it does not exist yet."""
+    counters = ", ".join(f"{key} INT64" for key in COUNTERS)
+    client.query(
+        f"CREATE TABLE IF NOT EXISTS `{STATS_TABLE}` "
+        f"(bucket_start TIMESTAMP, recorded_at TIMESTAMP, {counters})"
+    ).result()
+
+
+def compact(client, now=None):
+    """
+    Fold delta rows recorded more than COMPACT_AFTER ago into one row per hour
+    bucket, in a single transaction so readers never see a partial state.
+    Totals are unchanged. Returns the cutoff used.
+    """
+    from google.cloud import bigquery
+
+    cutoff = (now or datetime.now(timezone.utc)) - COMPACT_AFTER
+    columns = ", ".join(["bucket_start", "recorded_at", *COUNTERS])
+    sums = ", ".join(f"SUM({key}) AS {key}" for key in COUNTERS)
+    script = f"""
+        BEGIN TRANSACTION;
+        CREATE TEMP TABLE compacted_stats AS
+            SELECT bucket_start, @cutoff AS recorded_at, {sums}
+            FROM `{STATS_TABLE}`
+            WHERE recorded_at < @cutoff
+            GROUP BY bucket_start;
+        DELETE FROM `{STATS_TABLE}` WHERE recorded_at < @cutoff;
+        INSERT INTO `{STATS_TABLE}` ({columns}) SELECT {columns} FROM compacted_stats;
+        COMMIT TRANSACTION;
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("cutoff", "TIMESTAMP", cutoff),
+    ])
+    client.query(script, job_config=job_config).result()
+    return cutoff
+
+
+def backfill(client):
+    """Rebuild the stats table with hourly aggregates over all of CoreMLpredictions."""
+    all_agree = " AND ".join(f"prediction_{a} = prediction_{b}" for a, b in PAIRS)
+    pair_sums = ",\n            ".join(
+        f"SUM(CASE WHEN prediction_{a} = prediction_{b} THEN 1 ELSE 0 END) AS {a}_{b}_agree"
+        for a, b in PAIRS
+    )
+    not_null = " AND ".join(f"prediction_{model} IS NOT NULL" for model in AGREEMENT_MODELS)
+    query = f"""
+        CREATE OR REPLACE TABLE `{STATS_TABLE}` AS
+        SELECT
+            TIMESTAMP_TRUNC(created_at, HOUR) AS bucket_start,
+            CURRENT_TIMESTAMP() AS recorded_at,
+            COUNT(*) AS total,
+            SUM(CASE WHEN {all_agree} THEN 1 ELSE 0 END) AS all_agree,
+            {pair_sums}
+        FROM `{PREDICTIONS_TABLE}`
+        WHERE {not_null}
+        GROUP BY bucket_start
+    """
+    client.query(query).result()
+    print(f"✅ Backfilled {STATS_TABLE} from {PREDICTIONS_TABLE}")
+
+
+def main() -> int:
+    from bq_client import get_client
+
+    parser = argparse.ArgumentParser(description="Maintain the model agreement stats table.")
+    parser.add_argument("--backfill", action="store_true", help="Rebuild stats from CoreMLpredictions")
+    parser.add_argument("--compact", action="store_true", help="Fold old delta rows into hourly rows")
+    args = parser.parse_args()
+
+    client = get_client(required=True)
+    if args.backfill:
+        backfill(client)
+    if args.compact:
+        cutoff = compact(client)
+        print(f"✅ Compacted {STATS_TABLE} deltas recorded before {cutoff.isoformat()}")
+    stats = AgreementStats()
+    stats.load(client)
+    print(f"📊 Totals: {stats.totals()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
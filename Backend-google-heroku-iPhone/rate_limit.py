@@ -0,0 +1,41 @@
+"""
+Per-client token-bucket rate limiting for the ingest routes.
+
+Each client (X-Client-Id header, else the caller's IP) gets a bucket of
+`burst` tokens refilled at `rate` tokens per second; a prediction costs one
+token, a batch one per item (capped at `burst`, so a full batch drains the
+bucket rather than never fitting). Idle clients are forgotten after `idle_seconds`.
+"""
+
+import math
+import threading
+import time
+
+from cachetools import TTLCache
+
+
+class RateLimiter:
+    def __init__(self, rate, burst, max_clients=10_000, idle_seconds=600):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = TTLCache(maxsize=max_clients, ttl=idle_seconds)  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def acquire(self, key, cost=1):
+        """Take `cost` tokens. Returns (allowed, seconds until they would be available)."""
+        if not self.enabled:
+            return True, 0
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return True, 0
+            self._buckets[key] = (tokens, now)
+        return False, math.ceil((cost - tokens) / self.rate)
@@ -0,0 +1,152 @@
+"""
+Structured, sampled request logging.
+
+Every request produces at most one JSON access record (route, status,
+latency, request/response sizes plus any fields the handler attached with
+``annotate``). Records are handed to a QueueHandler and written by a
+background QueueListener, so request threads never block on stdout.
+
+Sampling is per route (LOG_SAMPLE_RATES="/api/prediction=0.05,default=1").
+Errors (status >= 400) and slow requests (>= LOG_SLOW_MS) are always logged;
+``log_info``/``log_debug`` detail lines are emitted only for sampled requests.
+Field values may be zero-argument callables (e.g. ``raw=lambda: request.get_data()``);
+they are only evaluated when the line or record is actually written.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger("emakia.api")
+
+DEFAULT_SAMPLE_RATES = "/api/prediction=0.05,/api/predictions/batch=0.2,/api/test-prediction=1,default=1"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg and structured fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def parse_sample_rates(spec):
+    """"route=rate,..." -> {route: rate}; the "default" key applies to other routes."""
+    rates = {}
+    for item in spec.split(","):
+        route, _, rate = item.strip().partition("=")
+        if route and rate:
+            rates[route] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+def sampled():
+    """Whether the current request was selected for detailed logging."""
+    return has_request_context() and g.get("log_sampled", False)
+
+
+def resolve(fields):
+    """Evaluate lazy (callable) field values."""
+    return {key: value() if callable(value) else value for key, value in fields.items()}
+
+
+def annotate(**fields):
+    """Attach fields to the current request's access record."""
+    if has_request_context():
+        g.setdefault("log_fields", {}).update(fields)
+
+
+def log_info(msg, **fields):
+    """Info line, emitted for sampled requests (and always outside a request)."""
+    if (sampled() or not has_request_context()) and logger.isEnabledFor(logging.INFO):
+        logger.info(msg, extra={"fields": resolve(fields)})
+
+
+def log_debug(msg, **fields):
+    """Detail line, emitted only for sampled requests at DEBUG level."""
+    if sampled() and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(msg, extra={"fields": resolve(fields)})
+
+
+def log_error(msg, exc_info=False, **fields):
+    """Always emitted; also marks the request's access record with the error."""
+    annotate(error=msg)
+    logger.error(msg, exc_info=exc_info, extra={"fields": resolve(fields)})
+
+
+class RequestLogger:
+    """Wire queued JSON logging and per-route sampled access records into a Flask app."""
+
+    def __init__(self, app=None, sample_rates=None, slow_ms=None, level=None):
+        spec = sample_rates or os.environ.get("LOG_SAMPLE_RATES", DEFAULT_SAMPLE_RATES)
+        self.sample_rates = parse_sample_rates(spec)
+        self.default_rate = self.sample_rates.pop("default", 1.0)
+        self.slow_ms = float(slow_ms or os.environ.get("LOG_SLOW_MS", 1000))
+        self.level = level or os.environ.get("LOG_LEVEL", "INFO").upper()
+        self.listener = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        log_queue = queue.SimpleQueue()
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter())
+        self.listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        self.listener.start()
+        atexit.register(self.stop)
+
+        logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+        logger.setLevel(self.level)
+        logger.propagate = False
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def stop(self):
+        """Write out queued records and stop the listener thread (idempotent)."""
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def rate_for(self, route):
+        return self.sample_rates.get(route, self.default_rate)
+
+    def _before_request(self):
+        g.log_started = time.perf_counter()
+        g.log_fields = {}
+        route = request.url_rule.rule if request.url_rule else request.path
+        g.log_sampled = random.random() < self.rate_for(route)
+
+    def _after_request(self, response):
+        latency_ms = (time.perf_counter() - g.get("log_started", time.perf_counter())) * 1000
+        if g.get("log_sampled") or response.status_code >= 400 or latency_ms >= self.slow_ms:
+            fields = {
+                "route": request.url_rule.rule if request.url_rule else request.path,
+                "method": request.method,
+                "status": response.status_code,
+                "latency_ms": round(latency_ms, 2),
+                "request_bytes": request.content_length or 0,
+                # Sizing a streamed body would drain its generator into memory
+                "response_bytes": response.content_length if response.is_streamed
+                else response.calculate_content_length(),
+                "sampled": g.get("log_sampled", False),
+                **resolve(g.get("log_fields", {})),
+            }
+            logger.info("request", extra={"fields": fields})
+        return response
@@ -0,0 +1,29 @@
+import asyncio
+import time
+
+from asgi import AsgiBridge
+
+
+def test_lifespan_shutdown_drains_the_pool_without_blocking_the_loop():
+    async def scenario():
+        bridge = AsgiBridge(lambda environ, start_response: [], max_concurrency=2)
+        bridge.executor.submit(time.sleep, 0.3)  # a route still running at shutdown
+        messages = asyncio.Queue()
+        sent = []
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await messages.put({"type": "lifespan.startup"})
+        await messages.put({"type": "lifespan.shutdown"})
+        lifespan = asyncio.create_task(bridge({"type": "lifespan"}, messages.get, send))
+
+        ticks = 0
+        while not lifespan.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return sent, ticks
+
+    sent, ticks = asyncio.run(scenario())
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert ticks >= 10
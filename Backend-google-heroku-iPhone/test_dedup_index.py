@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+from dedup_index import BloomFilter, TweetIdDedupIndex
+
+T0 = datetime(2024, 11, 5, 12, 0)
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(10_000, error_rate=0.01)
+    for i in range(10_000):
+        bloom.add(f"stored-{i}")
+
+    assert all(f"stored-{i}" in bloom for i in range(10_000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(10_000))
+    assert false_positives < 300
+
+
+class FakeTable:
+    """Rows of (tweet_id, created_at); records scans and lookups."""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.scans = []
+        self.lookups = []
+
+    def scan(self, since):
+        self.scans.append(since)
+        return [(tweet_id, created_at) for tweet_id, created_at in self.rows if since is None or created_at > since]
+
+    def lookup(self, ids):
+        self.lookups.append(list(ids))
+        stored = {tweet_id for tweet_id, _ in self.rows}
+        return [tweet_id for tweet_id in ids if tweet_id in stored]
+
+
+def index_for(table, **kwargs):
+    return TweetIdDedupIndex(table.lookup, table.scan, bloom_capacity=1000, **kwargs)
+
+
+def test_classify_is_all_ambiguous_before_warmup():
+    index = index_for(FakeTable([("1", T0)]))
+    index.add(["recent"])
+    assert index.classify(["recent", "1", "2"]) == ({"recent"}, set(), {"1", "2"})
+
+
+def test_classify_after_warmup_splits_known_new_and_ambiguous():
+    table = FakeTable([("1", T0), ("2", T0)])
+    index = index_for(table)
+    index.refresh()
+    index.add(["recent"])
+
+    known, new, ambiguous = index.classify(["recent", "1", "fresh"])
+    assert (known, new, ambiguous) == ({"recent"}, {"fresh"}, {"1"})
+
+    assert index.find_existing(["recent", "1", "fresh"]) == {"recent", "1"}
+    assert table.lookups == [["1"]]
+
+
+def test_discarded_ids_fall_back_to_a_lookup():
+    table = FakeTable([])
+    index = index_for(table)
+    index.refresh()
+    index.add(["failed"])
+    index.discard(["failed"])
+
+    assert index.classify(["failed"]) == (set(), set(), {"failed"})
+    assert index.find_existing(["failed"]) == set()
+
+
+def test_refresh_rescans_the_lookback_window_for_late_rows():
+    table = FakeTable([("1", T0), ("2", T0 + timedelta(minutes=10))])
+    index = index_for(table, lookback_seconds=1800)
+    index.refresh()
+
+    # Stamped before the watermark but only visible after the last refresh
+    table.rows.append(("late", T0 + timedelta(minutes=5)))
+    index.refresh()
+
+    assert table.scans == [None, T0 + timedelta(minutes=10) - timedelta(seconds=1800)]
+    assert index.classify(["late"]) == (set(), set(), {"late"})
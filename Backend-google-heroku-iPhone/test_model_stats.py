@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+from local_bigquery import LocalBigQueryClient
+from model_stats import STATS_TABLE, AgreementStats, compact, ensure_table
+
+T0 = datetime(2024, 11, 5, 12, 30, tzinfo=timezone.utc)
+
+
+def prediction(created_at, llm0="neutral", llm3="neutral", llm4="neutral"):
+    return {"created_at": created_at, "prediction_llm0": llm0, "prediction_llm3": llm3, "prediction_llm4": llm4}
+
+
+def stats_rows(client):
+    return client.query(f"SELECT * FROM `{STATS_TABLE}`").result()
+
+
+def test_record_counts_agreement_per_hour():
+    stats = AgreementStats()
+    stats.record([
+        prediction(T0),
+        prediction(T0 + timedelta(minutes=10), llm4="harassment"),
+        prediction(T0 + timedelta(hours=1), llm0="harassment", llm3="harassment"),
+        {"created_at": T0, "prediction_llm0": "neutral"},  # not scored by every model
+    ])
+
+    totals = stats.totals()
+    assert (totals["total"], totals["all_agree"], totals["llm0_llm3_agree"], totals["llm3_llm4_agree"]) == (3, 1, 3, 1)
+    [(_, latest), (_, earlier)] = stats.windows("hour", 2, now=T0 + timedelta(hours=1))
+    assert (latest["total"], earlier["total"]) == (1, 2)
+
+
+def test_ensure_table_creates_a_missing_table(tmp_path):
+    client = LocalBigQueryClient(str(tmp_path / "stats.db"))
+    client.query(f"DROP TABLE `{STATS_TABLE}`").result()
+
+    ensure_table(client)
+    ensure_table(client)
+    assert list(stats_rows(client)) == []
+
+
+def test_compact_folds_old_deltas_into_hourly_rows(tmp_path):
+    client = LocalBigQueryClient(str(tmp_path / "stats.db"))
+    stats = AgreementStats()
+    for _ in range(3):
+        stats.record([prediction(T0), prediction(T0 + timedelta(hours=1), llm4="harassment")])
+        stats.flush(client)
+    assert len(list(stats_rows(client))) == 6
+
+    compact(client, now=datetime.now(timezone.utc) + timedelta(days=1))
+
+    assert len(list(stats_rows(client))) == 2
+    reloaded = AgreementStats()
+    reloaded.load(client)
+    assert reloaded.totals() == stats.totals()
+    assert reloaded.totals()["total"] == 6
+
+
+def test_compact_keeps_recent_deltas(tmp_path):
+    client = LocalBigQueryClient(str(tmp_path / "stats.db"))
+    stats = AgreementStats()
+    for _ in range(2):
+        stats.record([prediction(T0)])
+        stats.flush(client)
+
+    compact(client)
+
+    assert len(list(stats_rows(client))) == 2
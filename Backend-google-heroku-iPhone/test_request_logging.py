@@ -0,0 +1,59 @@
+import json
+
+from flask import Flask
+
+from request_logging import RequestLogger, annotate, log_debug, log_info
+
+
+def make_app(sample_rates, level="DEBUG"):
+    app = Flask(__name__)
+    evaluated = []
+
+    def lazy(name):
+        def value():
+            evaluated.append(name)
+            return name
+        return value
+
+    @app.route("/ping", methods=["POST"])
+    def ping():
+        log_debug("detail", raw=lazy("debug"))
+        log_info("info", raw=lazy("info"))
+        annotate(raw=lazy("annotate"))
+        return "pong"
+
+    request_logger = RequestLogger(app, sample_rates=sample_rates, level=level)
+    return app, request_logger, evaluated
+
+
+def records(capsys, request_logger):
+    request_logger.stop()
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_unsampled_requests_never_evaluate_lazy_fields(capsys):
+    app, request_logger, evaluated = make_app("default=0")
+    assert app.test_client().post("/ping", data="x" * 100).status_code == 200
+
+    assert evaluated == []
+    assert records(capsys, request_logger) == []
+
+
+def test_sampled_requests_log_lazy_fields(capsys):
+    app, request_logger, evaluated = make_app("default=1")
+    app.test_client().post("/ping", data="x" * 100)
+
+    lines = records(capsys, request_logger)
+    assert sorted(evaluated) == ["annotate", "debug", "info"]
+    assert [(line["msg"], line["raw"]) for line in lines] == [
+        ("detail", "debug"), ("info", "info"), ("request", "annotate"),
+    ]
+    assert lines[-1]["request_bytes"] == 100
+
+
+def test_debug_lines_are_skipped_above_debug_level(capsys):
+    app, request_logger, evaluated = make_app("default=1", level="INFO")
+    app.test_client().post("/ping")
+
+    assert "debug" not in evaluated
+    assert [line["msg"] for line in records(capsys, request_logger)] == ["info", "request"]
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from topic_index import TopicIndex
+
+T0 = datetime(2024, 11, 5, 12, 0, tzinfo=timezone.utc)
+
+
+class FakeTweets:
+    """BigQuery stand-in for the tweets table; honours the `since` parameter."""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.queries = []
+
+    def query(self, query, job_config=None):
+        params = {p.name: p.value for p in job_config.query_parameters}
+        self.queries.append((query, params))
+        since = params.get("since")
+        rows = [
+            SimpleNamespace(id=tweet_id, text=text, created_at=created_at)
+            for tweet_id, text, created_at in self.rows
+            if since is None or created_at > since
+        ]
+        return SimpleNamespace(result=lambda page_size: SimpleNamespace(pages=[rows]))
+
+
+def ids(results):
+    return [tweet_id for tweet_id, _ in results]
+
+
+def test_search_matches_every_word_newest_first(tmp_path):
+    index = TopicIndex(str(tmp_path / "topics.db"))
+    index.refresh(FakeTweets([
+        ("1", "Election day", T0),
+        ("2", "the election results are in", T0 + timedelta(minutes=1)),
+        ("3", "results of the game", T0 + timedelta(minutes=2)),
+    ]))
+
+    assert ids(index.search("election", 10)) == ["2", "1"]
+    assert ids(index.search("election results", 10)) == ["2"]
+    assert ids(index.search("election", 10, cursor=(T0 + timedelta(minutes=1), "2"))) == ["1"]
+
+
+def test_search_defers_to_the_text_filter_when_a_word_is_not_indexed(tmp_path):
+    index = TopicIndex(str(tmp_path / "topics.db"))
+    index.refresh(FakeTweets([("1", "Election day", T0)]))
+
+    assert index.search("elect", 10) is None
+    assert index.search("election electi", 10) is None
+    assert index.search("!", 10) is None
+
+
+def test_refresh_rescans_the_lookback_window_for_late_rows(tmp_path):
+    tweets = FakeTweets([("1", "vote early", T0), ("2", "vote today", T0 + timedelta(minutes=10))])
+    index = TopicIndex(str(tmp_path / "topics.db"), lookback_seconds=1800)
+    index.refresh(tweets)
+
+    # Stamped before the watermark but only visible after the last refresh
+    tweets.rows.append(("late", "vote by mail", T0 + timedelta(minutes=5)))
+    index.refresh(tweets)
+
+    assert tweets.queries[1][1]["since"] == T0 + timedelta(minutes=10) - timedelta(seconds=1800)
+    assert ids(index.search("vote", 10)) == ["2", "late", "1"]
+    assert ids(index.search("mail", 10)) == ["late"]
@@ -0,0 +1,173 @@
+import json
+import threading
+import time
+
+import pytest
+
+from ingest_spool import PredictionSpool, _open
+from write_buffer import BufferFull, PredictionWriteBuffer
+
+
+def rows(*ids):
+    return [{"tweet_id": tweet_id} for tweet_id in ids]
+
+
+def wait_until_taken(buffer, timeout=1):
+    """Wait for the flusher to take everything pending (and block in insert_fn)."""
+    deadline = time.monotonic() + timeout
+    while buffer.pending_count():
+        assert time.monotonic() < deadline, "flusher never picked up the rows"
+        time.sleep(0.001)
+
+
+class RecordingInsert:
+    """insert_fn that records each batch and rejects rows whose tweet_id is in `reject`."""
+
+    def __init__(self, reject=(), fail_times=0):
+        self.batches = []
+        self.reject = set(reject)
+        self.fail_times = fail_times
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, batch):
+        self.release.wait(5)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("backend unavailable")
+        self.batches.append([row["tweet_id"] for row in batch])
+        return [
+            {"index": i, "errors": [{"message": "rejected"}]}
+            for i, row in enumerate(batch) if row["tweet_id"] in self.reject
+        ]
+
+
+def test_lone_row_is_written_without_waiting_for_more():
+    insert = RecordingInsert()
+    buffer = PredictionWriteBuffer(insert)
+    ticket = buffer.submit(rows("1"))
+    assert ticket.wait(1)
+    assert ticket.errors == []
+    assert insert.batches == [["1"]]
+
+
+def test_rows_arriving_during_an_insert_share_the_next_one():
+    insert = RecordingInsert()
+    insert.release.clear()
+    buffer = PredictionWriteBuffer(insert)
+    first = buffer.submit(rows("1"))
+    wait_until_taken(buffer)
+    second, third = buffer.submit(rows("2")), buffer.submit(rows("3", "4"))
+    insert.release.set()
+
+    assert first.wait(1) and second.wait(1) and third.wait(1)
+    assert insert.batches == [["1"], ["2", "3", "4"]]
+
+
+def test_errors_are_mapped_back_to_each_tickets_rows():
+    insert = RecordingInsert(reject={"b", "d"})
+    insert.release.clear()
+    buffer = PredictionWriteBuffer(insert)
+    buffer.submit(rows("x"))
+    wait_until_taken(buffer)
+    first, second = buffer.submit(rows("a", "b")), buffer.submit(rows("c", "d", "e"))
+    insert.release.set()
+
+    assert first.wait(1) and second.wait(1)
+    assert [error["index"] for error in first.errors] == [1]
+    assert [error["index"] for error in second.errors] == [1]
+
+
+def test_submit_raises_buffer_full_past_max_pending():
+    insert = RecordingInsert()
+    insert.release.clear()
+    buffer = PredictionWriteBuffer(insert, max_pending=3)
+    buffer.submit(rows("1"))
+    wait_until_taken(buffer)
+    buffer.submit(rows("2", "3"))
+    with pytest.raises(BufferFull):
+        buffer.submit(rows("4", "5"))
+    insert.release.set()
+
+
+class SlowSpool:
+    """Spool whose append blocks until released, to hold submitters mid-spool."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.next_id = 0
+
+    def append(self, rows):
+        self.release.wait(5)
+        self.next_id += len(rows)
+        return list(range(self.next_id - len(rows), self.next_id))
+
+    def remove(self, ids):
+        pass
+
+
+def test_concurrent_submits_cannot_overshoot_max_pending():
+    insert = RecordingInsert()
+    insert.release.clear()
+    spool = SlowSpool()
+    buffer = PredictionWriteBuffer(insert, max_pending=4, spool=spool)
+    outcomes = []
+
+    def submit():
+        try:
+            buffer.submit(rows("a", "b"))
+            outcomes.append("queued")
+        except BufferFull:
+            outcomes.append("full")
+
+    threads = [threading.Thread(target=submit) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 1
+    while outcomes.count("full") < 4 and time.monotonic() < deadline:
+        time.sleep(0.001)  # the two reservations fill the buffer while their rows are spooling
+    spool.release.set()
+    for thread in threads:
+        thread.join()
+    insert.release.set()
+
+    assert sorted(outcomes) == ["full"] * 4 + ["queued"] * 2
+
+
+def test_failed_insert_without_a_spool_fails_every_row():
+    buffer = PredictionWriteBuffer(RecordingInsert(fail_times=1))
+    ticket = buffer.submit(rows("1", "2"))
+    assert ticket.wait(1)
+    assert [error["index"] for error in ticket.errors] == [0, 1]
+    assert buffer.retry_after() == 0
+
+
+def test_failed_insert_with_a_spool_is_retried(tmp_path):
+    insert = RecordingInsert(fail_times=1)
+    spool = PredictionSpool(str(tmp_path))
+    buffer = PredictionWriteBuffer(insert, spool=spool)
+    ticket = buffer.submit(rows("1", "2"))
+    assert not ticket.wait(0.5)
+    assert buffer.retry_after() > 0
+    assert spool.depth() == 2
+
+    assert ticket.wait(3)
+    assert ticket.errors == []
+    assert insert.batches == [["1", "2"]]
+    assert spool.depth() == 0
+
+
+def test_recover_only_queues_rows_left_by_an_earlier_process(tmp_path):
+    orphan = _open(str(tmp_path / "spool-dead-host-1.db"))  # segment of a process that is gone
+    with orphan:
+        orphan.execute("INSERT INTO spool (row, enqueued_at) VALUES (?, 0)", (json.dumps(rows("left-behind")[0]),))
+    orphan.close()
+
+    insert = RecordingInsert()
+    spool = PredictionSpool(str(tmp_path))
+    buffer = PredictionWriteBuffer(insert, spool=spool)
+    buffer.submit(rows("live")).wait(1)
+
+    assert buffer.recover() == 1
+    buffer.flush()
+    assert sorted(sum(insert.batches, [])) == ["left-behind", "live"]
@@ -0,0 +1,217 @@
+"""
+Local inverted token index for /api/tweet-cascade topic filtering.
+
+Tweet text from `NoRetweets-political2024` is tokenized into a SQLite store
+(postings keyed by token, created_at, tweet_id) and refreshed incrementally
+from BigQuery. A topic filter resolves to the newest candidate tweet_ids
+locally; the API then hydrates only those rows from BigQuery.
+
+Usage:
+    python topic_index.py            # build or incrementally refresh the index
+    TOPIC_INDEX_PATH=topic_index.db  # enables the index in the API
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TWEETS_TABLE = "emakia.politics2024.NoRetweets-political2024"
+TOKEN_RE = re.compile(r"\w+")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS postings (
+        token TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        tweet_id TEXT NOT NULL,
+        PRIMARY KEY (token, created_at, tweet_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS token_stats (
+        token TEXT PRIMARY KEY,
+        df INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+"""
+
+
+def tokenize(text):
+    """Lowercased word tokens (length >= 2), deduplicated, in order."""
+    return list(dict.fromkeys(t for t in TOKEN_RE.findall((text or "").lower()) if len(t) >= 2))
+
+
+def format_timestamp(value):
+    """Sortable UTC string for a BigQuery TIMESTAMP / datetime."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class TopicIndex:
+    """Token -> (created_at, tweet_id) postings in a local SQLite file."""
+
+    def __init__(self, path, lookback_seconds=3600):
+        self.path = path
+        self.lookback = timedelta(seconds=lookback_seconds)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @property
+    def watermark(self):
+        """created_at of the newest indexed tweet (as stored), or None if empty."""
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'watermark'").fetchone()
+        return row[0] if row else None
+
+    @property
+    def ready(self):
+        return self.watermark is not None
+
+    def add(self, rows):
+        """Index (tweet_id, text, created_at) rows; created_at must be a datetime."""
+        postings = []
+        watermark = self.watermark
+        for tweet_id, text, created_at in rows:
+            if created_at is None:
+                continue
+            ts = format_timestamp(created_at)
+            postings.extend((token, ts, str(tweet_id)) for token in tokenize(text))
+            if watermark is None or ts > watermark:
+                watermark = ts
+
+        with self._write_lock:
+            conn = self._connect()
+            with conn:
+                before = conn.total_changes
+                for posting in postings:
+                    cursor = conn.execute("INSERT OR IGNORE INTO postings VALUES (?, ?, ?)", posting)
+                    if cursor.rowcount:
+                        conn.execute(
+                            "INSERT INTO token_stats VALUES (?, 1) "
+                            "ON CONFLICT(token) DO UPDATE SET df = df + 1",
+                            (posting[0],),
+                        )
+                if watermark is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO meta VALUES ('watermark', ?)", (watermark,)
+                    )
+                return conn.total_changes - before
+
+    def refresh(self, client, page_size=10000):
+        """
+        Pull tweets created after the watermark minus `lookback` from BigQuery and
+        index them. created_at is stamped at ingest, so a tweet can land after
+        newer ones; re-reading the window picks it up (postings are idempotent).
+        """
+        from google.cloud import bigquery
+
+        query = f"SELECT id, text, created_at FROM `{TWEETS_TABLE}` WHERE text IS NOT NULL"
+        query_parameters = []
+        if self.watermark is not None:
+            since = datetime.strptime(self.watermark, "%Y-%m-%d %H:%M:%S.%f") - self.lookback
+            query += " AND created_at > @since"
+            query_parameters.append(
+                bigquery.ScalarQueryParameter("since", "TIMESTAMP", since.replace(tzinfo=timezone.utc))
+            )
+        job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+        result = client.query(query, job_config=job_config).result(page_size=page_size)
+
+        indexed = 0
+        for page in result.pages:
+            rows = [(row.id, row.text, row.created_at) for row in page]
+            self.add(rows)
+            indexed += len(rows)
+        return indexed
+
+    def search(self, topic, limit, cursor=None):
+        """
+        Newest tweets containing every token of `topic` as a whole word, strictly
+        after `cursor` ((created_at datetime, tweet_id)). Returns
+        [(tweet_id, created_at str)], or None when the index cannot answer: the
+        topic has no indexable tokens, or one of them never occurs as a word
+        (a partial word such as "elect" for "election"). The caller then falls
+        back to the substring text filter.
+        """
+        tokens = tokenize(topic)
+        if not tokens:
+            return None
+
+        conn = self._connect()
+        placeholders = ", ".join("?" for _ in tokens)
+        stats = dict(conn.execute(
+            f"SELECT token, df FROM token_stats WHERE token IN ({placeholders})", tokens
+        ).fetchall())
+        if len(stats) < len(tokens):
+            return None  # not a whole word anywhere; may still match as a substring
+
+        # Drive the scan from the rarest token, probe the others by primary key
+        driver, *others = sorted(tokens, key=stats.get)
+        query = "SELECT p.tweet_id, p.created_at FROM postings AS p WHERE p.token = ?"
+        params = [driver]
+        if cursor:
+            ts = format_timestamp(cursor[0])
+            query += " AND (p.created_at < ? OR (p.created_at = ? AND p.tweet_id < ?))"
+            params += [ts, ts, cursor[1]]
+        for token in others:
+            query += (
+                " AND EXISTS (SELECT 1 FROM postings AS o WHERE o.token = ?"
+                " AND o.created_at = p.created_at AND o.tweet_id = p.tweet_id)"
+            )
+            params.append(token)
+        query += " ORDER BY p.created_at DESC, p.tweet_id DESC LIMIT ?"
+        params.append(int(limit))
+        return conn.execute(query, params).fetchall()
+
+    def start_refresher(self, client, interval_seconds):
+        """Keep the index current from a daemon thread."""
+        def run():
+            while True:
+                try:
+                    indexed = self.refresh(client)
+                    if indexed:
+                        print(f"🔎 Topic index: indexed {indexed} tweets")
+                except Exception as e:
+                    print(f"⚠️ Topic index refresh failed: {e}")
+                time.sleep(interval_seconds)
+
+        threading.Thread(target=run, name="topic-index-refresh", daemon=True).start()
+
+
+def main() -> int:
+    from bq_client import get_client
+
+    parser = argparse.ArgumentParser(description="Build or refresh the local topic index.")
+    parser.add_argument("--path", default=os.environ.get("TOPIC_INDEX_PATH", "topic_index.db"))
+    parser.add_argument("--lookback-seconds", type=float,
+                        default=float(os.environ.get("TOPIC_INDEX_LOOKBACK_SECONDS", 3600)),
+                        help="Re-read this far behind the watermark for tweets that landed late")
+    args = parser.parse_args()
+
+    index = TopicIndex(args.path, lookback_seconds=args.lookback_seconds)
+    started = time.monotonic()
+    indexed = index.refresh(get_client(required=True))
+    print(f"✅ Indexed {indexed} tweets into {args.path} in {time.monotonic() - started:.1f}s")
+    print(f"   Watermark: {index.watermark}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
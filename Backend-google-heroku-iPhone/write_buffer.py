@@ -0,0 +1,203 @@
+"""
+In-process write buffer for BigQuery streaming inserts.
+
+Rows submitted by concurrent requests are coalesced and flushed in bulk
+(group commit): the flusher writes whatever is pending, up to ``max_rows``
+rows, as soon as it is idle. A lone row is inserted right away, and rows that
+arrive while an insert is in flight go out together in the next one.
+
+With a ``spool`` (see ingest_spool.py), rows are durably stored before
+``submit`` returns; a failed insert keeps them pending and is retried with
+exponential backoff instead of failing the rows.
+"""
+
+import threading
+import time
+
+
+class BufferFull(Exception):
+    """The buffer already holds ``max_pending`` rows; the caller should back off."""
+
+
+class FlushTicket:
+    """Handle returned by ``PredictionWriteBuffer.submit``.
+
+    Resolves once every submitted row has been written (or has failed).
+    ``errors`` uses the same shape as ``insert_rows_json`` errors, with
+    ``index`` relative to the rows passed to ``submit``.
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.errors = []
+        self._remaining = count
+        self._done = threading.Event()
+        if count == 0:
+            self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the rows are flushed. Returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def _resolve(self, written, errors):
+        self.errors.extend(errors)
+        self._remaining -= written
+        if self._remaining <= 0:
+            self._done.set()
+
+
+class PredictionWriteBuffer:
+    """Coalesce rows from many requests into bulk ``insert_fn`` calls.
+
+    ``insert_fn(rows)`` must return a list of ``insert_rows_json``-style
+    errors (empty on success). The flusher thread is started lazily on the
+    first submit so it is never forked into gunicorn workers.
+    ``submit`` raises BufferFull once ``max_pending`` rows are waiting.
+    """
+
+    def __init__(self, insert_fn, max_rows=500, max_pending=None, spool=None, max_backoff=30.0):
+        self.insert_fn = insert_fn
+        self.max_rows = max_rows
+        self.max_pending = max_pending
+        self.spool = spool
+        self.max_backoff = max_backoff
+        self._pending = []  # (row, ticket, index within ticket, spool id)
+        self._reserved = 0  # slots held by submits that are still spooling their rows
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, rows):
+        """Queue rows for the next flush and return a FlushTicket."""
+        ticket = FlushTicket(len(rows))
+        if not rows:
+            return ticket
+        with self._cond:
+            # Reserve the slots before spooling so concurrent submits cannot overshoot
+            queued = len(self._pending) + self._reserved
+            if self.max_pending and queued + len(rows) > self.max_pending:
+                raise BufferFull(f"{queued} rows already pending")
+            self._reserved += len(rows)
+        try:
+            spool_ids = self.spool.append(rows) if self.spool else [None] * len(rows)
+        except Exception:
+            with self._cond:
+                self._reserved -= len(rows)
+            raise
+        self._enqueue([(row, ticket, i, spool_ids[i]) for i, row in enumerate(rows)], reserved=len(rows))
+        return ticket
+
+    def recover(self):
+        """
+        Queue rows that earlier (dead) processes spooled but never stored. Rows
+        submitted by this process are already queued and are not picked up again.
+        """
+        if not self.spool:
+            return 0
+        adopted = self.spool.adopt_orphans()
+        entries = self.spool.take_leftovers() + adopted
+        if entries:
+            ticket = FlushTicket(len(entries))
+            self._enqueue([(row, ticket, i, spool_id) for i, (spool_id, row) in enumerate(entries)])
+            print(f"♻️ Recovered {len(entries)} spooled predictions ({len(adopted)} from earlier processes)")
+        return len(entries)
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def retry_after(self):
+        """Seconds until the flusher retries after a failed insert (0 if healthy)."""
+        with self._cond:
+            return max(0.0, self._retry_at - time.monotonic())
+
+    def _enqueue(self, entries, reserved=0):
+        with self._cond:
+            self._ensure_thread()
+            self._reserved -= reserved
+            self._pending.extend(entries)
+            self._cond.notify()
+
+    def flush(self):
+        """Synchronously write everything that is pending (used at shutdown)."""
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            if not self._write(batch):
+                return  # still failing; rows stay spooled for the next start
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="prediction-write-buffer", daemon=True
+            )
+            self._thread.start()
+
+    def _take_batch(self):
+        batch = self._pending[:self.max_rows]
+        self._pending = self._pending[self.max_rows:]
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    backoff = self._retry_at - time.monotonic()
+                    if backoff > 0:
+                        self._cond.wait(backoff)
+                        continue
+                    if self._pending:
+                        break
+                    self._cond.wait()
+                batch = self._take_batch()
+            self._write(batch)
+
+    def _write(self, batch):
+        """Insert one batch. Returns False if it was re-queued for a retry."""
+        rows = [entry[0] for entry in batch]
+        with self._write_lock:
+            try:
+                errors = self.insert_fn(rows) or []
+            except Exception as e:
+                if self.spool:
+                    self._requeue(batch, e)
+                    return False
+                print(f"❌ Buffered insert of {len(rows)} rows failed: {e}")
+                errors = [
+                    {"index": i, "errors": [{"message": str(e)}]}
+                    for i in range(len(rows))
+                ]
+        with self._cond:
+            self._backoff = 0.0
+        if self.spool:
+            # Written and rejected rows alike are settled; drop them from disk
+            self.spool.remove([entry[3] for entry in batch])
+
+        per_ticket = {}
+        for _, ticket, _, _ in batch:
+            per_ticket.setdefault(id(ticket), [ticket, 0, []])[1] += 1
+        for error in errors:
+            _, ticket, index, _ = batch[error.get("index", 0)]
+            per_ticket[id(ticket)][2].append({"index": index, "errors": error.get("errors")})
+
+        if errors:
+            print(f"❌ BigQuery insert errors for {len(errors)}/{len(rows)} buffered rows")
+        for ticket, written, ticket_errors in per_ticket.values():
+            ticket._resolve(written, ticket_errors)
+        return True
+
+    def _requeue(self, batch, error):
+        with self._cond:
+            self._backoff = min(self.max_backoff, max(1.0, self._backoff * 2))
+            self._retry_at = time.monotonic() + self._backoff
+            self._pending[:0] = batch
+            backoff = self._backoff
+        print(f"⚠️ Buffered insert of {len(batch)} rows failed, retrying in {backoff:.0f}s: {error}")
@@ -16,13 +16,14 @@ Features:
 import csv
 import os
 import time
-from google.cloud import bigquery
 from dotenv import load_dotenv
 import sys
 
 # Add llm_wrappers folder to Python path (go up one level, then into llm_wrappers)
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, os.path.join(parent_dir, 'llm_wrappers'))
+# Shared BigQuery client factory (lives with the backend)
+sys.path.insert(0, os.path.join(os.path.dirname(parent_dir), 'Backend-google-heroku-iPhone'))
 
 # Load environment variables
 load_dotenv()
@@ -34,6 +35,7 @@ from grok_wrapper import call_grok
 from llama_wrapper import call_llama
 from deepseek_wrapper import call_deepseek
 from claude_wrapper import call_claude
+from bq_client import get_client
 
 # Configuration
 PROJECT_ID = "emakia"
@@ -68,7 +70,7 @@ def initialize_bigquery():
     """Initialize BigQuery client"""
     print("🔗 Connecting to BigQuery...")
     try:
-        client = bigquery.Client(project=PROJECT_ID)
+        client = get_client(required=True, project=PROJECT_ID)
         print("   ✅ Connected")
         return client
     except Exception as e:
@@ -0,0 +1,75 @@
+"""
+Durable progress checkpoints for the loader pipelines.
+
+Each pipeline (script + mode + source table) records, per sink ("neo4j",
+"bigquery"), the highest tweet_id whose rows have been committed to that sink.
+Extracts are ordered by tweet_id and never split one tweet across batches, so a
+rerun resumes with `tweet_id > high-water mark` and skips, per sink, the rows that
+sink already has. The state file is rewritten atomically after every commit.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+
+DEFAULT_PATH = os.environ.get(
+    "ETL_CHECKPOINT_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "etl_checkpoints.json"),
+)
+
+
+class CheckpointStore:
+    """JSON file of {pipeline: {sink: {"tweet_id", "rows", "updated_at"}}}."""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._state = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._state = json.load(f)
+
+    def high_water_mark(self, pipeline: str, sink: str) -> str | None:
+        """Last tweet_id committed to `sink`, or None if the sink has no progress."""
+        return self._state.get(pipeline, {}).get(sink, {}).get("tweet_id")
+
+    def resume_after(self, pipeline: str, sinks: list[str]) -> str | None:
+        """Where the extract should restart: the least advanced sink's mark."""
+        marks = [self.high_water_mark(pipeline, sink) for sink in sinks]
+        if any(mark is None for mark in marks):
+            return None
+        return min(marks)
+
+    def commit(self, pipeline: str, sink: str, tweet_id: str, rows: int) -> None:
+        """Record that every row up to `tweet_id` is in `sink` (`rows` more than before)."""
+        entry = self._state.setdefault(pipeline, {}).setdefault(sink, {"rows": 0})
+        entry["tweet_id"] = tweet_id
+        entry["rows"] += rows
+        entry["updated_at"] = datetime.now(timezone.utc).isoformat()
+        self._save()
+
+    def reset(self, pipeline: str) -> None:
+        if self._state.pop(pipeline, None) is not None:
+            self._save()
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(prefix=".checkpoint-", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._state, f, indent=2, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def pending_rows(rows: list[dict], mark: str | None, key: str = "tweet_id") -> list[dict]:
+    """Rows a sink still needs: those after its high-water mark."""
+    if mark is None:
+        return rows
+    return [row for row in rows if str(row[key]) > mark]
@@ -0,0 +1,120 @@
+"""
+Concurrent, rate-limited LLM classification stage for the loader.
+
+A batch of texts is classified on `workers` threads instead of one HTTP round
+trip after another. Every request first takes one token from a requests-per-
+minute bucket and its estimated size from a tokens-per-minute bucket, so the
+pool stays under the account's OpenAI RPM/TPM limits however many workers run.
+Results come back in input order.
+
+With `pack_size > 1` texts are sent `pack_size` to a request through
+`classify_packed`, which returns None for items it could not classify; those
+items are retried one per request (still rate-limited).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+DEFAULT_WORKERS = int(os.environ.get("LLM_WORKERS", 16))
+DEFAULT_RPM = int(os.environ.get("OPENAI_RPM", 500))
+DEFAULT_TPM = int(os.environ.get("OPENAI_TPM", 200_000))
+DEFAULT_PACK_SIZE = int(os.environ.get("LLM_PACK_SIZE", 1))
+
+# Rough sizing for the TPM bucket: ~4 characters per token, plus the fixed prompt
+CHARS_PER_TOKEN = 4
+PROMPT_OVERHEAD_TOKENS = 120
+
+
+def estimate_tokens(text: str, completion_tokens: int = 150) -> int:
+    """Tokens a request is charged against TPM: prompt estimate plus max_tokens."""
+    return len(text or "") // CHARS_PER_TOKEN + PROMPT_OVERHEAD_TOKENS + completion_tokens
+
+
+class TokenBucket:
+    """
+    Blocking token bucket refilled at `per_minute` / 60 tokens per second,
+    holding up to `burst_seconds` worth. `per_minute <= 0` disables it.
+    """
+
+    def __init__(self, per_minute: int, burst_seconds: float = 10):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cost: float = 1) -> None:
+        """Wait until `cost` tokens (capped at the capacity) are available and take them."""
+        if self.rate <= 0:
+            return
+        cost = min(cost, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= cost:
+                    self._tokens -= cost
+                    return
+                wait = (cost - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ConcurrentClassifier:
+    """Runs a thread-safe `classify(text)` over many texts within RPM/TPM limits."""
+
+    def __init__(
+        self,
+        classify: Callable[[str], dict],
+        classify_packed: Callable[[list[str]], list[dict | None]] | None = None,
+        pack_size: int = DEFAULT_PACK_SIZE,
+        packed_tokens_per_text: int = 40,
+        workers: int = DEFAULT_WORKERS,
+        rpm: int = DEFAULT_RPM,
+        tpm: int = DEFAULT_TPM,
+        tokens_for: Callable[[str], int] = estimate_tokens,
+    ):
+        self.classify = classify
+        self.classify_packed = classify_packed
+        self.pack_size = max(1, pack_size) if classify_packed else 1
+        self.packed_tokens_per_text = packed_tokens_per_text
+        self.workers = max(1, workers)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.tokens_for = tokens_for
+
+    def classify_all(self, texts: list[str]) -> list[dict]:
+        """Classify `texts` concurrently; results are in the same order as `texts`."""
+        if self.pack_size > 1:
+            packs = [texts[start:start + self.pack_size] for start in range(0, len(texts), self.pack_size)]
+            return [result for results in self._map(self._classify_pack, packs) for result in results]
+        return self._map(self._classify_one, texts)
+
+    def _map(self, fn: Callable, items: list) -> list:
+        if self.workers == 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items)),
+                                thread_name_prefix="llm-classifier") as pool:
+            return list(pool.map(fn, items))
+
+    def _classify_one(self, text: str) -> dict:
+        self.requests.acquire()
+        self.tokens.acquire(self.tokens_for(text))
+        return self.classify(text)
+
+    def _classify_pack(self, texts: list[str]) -> list[dict]:
+        self.requests.acquire()
+        self.tokens.acquire(
+            sum(len(text or "") for text in texts) // CHARS_PER_TOKEN
+            + PROMPT_OVERHEAD_TOKENS
+            + self.packed_tokens_per_text * len(texts)
+        )
+        results = self.classify_packed(texts)
+        if len(results) != len(texts):
+            results = [None] * len(texts)
+        return [result if result is not None else self._classify_one(text) for text, result in zip(texts, results)]
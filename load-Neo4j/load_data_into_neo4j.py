@@ -4,16 +4,28 @@ import argparse
 import json
 import os
 import re
-from typing import Iterable
+import sys
+import time
+from typing import Iterable, Iterator
 
 from dotenv import load_dotenv
 from google.cloud import bigquery
-from google.oauth2 import service_account
 from neo4j import GraphDatabase
 from openai import OpenAI
 
 load_dotenv()
 
+# Shared BigQuery client factory lives with the backend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Backend-google-heroku-iPhone"))
+from bq_client import get_client  # noqa: E402
+from bq_extract import DEFAULT_RANGE_KEYS, align_batches, cap_rows, iter_keyset_batches  # noqa: E402
+from checkpoints import DEFAULT_PATH as DEFAULT_CHECKPOINT_FILE, CheckpointStore, pending_rows  # noqa: E402
+from llm_classifier import DEFAULT_PACK_SIZE, DEFAULT_RPM, DEFAULT_TPM, ConcurrentClassifier  # noqa: E402
+from llm_classifier import DEFAULT_WORKERS as DEFAULT_LLM_WORKERS  # noqa: E402
+from neo4j_import import export_import_csv  # noqa: E402
+from neo4j_writer import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, Neo4jBulkWriter  # noqa: E402
+from retweet_edges import current_edges_query  # noqa: E402
+
 
 def extract_label(raw_text: str, expected_values: list[str]) -> str:
     """Extract a classification label from LLM output."""
@@ -76,49 +88,125 @@ Bias: [biased/non-biased]"""
         }
 
 
-def load_bq_credentials() -> dict | None:
-    raw_creds = os.environ.get("BQ_CREDS")
-    if not raw_creds:
-        return None
-    creds = json.loads(raw_creds)
-    if "private_key" in creds and isinstance(creds["private_key"], str):
-        creds["private_key"] = creds["private_key"].replace("\\n", "\n")
-    return creds
+# Completion budget per tweet in a packed request (one small JSON object each)
+PACKED_TOKENS_PER_TWEET = 40
+LABELS = {
+    "toxicity": ["non-toxic", "toxic"],
+    "misinformation": ["non-misinformation", "misinformation"],
+    "bias": ["non-biased", "biased"],
+}
+
+
+def parse_packed_classifications(raw_text: str, count: int) -> list[dict[str, str] | None]:
+    """
+    Per-item results from a packed JSON response, in item order. Each flat
+    `{"id": ..., ...}` object is parsed on its own, so a truncated or partly
+    malformed response still yields its complete items; items that are missing
+    or have an unrecognised label are None.
+    """
+    results = [None] * count
+    for match in re.finditer(r"\{[^{}]*\}", raw_text or ""):
+        try:
+            item = json.loads(match.group(0))
+            index = int(item["id"]) - 1
+        except (ValueError, KeyError, TypeError):
+            continue
+        if not 0 <= index < count or results[index] is not None:
+            continue
+        labels = {name: extract_label(str(item.get(name, "")), values) for name, values in LABELS.items()}
+        if "unknown" not in labels.values():
+            results[index] = {
+                "toxicity": labels["toxicity"],
+                "misinfo": labels["misinformation"],
+                "bias": labels["bias"],
+            }
+    return results
+
+
+def classify_tweets_with_openai(texts: list[str], client: OpenAI, model: str) -> list[dict[str, str] | None]:
+    """
+    Classify several tweets with one request: numbered items in, one JSON object
+    per item out. Items that cannot be parsed come back as None for the caller
+    to retry on their own.
+    """
+    items = json.dumps([{"id": i, "tweet": text or ""} for i, text in enumerate(texts, 1)], ensure_ascii=False)
+    prompt = f"""Classify each of the following tweets on three dimensions:
+1. toxicity: 'toxic' or 'non-toxic'
+2. misinformation: 'misinformation' or 'non-misinformation'
+3. bias: 'biased' or 'non-biased'
+
+Tweets (JSON):
+{items}
+
+Respond with a JSON object with one entry per tweet, using the same ids:
+{{"results": [{{"id": 1, "toxicity": "...", "misinformation": "...", "bias": "..."}}]}}"""
+
+    try:
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are an expert at analyzing social media content for toxicity, misinformation, and bias."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0,
+            max_tokens=PACKED_TOKENS_PER_TWEET * len(texts) + 20,
+            response_format={"type": "json_object"},
+        )
+        return parse_packed_classifications(response.choices[0].message.content, len(texts))
+    except Exception as e:
+        print(f"⚠️ Error classifying {len(texts)} packed tweets: {e}")
+        return [None] * len(texts)
 
 
 def init_bigquery_client() -> bigquery.Client:
-    """Initialize BigQuery client using either BQ_CREDS JSON or ADC."""
-    creds_dict = load_bq_credentials()
-    if creds_dict:
-        creds = service_account.Credentials.from_service_account_info(creds_dict)
-        project_id = creds_dict.get("project_id")
-        return bigquery.Client(credentials=creds, project=project_id)
-    return bigquery.Client()
+    """Shared BigQuery client (service account credentials or ADC), created on first use."""
+    return get_client(required=True)
 
 
-def fetch_tweets(
+def iter_tweet_batches(
     client: bigquery.Client,
     project_id: str,
     dataset_id: str,
     table_id: str,
-    limit: int,
-    offset: int,
-) -> list[dict]:
+    batch_size: int,
+    offset: int = 0,
+    max_rows: int | None = None,
+    read_streams: int = 0,
+    after_tweet_id: str | None = None,
+    range_tweets: int = DEFAULT_RANGE_KEYS,
+) -> Iterator[list[dict]]:
+    """
+    Stream tweets (one row per referenced tweet) in batches of about `batch_size`,
+    starting at row `offset` of a stable (tweet_id, referenced_tweet_id) order
+    (after `after_tweet_id` when resuming). Each query job reads the next
+    `range_tweets` tweet_ids, and a tweet's rows are never split across batches.
+    """
+    tweets_table = f"{project_id}.{dataset_id}.{table_id}"
     query = f"""
+        WITH tweet_range AS (
+            SELECT DISTINCT id
+            FROM `{tweets_table}`
+            WHERE text IS NOT NULL AND (@after_key IS NULL OR id > @after_key)
+            ORDER BY id
+            LIMIT @range_keys
+        )
         SELECT
             t.id AS tweet_id,
             t.text,
             t.author_id,
             t.created_at,
             t.possibly_sensitive,
-            ref_tweet.id AS referenced_tweet_id
-        FROM `{project_id}.{dataset_id}.{table_id}` AS t
-        LEFT JOIN UNNEST(t.referenced_tweets) AS ref_tweet
-        WHERE t.text IS NOT NULL
-        LIMIT {int(limit)} OFFSET {int(offset)}
+            e.target_tweet_id AS referenced_tweet_id
+        FROM `{tweets_table}` AS t
+        LEFT JOIN ({current_edges_query(project_id, dataset_id, table_id)}) AS e
+            ON e.source_tweet_id = t.id
+        WHERE t.text IS NOT NULL AND t.id IN (SELECT id FROM tweet_range)
+        ORDER BY tweet_id, referenced_tweet_id
     """
-    results = client.query(query).result()
-    return [dict(row) for row in results]
+    batches = iter_keyset_batches(client, query, "tweet_id", batch_size, after=after_tweet_id,
+                                  start_row=offset, range_keys=range_tweets, read_streams=read_streams)
+    # Cap after aligning: a SQL LIMIT could cut off part of the last tweet's rows
+    return cap_rows(align_batches(batches, "tweet_id"), max_rows)
 
 
 def get_neo4j_driver():
@@ -199,8 +287,11 @@ def insert_results_to_bigquery(
     project_id: str,
     dataset_id: str,
     results: list[dict]
-) -> int:
-    """Insert classified results into BigQuery. Duplicates will be handled by checking existing IDs."""
+) -> int | None:
+    """
+    Insert classified results into BigQuery. Duplicates will be handled by checking existing IDs.
+    Returns rows inserted, or None if the insert failed.
+    """
     table_id = f"{project_id}.{dataset_id}.results"
     
     try:
@@ -252,7 +343,7 @@ def insert_results_to_bigquery(
         errors = client.insert_rows_json(table_id, rows_to_insert)
         if errors:
             print(f"❌ Errors inserting rows to BigQuery: {errors}")
-            return 0
+            return None
         
         skipped = len(results) - len(rows_to_insert)
         if skipped > 0:
@@ -262,61 +353,80 @@ def insert_results_to_bigquery(
         
     except Exception as e:
         print(f"❌ Error during BigQuery insert: {e}")
-        return 0
+        return None
 
 
-def load_tweets_to_neo4j(driver, tweets: Iterable[dict]) -> int:
+def load_tweets_to_neo4j(writer: Neo4jBulkWriter, tweets: Iterable[dict]) -> int:
     """Load tweets into Neo4j with all properties including classifications."""
-    def create_nodes_and_relationships(tx, tweet: dict):
-        # Create or update the tweet node with ALL properties
-        tx.run(
-            """
-            MERGE (t:Tweet {tweet_id: $tweet_id})
-            SET t.text = $text,
-                t.author_id = $author_id,
-                t.created_at = $created_at,
-                t.possibly_sensitive = $possibly_sensitive,
-                t.toxicity = $toxicity,
-                t.misinformation = $misinfo,
-                t.bias = $bias
-            """,
-            tweet_id=tweet["tweet_id"],
-            text=tweet.get("text"),
-            author_id=tweet.get("author_id"),
-            created_at=str(tweet.get("created_at")) if tweet.get("created_at") else None,
-            possibly_sensitive=tweet.get("possibly_sensitive"),
-            toxicity=tweet.get("toxicity"),
-            misinfo=tweet.get("misinfo"),
-            bias=tweet.get("bias"),
-        )
+    tweets = list(tweets)
+    inserted = writer.write_tweets(
+        {
+            "tweet_id": tweet["tweet_id"],
+            "text": tweet.get("text"),
+            "author_id": tweet.get("author_id"),
+            "created_at": str(tweet.get("created_at")) if tweet.get("created_at") else None,
+            "possibly_sensitive": tweet.get("possibly_sensitive"),
+            "toxicity": tweet.get("toxicity"),
+            "misinformation": tweet.get("misinfo"),
+            "bias": tweet.get("bias"),
+        }
+        for tweet in tweets
+    )
+    # Relationship for tweets that are a retweet/reply
+    writer.write_retweets(
+        (tweet["tweet_id"], tweet["referenced_tweet_id"])
+        for tweet in tweets
+        if tweet.get("referenced_tweet_id")
+    )
+    return inserted
 
-        # Create relationship if this is a retweet/reply
-        if tweet.get("referenced_tweet_id"):
-            tx.run(
-                """
-                MERGE (target:Tweet {tweet_id: $referenced_tweet_id})
-                MERGE (source:Tweet {tweet_id: $tweet_id})
-                MERGE (source)-[:RETWEETED]->(target)
-                """,
-                tweet_id=tweet["tweet_id"],
-                referenced_tweet_id=tweet["referenced_tweet_id"],
-            )
 
-    inserted = 0
-    failed = 0
+def read_classifications_from_neo4j(driver, tweet_ids: list[str]) -> dict[str, dict[str, str]]:
+    """Labels already stored on Tweet nodes, keyed by tweet_id."""
+    if not tweet_ids:
+        return {}
     with driver.session() as session:
-        for tweet in tweets:
-            try:
-                session.execute_write(create_nodes_and_relationships, tweet)
-                inserted += 1
-            except Exception as e:
-                failed += 1
-                print(f"⚠️ Failed to insert tweet {tweet.get('tweet_id')}: {e}")
-    
-    if failed > 0:
-        print(f"⚠️ {failed} tweets failed to insert into Neo4j")
-    
-    return inserted
+        result = session.run(
+            "MATCH (t:Tweet) WHERE t.tweet_id IN $tweet_ids AND t.toxicity IS NOT NULL "
+            "RETURN t.tweet_id AS tweet_id, t.toxicity AS toxicity, "
+            "t.misinformation AS misinformation, t.bias AS bias",
+            tweet_ids=list(tweet_ids),
+        )
+        return {
+            record["tweet_id"]: {
+                "toxicity": record["toxicity"],
+                "misinfo": record["misinformation"],
+                "bias": record["bias"],
+            }
+            for record in result
+        }
+
+
+def classify_pending_rows(classifier: ConcurrentClassifier, driver, neo4j_rows: list[dict],
+                          bq_rows: list[dict]) -> int:
+    """
+    Label the rows either sink still needs, classifying each tweet once (a tweet
+    has a row per referenced tweet). Tweets only BigQuery still needs were
+    committed to Neo4j by an earlier run, so they reuse the labels on their
+    nodes: a resumed run repeats no LLM calls and both sinks agree.
+    Returns the number of tweets sent to the classifier.
+    """
+    texts = {}
+    for tweet in neo4j_rows + bq_rows:
+        texts.setdefault(tweet["tweet_id"], tweet.get("text", ""))
+    in_graph = set(texts) - {tweet["tweet_id"] for tweet in neo4j_rows}
+    classifications = read_classifications_from_neo4j(driver, sorted(in_graph))
+
+    to_classify = {tweet_id: text for tweet_id, text in texts.items() if tweet_id not in classifications}
+    if to_classify:
+        classifications.update(zip(to_classify, classifier.classify_all(list(to_classify.values()))))
+
+    for tweet in neo4j_rows + bq_rows:
+        result = classifications[tweet["tweet_id"]]
+        tweet["toxicity"] = result["toxicity"]
+        tweet["misinfo"] = result["misinfo"]
+        tweet["bias"] = result["bias"]
+    return len(to_classify)
 
 
 def main() -> int:
@@ -325,21 +435,51 @@ def main() -> int:
     parser.add_argument("--bq-dataset", default=os.getenv("BQ_DATASET", "politics2024"))
     parser.add_argument("--bq-table", default=os.getenv("BQ_TABLE", "tweets"))
     parser.add_argument("--batch-size", type=int, default=100)
-    parser.add_argument("--batches", type=int, default=5)
-    parser.add_argument("--offset", type=int, default=500)
+    parser.add_argument("--batches", type=int, default=5, help="Batches to process (0 = all remaining rows)")
+    parser.add_argument("--offset", type=int, default=500, help="Row to start at")
+    parser.add_argument("--read-streams", type=int, default=0,
+                        help="Read results with the BigQuery Storage Read API (needs google-cloud-bigquery-storage)")
+    parser.add_argument("--range-tweets", type=int, default=DEFAULT_RANGE_KEYS,
+                        help="tweet_ids read per query job (each job sorts only its range)")
     parser.add_argument(
         "--mode",
-        choices=["load-only", "classify"],
+        choices=["load-only", "classify", "export-csv"],
         default="classify",
-        help="load-only=import tweets without classification; classify=classify and store in both Neo4j and BigQuery",
+        help="load-only=import tweets without classification; classify=classify and store in both Neo4j and BigQuery; "
+             "export-csv=write the whole table as neo4j-admin import CSVs",
     )
+    parser.add_argument("--output-dir", default="neo4j-import", help="Directory for export-csv files")
     parser.add_argument("--llm-model", default=os.getenv("LLM_MODEL", "gpt-4o-mini"))
+    parser.add_argument("--llm-workers", type=int, default=DEFAULT_LLM_WORKERS,
+                        help="Concurrent OpenAI requests in classify mode")
+    parser.add_argument("--llm-pack-size", type=int, default=DEFAULT_PACK_SIZE,
+                        help="Tweets per OpenAI request (1 = one request per tweet)")
+    parser.add_argument("--llm-rpm", type=int, default=DEFAULT_RPM,
+                        help="OpenAI requests-per-minute limit to stay under (0 = unlimited)")
+    parser.add_argument("--llm-tpm", type=int, default=DEFAULT_TPM,
+                        help="OpenAI tokens-per-minute limit to stay under (0 = unlimited)")
+    parser.add_argument("--neo4j-batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Rows per UNWIND transaction when writing to Neo4j")
+    parser.add_argument("--neo4j-workers", type=int, default=DEFAULT_WORKERS,
+                        help="Parallel Neo4j sessions (rows partitioned by tweet_id hash)")
+    parser.add_argument("--checkpoint-file", default=DEFAULT_CHECKPOINT_FILE,
+                        help="Progress state; reruns resume after the last committed tweet_id per sink")
+    parser.add_argument("--reset-checkpoint", action="store_true",
+                        help="Forget saved progress for this pipeline and start from --offset")
     parser.add_argument("--verbose", action="store_true")
     parser.add_argument("--init-schema", action="store_true", help="Initialize Neo4j schema (constraints and indexes)")
     args = parser.parse_args()
 
     bq_client = init_bigquery_client()
+
+    # Offline first load: no Neo4j connection, the files feed neo4j-admin
+    if args.mode == "export-csv":
+        export_import_csv(bq_client, args.bq_project, args.bq_dataset, args.bq_table, args.output_dir,
+                          read_streams=args.read_streams)
+        return 0
+
     driver = get_neo4j_driver()
+    writer = Neo4jBulkWriter(driver, batch_size=args.neo4j_batch_size, workers=args.neo4j_workers)
 
     # Initialize Neo4j schema
     if args.init_schema or args.mode in {"load-only", "classify"}:
@@ -350,66 +490,94 @@ def main() -> int:
         create_bigquery_results_table(bq_client, args.bq_project, args.bq_dataset)
 
     # Initialize OpenAI client if in classify mode
-    openai_client = None
+    classifier = None
     if args.mode == "classify":
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("Missing OPENAI_API_KEY in environment variables")
-        openai_client = OpenAI(api_key=api_key)
-        print(f"✅ Using OpenAI model: {args.llm_model}\n")
+        # The SDK retries 429s (honouring retry-after) on top of the client-side buckets
+        openai_client = OpenAI(api_key=api_key, max_retries=5)
+        classifier = ConcurrentClassifier(
+            lambda text: classify_tweet_with_openai(text, openai_client, args.llm_model),
+            classify_packed=lambda texts: classify_tweets_with_openai(texts, openai_client, args.llm_model),
+            pack_size=args.llm_pack_size,
+            packed_tokens_per_text=PACKED_TOKENS_PER_TWEET,
+            workers=args.llm_workers,
+            rpm=args.llm_rpm,
+            tpm=args.llm_tpm,
+        )
+        print(f"✅ Using OpenAI model: {args.llm_model} "
+              f"({args.llm_pack_size} tweets/request, {args.llm_workers} workers, "
+              f"{args.llm_rpm} RPM / {args.llm_tpm} TPM)\n")
+
+    # Progress is tracked per sink; resume after the least advanced one
+    pipeline = f"load_data_into_neo4j:{args.mode}:{args.bq_project}.{args.bq_dataset}.{args.bq_table}"
+    sinks = ["neo4j", "bigquery"] if args.mode == "classify" else ["neo4j"]
+    checkpoints = CheckpointStore(args.checkpoint_file)
+    if args.reset_checkpoint:
+        checkpoints.reset(pipeline)
+    resume_after = checkpoints.resume_after(pipeline, sinks)
+    if resume_after is not None:
+        print(f"⏩ Resuming after tweet_id {resume_after} (checkpoint {args.checkpoint_file}; --offset ignored)")
+
+    # Query jobs read bounded tweet_id ranges in order; --offset skips into the result
+    tweet_batches = iter_tweet_batches(
+        bq_client,
+        args.bq_project,
+        args.bq_dataset,
+        args.bq_table,
+        batch_size=args.batch_size,
+        offset=args.offset if resume_after is None else 0,
+        max_rows=args.batches * args.batch_size if args.batches else None,
+        read_streams=args.read_streams,
+        after_tweet_id=resume_after,
+        range_tweets=args.range_tweets,
+    )
+    batches_label = args.batches or "all"
+    exit_code = 0
 
     try:
-        for batch_num in range(args.batches):
-            batch_offset = args.offset + batch_num * args.batch_size
-            print(f"\n🔄 Processing batch {batch_num + 1}/{args.batches} (rows {batch_offset}–{batch_offset + args.batch_size - 1})")
-
-            tweets_batch = fetch_tweets(
-                bq_client,
-                args.bq_project,
-                args.bq_dataset,
-                args.bq_table,
-                limit=args.batch_size,
-                offset=batch_offset,
-            )
-            if not tweets_batch:
-                print("⚠️ No tweets retrieved in this batch.")
-                continue
-
-            if args.mode == "load-only":
-                # Load tweets without classification
-                inserted = load_tweets_to_neo4j(driver, tweets_batch)
-                print(f"✅ Loaded {inserted} tweets into Neo4j (no classification).")
-            
-            elif args.mode == "classify":
-                # Classify tweets and add predictions to each tweet
-                classified_tweets = []
-                for i, tweet in enumerate(tweets_batch, 1):
-                    if args.verbose and i % 10 == 0:
-                        print(f"  📊 Classifying tweet {i}/{len(tweets_batch)}...")
-                    
-                    result = classify_tweet_with_openai(
-                        tweet.get("text", ""),
-                        openai_client,
-                        args.llm_model
-                    )
-                    tweet["toxicity"] = result["toxicity"]
-                    tweet["misinfo"] = result["misinfo"]
-                    tweet["bias"] = result["bias"]
-                    classified_tweets.append(tweet)
-                
-                # Store in Neo4j with all data
-                inserted = load_tweets_to_neo4j(driver, classified_tweets)
-                print(f"✅ Loaded {inserted} classified tweets into Neo4j.")
-                
+        for batch_num, tweets_batch in enumerate(tweet_batches):
+            print(f"\n🔄 Processing batch {batch_num + 1}/{batches_label} "
+                  f"({len(tweets_batch)} rows, tweet_id {tweets_batch[0]['tweet_id']}–{tweets_batch[-1]['tweet_id']})")
+            last_tweet_id = str(tweets_batch[-1]["tweet_id"])
+
+            # Each sink only takes the rows after its own checkpoint
+            neo4j_rows = pending_rows(tweets_batch, checkpoints.high_water_mark(pipeline, "neo4j"))
+            bq_rows = pending_rows(tweets_batch, checkpoints.high_water_mark(pipeline, "bigquery"))
+
+            if args.mode == "classify":
+                # Classify only what a sink still needs, concurrently
+                started = time.monotonic()
+                classified = classify_pending_rows(classifier, driver, neo4j_rows, bq_rows)
+                if args.verbose:
+                    print(f"  📊 Classified {classified} tweets in {time.monotonic() - started:.1f}s")
+
+            # Store in Neo4j (rows the graph does not have yet)
+            failed_before = writer.failed_rows
+            inserted = load_tweets_to_neo4j(writer, neo4j_rows)
+            if writer.failed_rows > failed_before:
+                print("❌ Neo4j writes failed; stopping so the next run resumes from the last checkpoint")
+                exit_code = 1
+                break
+            checkpoints.commit(pipeline, "neo4j", last_tweet_id, len(neo4j_rows))
+            print(f"✅ Loaded {inserted} {'classified ' if args.mode == 'classify' else ''}tweets into Neo4j.")
+
+            if args.mode == "classify":
                 # Store in BigQuery results table
                 bq_inserted = insert_results_to_bigquery(
                     bq_client,
                     args.bq_project,
                     args.bq_dataset,
-                    classified_tweets
-                )
+                    bq_rows
+                ) if bq_rows else 0
+                if bq_inserted is None:
+                    print("❌ BigQuery insert failed; stopping so the next run resumes from the last checkpoint")
+                    exit_code = 1
+                    break
+                checkpoints.commit(pipeline, "bigquery", last_tweet_id, len(bq_rows))
                 print(f"✅ Inserted {bq_inserted} results into BigQuery table: {args.bq_project}.{args.bq_dataset}.results")
-    
+
     finally:
         driver.close()
     
@@ -437,7 +605,7 @@ def main() -> int:
     
     print("="*60)
 
-    return 0
+    return exit_code
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+"""
+CSV export for an offline `neo4j-admin database import`.
+
+Streams deduplicated Tweet nodes and RETWEETED relationships from BigQuery into
+node/relationship CSV files in the import tool's header format, for first loads
+of a whole dataset where transactional MERGE is too slow. Deduplication happens
+in the queries, so memory use does not grow with the dataset.
+"""
+
+from __future__ import annotations
+
+import csv
+import os
+
+from google.cloud import bigquery
+
+from bq_extract import iter_row_batches
+from retweet_edges import edges_table_id
+
+NODE_HEADER = ["tweet_id:ID(Tweet)", "text", "author_id", "created_at", "possibly_sensitive:boolean", ":LABEL"]
+RELATIONSHIP_HEADER = [":START_ID(Tweet)", ":END_ID(Tweet)", ":TYPE"]
+PAGE_SIZE = 50_000
+
+# One row per tweet, plus a bare node for every referenced tweet missing from the table
+NODES_QUERY = """
+    WITH tweets AS (
+        SELECT id, text, author_id, created_at, possibly_sensitive
+        FROM `{tweets_table}`
+        WHERE id IS NOT NULL AND text IS NOT NULL
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY id ORDER BY created_at DESC) = 1
+    )
+    SELECT id AS tweet_id, text, author_id, created_at, possibly_sensitive
+    FROM tweets
+    UNION ALL
+    SELECT DISTINCT e.target_tweet_id, NULL, NULL, NULL, NULL
+    FROM `{edges_table}` AS e
+    JOIN tweets AS source ON source.id = e.source_tweet_id
+    LEFT JOIN tweets AS target ON target.id = e.target_tweet_id
+    WHERE target.id IS NULL
+"""
+
+RELATIONSHIPS_QUERY = """
+    SELECT DISTINCT e.source_tweet_id, e.target_tweet_id
+    FROM `{edges_table}` AS e
+    WHERE e.source_tweet_id IN (
+        SELECT id FROM `{tweets_table}` WHERE id IS NOT NULL AND text IS NOT NULL
+    )
+"""
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _export(client: bigquery.Client, query: str, path: str, header: list[str], to_record,
+            read_streams: int = 0) -> int:
+    """Write query rows to `path` batch by batch; returns rows written."""
+    written = 0
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        out = csv.writer(f)
+        out.writerow(header)
+        for batch in iter_row_batches(client, query, PAGE_SIZE, read_streams=read_streams):
+            out.writerows([_csv_value(value) for value in to_record(row)] for row in batch)
+            if (written + len(batch)) // 1_000_000 > written // 1_000_000:
+                print(f"  … {written + len(batch):,} rows written to {os.path.basename(path)}")
+            written += len(batch)
+    os.replace(tmp_path, path)
+    return written
+
+
+def export_import_csv(
+    client: bigquery.Client,
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    output_dir: str,
+    read_streams: int = 0,
+) -> tuple[int, int]:
+    """
+    Write tweets.csv and retweeted.csv to `output_dir`. Returns (nodes, relationships).
+    Row order does not matter here, so `read_streams` can download in parallel.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tables = {
+        "tweets_table": f"{project_id}.{dataset_id}.{table_id}",
+        "edges_table": edges_table_id(project_id, dataset_id),
+    }
+    nodes_path = os.path.join(output_dir, "tweets.csv")
+    relationships_path = os.path.join(output_dir, "retweeted.csv")
+
+    print(f"📤 Exporting Tweet nodes to {nodes_path}")
+    nodes = _export(
+        client, NODES_QUERY.format(**tables), nodes_path, NODE_HEADER,
+        lambda row: [row["tweet_id"], row["text"], row["author_id"], row["created_at"],
+                     row["possibly_sensitive"], "Tweet"],
+        read_streams,
+    )
+    print(f"📤 Exporting RETWEETED relationships to {relationships_path}")
+    relationships = _export(
+        client, RELATIONSHIPS_QUERY.format(**tables), relationships_path, RELATIONSHIP_HEADER,
+        lambda row: [row["source_tweet_id"], row["target_tweet_id"], "RETWEETED"],
+        read_streams,
+    )
+
+    print(f"✅ Wrote {nodes:,} nodes and {relationships:,} relationships. Import (database stopped) with:")
+    print(f"   neo4j-admin database import full --nodes={nodes_path} "
+          f"--relationships={relationships_path} --multiline-fields=true neo4j")
+    return nodes, relationships
@@ -0,0 +1,128 @@
+"""
+Bulk Neo4j writer shared by the loader scripts.
+
+Rows are sent in chunks of `batch_size` as one list parameter and applied with
+`UNWIND $rows AS row MERGE ...`, one transaction per chunk, instead of a
+transaction (and a round trip per statement) for every tweet.
+
+With `workers > 1` rows are partitioned by a hash of tweet_id (the target tweet
+for relationships) and each partition is written by its own session, so two
+workers never MERGE the same node; deadlocks that still occur (e.g. on a shared
+retweeter) are retried with backoff.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+DEFAULT_BATCH_SIZE = int(os.environ.get("NEO4J_BATCH_SIZE", 2000))
+DEFAULT_WORKERS = int(os.environ.get("NEO4J_WORKERS", 4))
+RETRYABLE_ERRORS = (TransientError, ServiceUnavailable, SessionExpired)
+
+MERGE_TWEETS = """
+    UNWIND $rows AS row
+    MERGE (t:Tweet {tweet_id: row.tweet_id})
+    SET t += row.properties
+"""
+
+MERGE_RETWEETED = """
+    UNWIND $rows AS row
+    MERGE (source:Tweet {tweet_id: row.source_tweet_id})
+    MERGE (target:Tweet {tweet_id: row.target_tweet_id})
+    MERGE (source)-[:RETWEETED]->(target)
+"""
+
+
+def chunked(rows: list, size: int) -> Iterable[list]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def partition(rows: list[dict], key: str, count: int) -> list[list[dict]]:
+    """Split rows into `count` lists by a stable hash of row[key]."""
+    partitions = [[] for _ in range(count)]
+    for row in rows:
+        partitions[zlib.crc32(str(row[key]).encode("utf-8")) % count].append(row)
+    return [part for part in partitions if part]
+
+
+class Neo4jBulkWriter:
+    """UNWIND-based MERGE of Tweet nodes and RETWEETED relationships in large batches."""
+
+    def __init__(self, driver, batch_size: int = DEFAULT_BATCH_SIZE,
+                 workers: int = DEFAULT_WORKERS, max_attempts: int = 5):
+        self.driver = driver
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        # Rows dropped after failed writes; callers compare it before/after a batch
+        self.failed_rows = 0
+        self._failed_lock = threading.Lock()
+
+    def write_tweets(self, tweets: Iterable[dict]) -> int:
+        """
+        MERGE Tweet nodes from `{"tweet_id": ..., **properties}` dicts; properties
+        set to None are removed. Returns the number of nodes written.
+        """
+        by_id = {}
+        for tweet in tweets:
+            properties = dict(tweet)
+            tweet_id = properties.pop("tweet_id")
+            by_id.setdefault(tweet_id, {}).update(properties)
+        rows = [{"tweet_id": tweet_id, "properties": props} for tweet_id, props in by_id.items()]
+        return self._write(MERGE_TWEETS, rows, "tweets", key="tweet_id")
+
+    def write_retweets(self, edges: Iterable[tuple[str, str]]) -> int:
+        """MERGE (source)-[:RETWEETED]->(target) for (source_tweet_id, target_tweet_id) pairs."""
+        rows = [
+            {"source_tweet_id": source, "target_tweet_id": target}
+            for source, target in dict.fromkeys(edges)
+        ]
+        # Retweets of one tweet share its lock; keep them in one partition
+        return self._write(MERGE_RETWEETED, rows, "RETWEETED edges", key="target_tweet_id")
+
+    def _write(self, statement: str, rows: list[dict], what: str, key: str) -> int:
+        # Partition even batches smaller than batch_size: the loaders pass one extract
+        # batch (100 rows by default) at a time
+        partitions = partition(rows, key, self.workers) if self.workers > 1 else [rows]
+        if len(partitions) <= 1:
+            return self._write_partition(statement, rows, what)
+        with ThreadPoolExecutor(max_workers=len(partitions), thread_name_prefix="neo4j-writer") as pool:
+            return sum(pool.map(lambda part: self._write_partition(statement, part, what), partitions))
+
+    def _write_partition(self, statement: str, rows: list[dict], what: str) -> int:
+        written = 0
+        with self.driver.session() as session:
+            for chunk in chunked(rows, self.batch_size):
+                written += self._write_chunk(session, statement, chunk, what)
+        return written
+
+    def _write_chunk(self, session, statement: str, chunk: list[dict], what: str) -> int:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                session.execute_write(lambda tx: tx.run(statement, rows=chunk).consume())
+                return len(chunk)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_attempts:
+                    print(f"⚠️ Failed to write {len(chunk)} {what} to Neo4j after {attempt} attempts: {e}")
+                    return self._record_failure(chunk)
+                delay = min(10.0, 0.2 * 2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"🔁 Retrying {len(chunk)} {what} in {delay:.1f}s ({type(e).__name__})")
+                time.sleep(delay)
+            except Exception as e:
+                print(f"⚠️ Failed to write {len(chunk)} {what} to Neo4j: {e}")
+                return self._record_failure(chunk)
+        return 0
+
+    def _record_failure(self, chunk: list[dict]) -> int:
+        with self._failed_lock:
+            self.failed_rows += len(chunk)
+        return 0
@@ -1,48 +1,57 @@
 from __future__ import annotations
 
 import argparse
-import json
 import os
 import re
-from typing import Iterable
+import sys
+from typing import Iterable, Iterator
 
 from dotenv import load_dotenv
 from google.cloud import bigquery
-from google.oauth2 import service_account
 from neo4j import GraphDatabase
 
 load_dotenv()
 
-
-def load_bq_credentials() -> dict | None:
-    raw_creds = os.environ.get("BQ_CREDS")
-    if not raw_creds:
-        return None
-    creds = json.loads(raw_creds)
-    if "private_key" in creds and isinstance(creds["private_key"], str):
-        creds["private_key"] = creds["private_key"].replace("\\n", "\n")
-    return creds
+# Shared BigQuery client factory lives with the backend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Backend-google-heroku-iPhone"))
+from bq_client import get_client  # noqa: E402
+from bq_extract import DEFAULT_RANGE_KEYS, align_batches, cap_rows, iter_keyset_batches  # noqa: E402
+from checkpoints import DEFAULT_PATH as DEFAULT_CHECKPOINT_FILE, CheckpointStore, pending_rows  # noqa: E402
+from neo4j_writer import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, Neo4jBulkWriter  # noqa: E402
+from retweet_edges import edges_table_id  # noqa: E402
 
 
 def init_bigquery_client() -> bigquery.Client:
-    """Initialize BigQuery client using either BQ_CREDS JSON or ADC."""
-    creds_dict = load_bq_credentials()
-    if creds_dict:
-        creds = service_account.Credentials.from_service_account_info(creds_dict)
-        project_id = creds_dict.get("project_id")
-        return bigquery.Client(credentials=creds, project=project_id)
-    return bigquery.Client()
+    """Shared BigQuery client (service account credentials or ADC), created on first use."""
+    return get_client(required=True)
 
 
-def fetch_coreml_predictions(
+def iter_coreml_prediction_batches(
     client: bigquery.Client,
     project_id: str,
     dataset_id: str,
-    limit: int,
-    offset: int,
-) -> list[dict]:
-    """Fetch predictions from CoreMLpredictions table."""
+    batch_size: int,
+    offset: int = 0,
+    max_rows: int | None = None,
+    read_streams: int = 0,
+    after_tweet_id: str | None = None,
+    range_tweets: int = DEFAULT_RANGE_KEYS,
+) -> Iterator[list[dict]]:
+    """
+    Stream predictions from the CoreMLpredictions table in batches of about
+    `batch_size`, starting at row `offset` of a stable (tweet_id, created_at) order
+    (after `after_tweet_id` when resuming). Each query job reads the next
+    `range_tweets` tweet_ids, and a tweet's rows are never split across batches.
+    """
+    predictions_table = f"{project_id}.{dataset_id}.CoreMLpredictions"
     query = f"""
+        WITH tweet_range AS (
+            SELECT DISTINCT tweet_id
+            FROM `{predictions_table}`
+            WHERE @after_key IS NULL OR tweet_id > @after_key
+            ORDER BY tweet_id
+            LIMIT @range_keys
+        )
         SELECT
             tweet_id,
             text,
@@ -60,41 +69,63 @@ def fetch_coreml_predictions(
             updated_at,
             normalized_text,
             rn
-        FROM `{project_id}.{dataset_id}.CoreMLpredictions`
-        LIMIT {int(limit)} OFFSET {int(offset)}
+        FROM `{predictions_table}`
+        WHERE tweet_id IN (SELECT tweet_id FROM tweet_range)
+        ORDER BY tweet_id, created_at
     """
-    results = client.query(query).result()
-    return [dict(row) for row in results]
+    batches = iter_keyset_batches(client, query, "tweet_id", batch_size, after=after_tweet_id,
+                                  start_row=offset, range_keys=range_tweets, read_streams=read_streams)
+    # Cap after aligning: a SQL LIMIT could cut off part of the last tweet's rows
+    return cap_rows(align_batches(batches, "tweet_id"), max_rows)
 
 
-def find_retweets_for_tweet(
+def find_retweets_for_tweets(
     client: bigquery.Client,
     project_id: str,
     dataset_id: str,
-    tweet_id: str,
-) -> list[dict]:
-    """Find all retweets of a specific tweet from the tweets table."""
+    tweet_ids: Iterable[str],
+) -> dict[str, list[dict]]:
+    """
+    Find the retweets of a batch of tweets in one query, grouped by original tweet_id.
+    Retweets come from the precomputed edge table (retweet_edges.py), which carries
+    their text and sensitivity, so the raw tweets table is not read.
+    """
+    tweet_ids = sorted({str(tweet_id) for tweet_id in tweet_ids if tweet_id})
+    retweets_by_id = {tweet_id: [] for tweet_id in tweet_ids}
+    if not tweet_ids:
+        return retweets_by_id
+
     query = f"""
         SELECT
-            t.id AS retweet_id,
-            t.text AS retweet_text,
-            t.author_id AS retweeter_id,
-            t.created_at AS retweet_created_at,
-            t.possibly_sensitive,
-            ref_tweet.id AS referenced_tweet_id
-        FROM `{project_id}.{dataset_id}.tweets` AS t,
-        UNNEST(t.referenced_tweets) AS ref_tweet
-        WHERE ref_tweet.id = @tweet_id
+            e.source_tweet_id AS retweet_id,
+            e.text AS retweet_text,
+            e.author_id AS retweeter_id,
+            e.created_at AS retweet_created_at,
+            e.possibly_sensitive,
+            e.target_tweet_id AS referenced_tweet_id
+        FROM `{edges_table_id(project_id, dataset_id)}` AS e
+        WHERE e.target_tweet_id IN UNNEST(@tweet_ids)
     """
-    
+
     job_config = bigquery.QueryJobConfig(
         query_parameters=[
-            bigquery.ScalarQueryParameter("tweet_id", "STRING", tweet_id)
+            bigquery.ArrayQueryParameter("tweet_ids", "STRING", tweet_ids)
         ]
     )
-    
-    results = client.query(query, job_config=job_config).result()
-    return [dict(row) for row in results]
+
+    for row in client.query(query, job_config=job_config).result():
+        retweets_by_id[row["referenced_tweet_id"]].append(dict(row))
+    return retweets_by_id
+
+
+def find_retweets_for_tweet(
+    client: bigquery.Client,
+    project_id: str,
+    dataset_id: str,
+    tweet_id: str,
+) -> list[dict]:
+    """Find all retweets of a specific tweet from the retweet_edges table."""
+    return find_retweets_for_tweets(client, project_id, dataset_id, [tweet_id]).get(str(tweet_id), [])
 
 
 def get_neo4j_driver():
@@ -108,31 +139,35 @@ def get_neo4j_driver():
     return GraphDatabase.driver(uri, auth=(user, password))
 
 
+# Rows buffered per results_of_CoreML load job
+DEFAULT_LOAD_ROWS = int(os.environ.get("RESULTS_LOAD_ROWS", 50_000))
+
+RESULTS_SCHEMA = [
+    bigquery.SchemaField("tweet_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("text", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("prediction", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("score", "FLOAT", mode="NULLABLE"),
+    bigquery.SchemaField("model_version", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("prediction_llm0", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("score_llm0", "FLOAT", mode="NULLABLE"),
+    bigquery.SchemaField("prediction_llm3", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("score_llm3", "FLOAT", mode="NULLABLE"),
+    bigquery.SchemaField("prediction_llm4", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("score_llm4", "FLOAT", mode="NULLABLE"),
+    bigquery.SchemaField("possibly_sensitive", "BOOLEAN", mode="NULLABLE"),
+    bigquery.SchemaField("created_at", "TIMESTAMP", mode="NULLABLE"),
+    bigquery.SchemaField("updated_at", "TIMESTAMP", mode="NULLABLE"),
+    bigquery.SchemaField("normalized_text", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("rn", "INTEGER", mode="NULLABLE"),
+    bigquery.SchemaField("retweet_count", "INTEGER", mode="NULLABLE"),
+]
+
+
 def create_bigquery_results_table(client: bigquery.Client, project_id: str, dataset_id: str) -> None:
     """Create the results_of_CoreML table in BigQuery if it doesn't exist."""
     table_id = f"{project_id}.{dataset_id}.results_of_CoreML"
-    
-    schema = [
-        bigquery.SchemaField("tweet_id", "STRING", mode="REQUIRED"),
-        bigquery.SchemaField("text", "STRING", mode="NULLABLE"),
-        bigquery.SchemaField("prediction", "STRING", mode="NULLABLE"),
-        bigquery.SchemaField("score", "FLOAT", mode="NULLABLE"),
-        bigquery.SchemaField("model_version", "STRING", mode="NULLABLE"),
-        bigquery.SchemaField("prediction_llm0", "STRING", mode="NULLABLE"),
-        bigquery.SchemaField("score_llm0", "FLOAT", mode="NULLABLE"),
-        bigquery.SchemaField("prediction_llm3", "STRING", mode="NULLABLE"),
-        bigquery.SchemaField("score_llm3", "FLOAT", mode="NULLABLE"),
-        bigquery.SchemaField("prediction_llm4", "STRING", mode="NULLABLE"),
-        bigquery.SchemaField("score_llm4", "FLOAT", mode="NULLABLE"),
-        bigquery.SchemaField("possibly_sensitive", "BOOLEAN", mode="NULLABLE"),
-        bigquery.SchemaField("created_at", "TIMESTAMP", mode="NULLABLE"),
-        bigquery.SchemaField("updated_at", "TIMESTAMP", mode="NULLABLE"),
-        bigquery.SchemaField("normalized_text", "STRING", mode="NULLABLE"),
-        bigquery.SchemaField("rn", "INTEGER", mode="NULLABLE"),
-        bigquery.SchemaField("retweet_count", "INTEGER", mode="NULLABLE"),
-    ]
-    
-    table = bigquery.Table(table_id, schema=schema)
+
+    table = bigquery.Table(table_id, schema=RESULTS_SCHEMA)
     try:
         client.create_table(table)
         print(f"✅ Created BigQuery table: {table_id}")
@@ -140,75 +175,104 @@ def create_bigquery_results_table(client: bigquery.Client, project_id: str, data
         print(f"⚠️ Table may already exist: {e}")
 
 
-def insert_results_to_bigquery(
-    client: bigquery.Client,
-    project_id: str,
-    dataset_id: str,
-    prediction: dict,
-    retweet_count: int
-) -> bool:
-    """Insert prediction results with retweet count into BigQuery."""
-    table_id = f"{project_id}.{dataset_id}.results_of_CoreML"
-    
-    try:
-        # Check if tweet_id already exists
-        tweet_id = prediction["tweet_id"]
-        check_query = f"""
-        SELECT tweet_id 
-        FROM `{table_id}`
-        WHERE tweet_id = '{tweet_id}'
+def build_result_row(prediction: dict, retweet_count: int) -> dict:
+    """results_of_CoreML row for a prediction and its retweet count."""
+    created_at = prediction.get("created_at")
+    if created_at is not None:
+        created_at = str(created_at)
+
+    updated_at = prediction.get("updated_at")
+    if updated_at is not None:
+        updated_at = str(updated_at)
+
+    return {
+        "tweet_id": str(prediction["tweet_id"]),
+        "text": prediction.get("text"),
+        "prediction": prediction.get("prediction"),
+        "score": float(prediction["score"]) if prediction.get("score") is not None else None,
+        "model_version": prediction.get("model_version"),
+        "prediction_llm0": prediction.get("prediction_llm0"),
+        "score_llm0": float(prediction["score_llm0"]) if prediction.get("score_llm0") is not None else None,
+        "prediction_llm3": prediction.get("prediction_llm3"),
+        "score_llm3": float(prediction["score_llm3"]) if prediction.get("score_llm3") is not None else None,
+        "prediction_llm4": prediction.get("prediction_llm4"),
+        "score_llm4": float(prediction["score_llm4"]) if prediction.get("score_llm4") is not None else None,
+        "possibly_sensitive": prediction.get("possibly_sensitive"),
+        "created_at": created_at,
+        "updated_at": updated_at,
+        "normalized_text": prediction.get("normalized_text"),
+        "rn": int(prediction["rn"]) if prediction.get("rn") is not None else None,
+        "retweet_count": retweet_count,
+    }
+
+
+class ResultsSink:
+    """
+    Buffered writer for results_of_CoreML. Rows from many extract batches are held
+    until `load_rows` are pending, then flushed with one lookup of the tweet_ids not
+    already known to be stored and one load job for the new rows. BigQuery allows
+    1,500 load jobs per table per day, so a load job per 100-row batch would cap a
+    run at ~150k predictions.
+    """
+
+    def __init__(self, client: bigquery.Client, project_id: str, dataset_id: str,
+                 load_rows: int = DEFAULT_LOAD_ROWS):
+        self.client = client
+        self.table_id = f"{project_id}.{dataset_id}.results_of_CoreML"
+        self.load_rows = load_rows
+        # tweet_id -> row waiting for the next flush (first row per tweet_id wins)
+        self.pending = {}
+        # tweet_ids known to be in the table (looked up or written by this run)
+        self.known_ids = set()
+
+    @property
+    def full(self) -> bool:
+        return len(self.pending) >= self.load_rows
+
+    def add(self, predictions: list[dict], retweet_counts: dict[str, int]) -> None:
+        """Buffer the batch's predictions for the next flush."""
+        for prediction in predictions:
+            tweet_id = str(prediction["tweet_id"])
+            if tweet_id not in self.known_ids and tweet_id not in self.pending:
+                self.pending[tweet_id] = build_result_row(prediction, retweet_counts.get(tweet_id, 0))
+
+    def existing_ids(self, tweet_ids: list[str]) -> set[str]:
+        """Which of `tweet_ids` are already stored, with one array-parameter query."""
+        unknown = [tweet_id for tweet_id in tweet_ids if tweet_id not in self.known_ids]
+        if unknown:
+            query = f"SELECT DISTINCT tweet_id FROM `{self.table_id}` WHERE tweet_id IN UNNEST(@tweet_ids)"
+            job_config = bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ArrayQueryParameter("tweet_ids", "STRING", unknown)
+            ])
+            self.known_ids.update(row["tweet_id"] for row in self.client.query(query, job_config=job_config).result())
+        return {tweet_id for tweet_id in tweet_ids if tweet_id in self.known_ids}
+
+    def flush(self) -> int | None:
         """
-        
-        existing_ids = set()
+        Store the pending rows not already in the table. Returns rows written, or
+        None if the lookup or load job failed (the rows stay pending).
+        """
+        if not self.pending:
+            return 0
         try:
-            check_result = client.query(check_query).result()
-            existing_ids = {row["tweet_id"] for row in check_result}
-        except Exception:
-            pass  # Table might be empty
-        
-        if tweet_id in existing_ids:
-            return False  # Skip duplicate
-        
-        # Prepare row for insertion
-        created_at = prediction.get("created_at")
-        if created_at is not None:
-            created_at = str(created_at)
-            
-        updated_at = prediction.get("updated_at")
-        if updated_at is not None:
-            updated_at = str(updated_at)
-        
-        row = {
-            "tweet_id": tweet_id,
-            "text": prediction.get("text"),
-            "prediction": prediction.get("prediction"),
-            "score": float(prediction["score"]) if prediction.get("score") is not None else None,
-            "model_version": prediction.get("model_version"),
-            "prediction_llm0": prediction.get("prediction_llm0"),
-            "score_llm0": float(prediction["score_llm0"]) if prediction.get("score_llm0") is not None else None,
-            "prediction_llm3": prediction.get("prediction_llm3"),
-            "score_llm3": float(prediction["score_llm3"]) if prediction.get("score_llm3") is not None else None,
-            "prediction_llm4": prediction.get("prediction_llm4"),
-            "score_llm4": float(prediction["score_llm4"]) if prediction.get("score_llm4") is not None else None,
-            "possibly_sensitive": prediction.get("possibly_sensitive"),
-            "created_at": created_at,
-            "updated_at": updated_at,
-            "normalized_text": prediction.get("normalized_text"),
-            "rn": int(prediction["rn"]) if prediction.get("rn") is not None else None,
-            "retweet_count": retweet_count,
-        }
-        
-        # Insert row
-        errors = client.insert_rows_json(table_id, [row])
-        if errors:
-            print(f"❌ Errors inserting row to BigQuery: {errors}")
-            return False
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ Error during BigQuery insert: {e}")
-        return False
+            existing = self.existing_ids(list(self.pending))
+            new_rows = [row for tweet_id, row in self.pending.items() if tweet_id not in existing]
+            if new_rows:
+                job_config = bigquery.LoadJobConfig(
+                    schema=RESULTS_SCHEMA,
+                    write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+                )
+                self.client.load_table_from_json(new_rows, self.table_id, job_config=job_config).result()
+                self.known_ids.update(row["tweet_id"] for row in new_rows)
+        except Exception as e:
+            print(f"❌ Error during BigQuery load of {len(self.pending)} rows: {e}")
+            return None
+
+        self.pending = {}
+        if existing:
+            print(f"ℹ️ Skipped {len(existing)} predictions already in {self.table_id}")
+        print(f"📤 Loaded {len(new_rows)} rows into {self.table_id}")
+        return len(new_rows)
 
 
 def initialize_neo4j_schema(driver) -> None:
@@ -249,90 +313,51 @@ def initialize_neo4j_schema(driver) -> None:
     print("✅ Schema initialization complete\n")
 
 
-def load_predictions_and_retweets_to_neo4j(driver, prediction: dict, retweets: list[dict]) -> int:
-    """Load prediction tweet and its retweets into Neo4j."""
-    def create_nodes_and_relationships(tx, pred: dict, rts: list[dict]):
-        # Create or update the original tweet node with CoreML predictions
-        tx.run(
-            """
-            MERGE (t:Tweet {tweet_id: $tweet_id})
-            SET t.text = $text,
-                t.prediction = $prediction,
-                t.score = $score,
-                t.model_version = $model_version,
-                t.prediction_llm0 = $prediction_llm0,
-                t.score_llm0 = $score_llm0,
-                t.prediction_llm3 = $prediction_llm3,
-                t.score_llm3 = $score_llm3,
-                t.prediction_llm4 = $prediction_llm4,
-                t.score_llm4 = $score_llm4,
-                t.possibly_sensitive = $possibly_sensitive,
-                t.created_at = $created_at,
-                t.updated_at = $updated_at,
-                t.normalized_text = $normalized_text,
-                t.rn = $rn
-            """,
-            tweet_id=pred["tweet_id"],
-            text=pred.get("text"),
-            prediction=pred.get("prediction"),
-            score=float(pred["score"]) if pred.get("score") is not None else None,
-            model_version=pred.get("model_version"),
-            prediction_llm0=pred.get("prediction_llm0"),
-            score_llm0=float(pred["score_llm0"]) if pred.get("score_llm0") is not None else None,
-            prediction_llm3=pred.get("prediction_llm3"),
-            score_llm3=float(pred["score_llm3"]) if pred.get("score_llm3") is not None else None,
-            prediction_llm4=pred.get("prediction_llm4"),
-            score_llm4=float(pred["score_llm4"]) if pred.get("score_llm4") is not None else None,
-            possibly_sensitive=pred.get("possibly_sensitive"),
-            created_at=str(pred.get("created_at")) if pred.get("created_at") else None,
-            updated_at=str(pred.get("updated_at")) if pred.get("updated_at") else None,
-            normalized_text=pred.get("normalized_text"),
-            rn=int(pred["rn"]) if pred.get("rn") is not None else None,
-        )
-
-        # Create retweet nodes and relationships
-        for rt in rts:
-            # Create retweet node
-            tx.run(
-                """
-                MERGE (rt:Tweet {tweet_id: $retweet_id})
-                SET rt.text = $retweet_text,
-                    rt.author_id = $retweeter_id,
-                    rt.created_at = $retweet_created_at,
-                    rt.possibly_sensitive = $possibly_sensitive
-                """,
-                retweet_id=rt["retweet_id"],
-                retweet_text=rt.get("retweet_text"),
-                retweeter_id=rt.get("retweeter_id"),
-                retweet_created_at=str(rt.get("retweet_created_at")) if rt.get("retweet_created_at") else None,
-                possibly_sensitive=rt.get("possibly_sensitive"),
-            )
-            
-            # Create RETWEETED relationship
-            tx.run(
-                """
-                MATCH (source:Tweet {tweet_id: $retweet_id})
-                MATCH (target:Tweet {tweet_id: $original_tweet_id})
-                MERGE (source)-[:RETWEETED]->(target)
-                """,
-                retweet_id=rt["retweet_id"],
-                original_tweet_id=pred["tweet_id"],
-            )
-
-    inserted = 0
-    failed = 0
-    with driver.session() as session:
-        try:
-            session.execute_write(create_nodes_and_relationships, prediction, retweets)
-            inserted = 1 + len(retweets)  # Original tweet + retweets
-        except Exception as e:
-            failed += 1
-            print(f"⚠️ Failed to insert tweet {prediction.get('tweet_id')}: {e}")
-    
-    if failed > 0:
-        print(f"⚠️ {failed} predictions failed to insert into Neo4j")
-    
-    return inserted
+def prediction_node(pred: dict) -> dict:
+    """Tweet node properties for a CoreML prediction row."""
+    return {
+        "tweet_id": pred["tweet_id"],
+        "text": pred.get("text"),
+        "prediction": pred.get("prediction"),
+        "score": float(pred["score"]) if pred.get("score") is not None else None,
+        "model_version": pred.get("model_version"),
+        "prediction_llm0": pred.get("prediction_llm0"),
+        "score_llm0": float(pred["score_llm0"]) if pred.get("score_llm0") is not None else None,
+        "prediction_llm3": pred.get("prediction_llm3"),
+        "score_llm3": float(pred["score_llm3"]) if pred.get("score_llm3") is not None else None,
+        "prediction_llm4": pred.get("prediction_llm4"),
+        "score_llm4": float(pred["score_llm4"]) if pred.get("score_llm4") is not None else None,
+        "possibly_sensitive": pred.get("possibly_sensitive"),
+        "created_at": str(pred.get("created_at")) if pred.get("created_at") else None,
+        "updated_at": str(pred.get("updated_at")) if pred.get("updated_at") else None,
+        "normalized_text": pred.get("normalized_text"),
+        "rn": int(pred["rn"]) if pred.get("rn") is not None else None,
+    }
+
+
+def retweet_node(rt: dict) -> dict:
+    """Tweet node properties for a retweet found by find_retweets_for_tweets."""
+    return {
+        "tweet_id": rt["retweet_id"],
+        "text": rt.get("retweet_text"),
+        "author_id": rt.get("retweeter_id"),
+        "created_at": str(rt.get("retweet_created_at")) if rt.get("retweet_created_at") else None,
+        "possibly_sensitive": rt.get("possibly_sensitive"),
+    }
+
+
+def load_predictions_and_retweets_to_neo4j(
+    writer: Neo4jBulkWriter,
+    predictions: list[dict],
+    retweets_by_id: dict[str, list[dict]],
+) -> int:
+    """Load a batch of prediction tweets and their retweets into Neo4j. Returns nodes written."""
+    retweets = [rt for pred in predictions for rt in retweets_by_id.get(str(pred["tweet_id"]), [])]
+    nodes = writer.write_tweets(
+        [prediction_node(pred) for pred in predictions] + [retweet_node(rt) for rt in retweets]
+    )
+    writer.write_retweets((rt["retweet_id"], rt["referenced_tweet_id"]) for rt in retweets)
+    return nodes
 
 
 def main() -> int:
@@ -342,14 +367,29 @@ def main() -> int:
     parser.add_argument("--bq-project", default=os.getenv("BQ_PROJECT", "emakia"))
     parser.add_argument("--bq-dataset", default=os.getenv("BQ_DATASET", "politics2024"))
     parser.add_argument("--batch-size", type=int, default=100)
-    parser.add_argument("--batches", type=int, default=5)
-    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("--batches", type=int, default=5, help="Batches to process (0 = all remaining rows)")
+    parser.add_argument("--offset", type=int, default=0, help="Row to start at")
+    parser.add_argument("--read-streams", type=int, default=0,
+                        help="Read results with the BigQuery Storage Read API (needs google-cloud-bigquery-storage)")
+    parser.add_argument("--range-tweets", type=int, default=DEFAULT_RANGE_KEYS,
+                        help="tweet_ids read per query job (each job sorts only its range)")
+    parser.add_argument("--neo4j-batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Rows per UNWIND transaction when writing to Neo4j")
+    parser.add_argument("--neo4j-workers", type=int, default=DEFAULT_WORKERS,
+                        help="Parallel Neo4j sessions (rows partitioned by tweet_id hash)")
+    parser.add_argument("--bq-load-rows", type=int, default=DEFAULT_LOAD_ROWS,
+                        help="Rows buffered per results_of_CoreML load job (BigQuery allows 1,500 per table per day)")
+    parser.add_argument("--checkpoint-file", default=DEFAULT_CHECKPOINT_FILE,
+                        help="Progress state; reruns resume after the last committed tweet_id per sink")
+    parser.add_argument("--reset-checkpoint", action="store_true",
+                        help="Forget saved progress for this pipeline and start from --offset")
     parser.add_argument("--verbose", action="store_true")
     parser.add_argument("--init-schema", action="store_true", help="Initialize Neo4j schema (constraints and indexes)")
     args = parser.parse_args()
 
     bq_client = init_bigquery_client()
     driver = get_neo4j_driver()
+    writer = Neo4jBulkWriter(driver, batch_size=args.neo4j_batch_size, workers=args.neo4j_workers)
 
     # Initialize Neo4j schema
     if args.init_schema:
@@ -357,88 +397,113 @@ def main() -> int:
 
     # Create BigQuery results table
     create_bigquery_results_table(bq_client, args.bq_project, args.bq_dataset)
+    results_sink = ResultsSink(bq_client, args.bq_project, args.bq_dataset, load_rows=args.bq_load_rows)
 
     total_predictions_processed = 0
     total_retweets_found = 0
     total_nodes_created = 0
     total_bq_inserted = 0
 
+    # Progress is tracked per sink; resume after the least advanced one
+    pipeline = f"process_coreml_retweets:{args.bq_project}.{args.bq_dataset}.CoreMLpredictions"
+    checkpoints = CheckpointStore(args.checkpoint_file)
+    if args.reset_checkpoint:
+        checkpoints.reset(pipeline)
+    resume_after = checkpoints.resume_after(pipeline, ["neo4j", "bigquery"])
+    if resume_after is not None:
+        print(f"⏩ Resuming after tweet_id {resume_after} (checkpoint {args.checkpoint_file}; --offset ignored)")
+
+    # Query jobs read bounded tweet_id ranges in order; --offset skips into the result
+    prediction_batches = iter_coreml_prediction_batches(
+        bq_client,
+        args.bq_project,
+        args.bq_dataset,
+        batch_size=args.batch_size,
+        offset=args.offset if resume_after is None else 0,
+        max_rows=args.batches * args.batch_size if args.batches else None,
+        read_streams=args.read_streams,
+        after_tweet_id=resume_after,
+        range_tweets=args.range_tweets,
+    )
+    batches_label = args.batches or "all"
+    exit_code = 0
+    # BigQuery progress covered by the sink's buffer: committed after each flush
+    bq_mark, bq_buffered = None, 0
+
+    def flush_results() -> bool:
+        nonlocal total_bq_inserted, bq_mark, bq_buffered
+        inserted = results_sink.flush()
+        if inserted is None:
+            print("❌ BigQuery load failed; stopping so the next run resumes from the last checkpoint")
+            return False
+        total_bq_inserted += inserted
+        if bq_mark is not None:
+            checkpoints.commit(pipeline, "bigquery", bq_mark, bq_buffered)
+        bq_mark, bq_buffered = None, 0
+        return True
+
     try:
-        for batch_num in range(args.batches):
-            batch_offset = args.offset + batch_num * args.batch_size
+        for batch_num, predictions_batch in enumerate(prediction_batches):
+            last_tweet_id = str(predictions_batch[-1]["tweet_id"])
             print(f"\n{'='*60}")
-            print(f"🔄 Processing batch {batch_num + 1}/{args.batches}")
-            print(f"📍 Offset: {batch_offset}, Limit: {args.batch_size}")
+            print(f"🔄 Processing batch {batch_num + 1}/{batches_label}")
+            print(f"📍 tweet_id {predictions_batch[0]['tweet_id']}–{last_tweet_id}")
             print(f"{'='*60}\n")
 
-            # Fetch predictions from CoreMLpredictions table
-            predictions_batch = fetch_coreml_predictions(
+            print(f"📊 Retrieved {len(predictions_batch)} predictions from CoreMLpredictions table")
+
+            batch_retweets = 0
+
+            # One retweet lookup for the whole batch
+            retweets_by_id = find_retweets_for_tweets(
                 bq_client,
                 args.bq_project,
                 args.bq_dataset,
-                limit=args.batch_size,
-                offset=batch_offset,
+                [prediction.get("tweet_id") for prediction in predictions_batch],
             )
-            
-            if not predictions_batch:
-                print("⚠️ No predictions retrieved in this batch.")
-                continue
 
-            print(f"📊 Retrieved {len(predictions_batch)} predictions from CoreMLpredictions table")
-
-            batch_retweets = 0
-            batch_bq_inserted = 0
-
-            # Process each prediction
-            for i, prediction in enumerate(predictions_batch, 1):
-                tweet_id = prediction.get("tweet_id")
-                
-                if args.verbose:
-                    print(f"\n  🔍 [{i}/{len(predictions_batch)}] Processing tweet_id: {tweet_id}")
-                
-                # Find retweets for this tweet
-                retweets = find_retweets_for_tweet(
-                    bq_client,
-                    args.bq_project,
-                    args.bq_dataset,
-                    tweet_id,
-                )
-                
-                retweet_count = len(retweets)
+            # Load the whole batch into Neo4j in bulk (rows the graph does not have yet)
+            neo4j_rows = pending_rows(predictions_batch, checkpoints.high_water_mark(pipeline, "neo4j"))
+            failed_before = writer.failed_rows
+            nodes_created = load_predictions_and_retweets_to_neo4j(writer, neo4j_rows, retweets_by_id)
+            total_nodes_created += nodes_created
+            if writer.failed_rows > failed_before:
+                print("❌ Neo4j writes failed; stopping so the next run resumes from the last checkpoint")
+                exit_code = 1
+                break
+            checkpoints.commit(pipeline, "neo4j", last_tweet_id, len(neo4j_rows))
+
+            # Buffer for results_of_CoreML; loaded (and checkpointed) in large flushes
+            bq_rows = pending_rows(predictions_batch, checkpoints.high_water_mark(pipeline, "bigquery"))
+            retweet_counts = {}
+            for i, prediction in enumerate(bq_rows, 1):
+                tweet_id = str(prediction.get("tweet_id"))
+                retweet_count = len(retweets_by_id.get(tweet_id, []))
+                retweet_counts[tweet_id] = retweet_count
                 batch_retweets += retweet_count
-                
-                if args.verbose:
-                    print(f"    ↪ Found {retweet_count} retweet(s)")
-                
-                # Load to Neo4j
-                nodes_created = load_predictions_and_retweets_to_neo4j(driver, prediction, retweets)
-                total_nodes_created += nodes_created
-                
-                # Insert to BigQuery results table
-                inserted = insert_results_to_bigquery(
-                    bq_client,
-                    args.bq_project,
-                    args.bq_dataset,
-                    prediction,
-                    retweet_count
-                )
-                
-                if inserted:
-                    batch_bq_inserted += 1
-                    total_bq_inserted += 1
-                
-                total_predictions_processed += 1
-                total_retweets_found += retweet_count
-                
+
                 if args.verbose:
-                    print(f"    ✅ Created {nodes_created} node(s) in Neo4j")
-                    print(f"    ✅ Inserted to BigQuery: {inserted}")
-            
+                    print(f"  🔍 [{i}/{len(bq_rows)}] tweet_id {tweet_id}: {retweet_count} retweet(s)")
+
+            total_predictions_processed += len(bq_rows)
+            total_retweets_found += batch_retweets
+
+            results_sink.add(bq_rows, retweet_counts)
+            bq_mark, bq_buffered = last_tweet_id, bq_buffered + len(bq_rows)
+
             print(f"\n✅ Batch {batch_num + 1} complete:")
             print(f"   • Predictions processed: {len(predictions_batch)}")
             print(f"   • Retweets found: {batch_retweets}")
-            print(f"   • Inserted to BigQuery: {batch_bq_inserted}")
-    
+            print(f"   • Nodes written to Neo4j: {nodes_created}")
+            print(f"   • Buffered for BigQuery: {len(results_sink.pending)}")
+
+            if results_sink.full and not flush_results():
+                exit_code = 1
+                break
+        else:
+            if not flush_results():
+                exit_code = 1
+
     finally:
         driver.close()
     
@@ -475,7 +540,7 @@ def main() -> int:
     
     print("="*60)
 
-    return 0
+    return exit_code
 
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+"""
+Precomputed retweet edges for graph loading.
+
+Maintains `<project>.<dataset>.retweet_edges`: one row per
+(source_tweet_id -> target_tweet_id) reference taken from the tweets table's
+`referenced_tweets`, with the retweet's author, time, text and sensitivity,
+partitioned by day and clustered by target, so the loaders look retweets up
+instead of UNNESTing (or joining back to) every raw tweet on each run.
+
+Usage:
+    python retweet_edges.py --full-refresh   # (re)build the table from scratch
+    python retweet_edges.py                  # append edges for tweets newer than the table
+
+Run the incremental job before the loaders (or on a schedule). The loaders do not
+depend on it for correctness: they read edges through `current_edges_query`,
+which derives edges for tweets the table has not caught up with yet on the fly.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from google.cloud import bigquery
+
+load_dotenv()
+
+# Shared BigQuery client factory lives with the backend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Backend-google-heroku-iPhone"))
+from bq_client import get_client  # noqa: E402
+
+EDGES_TABLE = os.environ.get("RETWEET_EDGES_TABLE", "retweet_edges")
+DEFAULT_LOOKBACK_HOURS = 24
+EDGE_COLUMNS = ["source_tweet_id", "target_tweet_id", "author_id", "created_at", "text", "possibly_sensitive"]
+
+EDGES_QUERY = """
+    SELECT
+        t.id AS source_tweet_id,
+        ref_tweet.id AS target_tweet_id,
+        t.author_id,
+        t.created_at,
+        t.text,
+        t.possibly_sensitive
+    FROM `{tweets_table}` AS t,
+    UNNEST(t.referenced_tweets) AS ref_tweet
+    WHERE t.id IS NOT NULL AND ref_tweet.id IS NOT NULL {where}
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY t.id, ref_tweet.id ORDER BY t.created_at) = 1
+"""
+
+
+# (source_tweet_id, target_tweet_id) for every tweet: the table's edges, plus edges
+# derived from referenced_tweets for tweets created within the lookback of its
+# watermark or later (all tweets while the table is empty)
+CURRENT_EDGES_QUERY = """
+    SELECT source_tweet_id, target_tweet_id FROM `{edges_table}`
+    UNION DISTINCT
+    SELECT t.id, ref_tweet.id
+    FROM `{tweets_table}` AS t,
+    UNNEST(t.referenced_tweets) AS ref_tweet
+    WHERE t.id IS NOT NULL AND ref_tweet.id IS NOT NULL
+        AND t.created_at > COALESCE(
+            (SELECT TIMESTAMP_SUB(MAX(created_at), INTERVAL {lookback_minutes} MINUTE) FROM `{edges_table}`),
+            TIMESTAMP '1970-01-01'
+        )
+"""
+
+
+def edges_table_id(project_id: str, dataset_id: str) -> str:
+    return f"{project_id}.{dataset_id}.{EDGES_TABLE}"
+
+
+def current_edges_query(project_id: str, dataset_id: str, tweets_table: str,
+                        lookback_hours: float = DEFAULT_LOOKBACK_HOURS) -> str:
+    """
+    SQL for the edges of every tweet in `tweets_table`, including tweets newer
+    than the last incremental refresh. Checkpointed loaders join this rather
+    than the bare table, so a run ahead of the refresh cannot move its
+    checkpoint past tweets whose edges are not materialized yet.
+    """
+    return CURRENT_EDGES_QUERY.format(
+        edges_table=edges_table_id(project_id, dataset_id),
+        tweets_table=f"{project_id}.{dataset_id}.{tweets_table}",
+        lookback_minutes=int(lookback_hours * 60),
+    )
+
+
+def full_refresh(client: bigquery.Client, project_id: str, dataset_id: str, tweets_table: str) -> None:
+    """Rebuild the edge table from every tweet."""
+    table_id = edges_table_id(project_id, dataset_id)
+    query = f"""
+        CREATE OR REPLACE TABLE `{table_id}`
+        PARTITION BY DATE(created_at)
+        CLUSTER BY target_tweet_id, source_tweet_id
+        AS {EDGES_QUERY.format(tweets_table=f"{project_id}.{dataset_id}.{tweets_table}", where="")}
+    """
+    job = client.query(query)
+    job.result()
+    print(f"✅ Rebuilt {table_id} ({job.total_bytes_processed or 0:,} bytes processed)")
+
+
+def get_watermark(client: bigquery.Client, table_id: str):
+    """created_at of the newest edge already in the table (None if empty)."""
+    row = list(client.query(f"SELECT MAX(created_at) AS watermark FROM `{table_id}`").result())[0]
+    return row.watermark
+
+
+def incremental_refresh(
+    client: bigquery.Client,
+    project_id: str,
+    dataset_id: str,
+    tweets_table: str,
+    lookback_hours: float,
+) -> int:
+    """
+    Append edges for tweets created after the table's watermark. Tweets within
+    `lookback_hours` of it are re-read to catch late arrivals; edges already
+    present are skipped. Returns rows inserted.
+    """
+    table_id = edges_table_id(project_id, dataset_id)
+    if {field.name for field in client.get_table(table_id).schema} < set(EDGE_COLUMNS):
+        print("⚠️ Edge table predates the text/possibly_sensitive columns, running a full refresh instead")
+        full_refresh(client, project_id, dataset_id, tweets_table)
+        return 0
+    watermark = get_watermark(client, table_id)
+    if watermark is None:
+        print("⚠️ Edge table is empty, running a full refresh instead")
+        full_refresh(client, project_id, dataset_id, tweets_table)
+        return 0
+
+    new_edges = EDGES_QUERY.format(
+        tweets_table=f"{project_id}.{dataset_id}.{tweets_table}",
+        where="AND t.created_at > TIMESTAMP_SUB(@watermark, INTERVAL @lookback_minutes MINUTE)",
+    )
+    query = f"""
+        MERGE `{table_id}` AS target
+        USING ({new_edges}) AS src
+        ON target.source_tweet_id = src.source_tweet_id
+            AND target.target_tweet_id = src.target_tweet_id
+            AND target.created_at > TIMESTAMP_SUB(@watermark, INTERVAL @lookback_minutes MINUTE)
+        WHEN NOT MATCHED THEN INSERT ({", ".join(EDGE_COLUMNS)})
+            VALUES ({", ".join(f"src.{col}" for col in EDGE_COLUMNS)})
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("watermark", "TIMESTAMP", watermark),
+        bigquery.ScalarQueryParameter("lookback_minutes", "INT64", int(lookback_hours * 60)),
+    ])
+    job = client.query(query, job_config=job_config)
+    job.result()
+    inserted = job.num_dml_affected_rows or 0
+    print(f"✅ Appended {inserted} edges to {table_id} ({job.total_bytes_processed or 0:,} bytes processed)")
+    return inserted
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Maintain the precomputed retweet edge table.")
+    parser.add_argument("--bq-project", default=os.getenv("BQ_PROJECT", "emakia"))
+    parser.add_argument("--bq-dataset", default=os.getenv("BQ_DATASET", "politics2024"))
+    parser.add_argument("--bq-table", default=os.getenv("BQ_TABLE", "tweets"), help="Raw tweets table")
+    parser.add_argument("--full-refresh", action="store_true", help="Rebuild the table from scratch")
+    parser.add_argument("--lookback-hours", type=float, default=DEFAULT_LOOKBACK_HOURS,
+                        help="Re-read tweets this far behind the watermark to catch late arrivals")
+    args = parser.parse_args()
+
+    client = get_client(required=True)
+    started = time.monotonic()
+    if args.full_refresh:
+        full_refresh(client, args.bq_project, args.bq_dataset, args.bq_table)
+    else:
+        incremental_refresh(client, args.bq_project, args.bq_dataset, args.bq_table, args.lookback_hours)
+    print(f"⏱️ Done in {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
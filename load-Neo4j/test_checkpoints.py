@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+from bq_extract import align_batches, cap_rows, iter_keyset_batches
+from checkpoints import CheckpointStore, pending_rows
+
+
+def rows(*keys):
+    return [{"tweet_id": key} for key in keys]
+
+
+def keys(batches):
+    return [[row["tweet_id"] for row in batch] for batch in batches]
+
+
+def test_align_batches_moves_a_split_key_into_the_next_batch():
+    batches = [rows("a", "b", "b"), rows("b", "c"), rows("d")]
+    assert keys(align_batches(batches, "tweet_id")) == [["a"], ["b", "b", "b"], ["c"], ["d"]]
+
+
+def test_align_batches_grows_a_batch_holding_a_single_key():
+    batches = [rows("a", "a"), rows("a", "a"), rows("b")]
+    assert keys(align_batches(batches, "tweet_id")) == [["a", "a", "a", "a"], ["b"]]
+
+
+def test_cap_rows_finishes_the_batch_that_reaches_the_cap():
+    batches = align_batches([rows("a", "b", "b"), rows("b", "c", "c"), rows("d")], "tweet_id")
+    assert keys(cap_rows(batches, 2)) == [["a"], ["b", "b", "b"]]
+
+
+def test_cap_rows_none_yields_everything():
+    assert keys(cap_rows([rows("a"), rows("b")], None)) == [["a"], ["b"]]
+
+
+class FakeRangeClient:
+    """Serves the first @range_keys keys after @after_key, like the loaders' range queries."""
+
+    def __init__(self, table):
+        self.table = table
+        self.jobs = []
+
+    def query(self, query, job_config=None):
+        params = {p.name: p.value for p in job_config.query_parameters}
+        self.jobs.append(params["after_key"])
+        keys = sorted({row["tweet_id"] for row in self.table if params["after_key"] is None
+                       or row["tweet_id"] > params["after_key"]})[:params["range_keys"]]
+        rows = [row for row in self.table if row["tweet_id"] in keys]
+        return SimpleNamespace(result=lambda page_size, start_index: rows)
+
+
+def test_iter_keyset_batches_reads_bounded_ranges_after_the_last_key():
+    client = FakeRangeClient(rows("a", "b", "b", "c", "d", "d", "e"))
+    batches = iter_keyset_batches(client, "query", "tweet_id", batch_size=3, range_keys=2)
+
+    assert sum(keys(batches), []) == ["a", "b", "b", "c", "d", "d", "e"]
+    assert client.jobs == [None, "b", "d"]
+
+
+def test_iter_keyset_batches_resumes_and_skips_rows():
+    client = FakeRangeClient(rows("a", "b", "c", "d"))
+    batches = iter_keyset_batches(client, "query", "tweet_id", batch_size=2, after="a", start_row=1, range_keys=2)
+
+    assert keys(batches) == [["c", "d"]]
+    assert client.jobs == ["a", "c"]
+
+
+def test_pending_rows_keeps_rows_after_the_mark():
+    assert keys([pending_rows(rows("1", "2", "3"), "2")]) == [["3"]]
+    assert keys([pending_rows(rows("1"), None)]) == [["1"]]
+
+
+def test_checkpoint_store_persists_and_resumes_from_least_advanced_sink(tmp_path):
+    path = str(tmp_path / "checkpoints.json")
+    store = CheckpointStore(path)
+    assert store.resume_after("p", ["neo4j", "bigquery"]) is None
+
+    store.commit("p", "neo4j", "20", 10)
+    assert store.resume_after("p", ["neo4j", "bigquery"]) is None
+    store.commit("p", "bigquery", "10", 5)
+    store.commit("p", "neo4j", "30", 10)
+
+    reloaded = CheckpointStore(path)
+    assert reloaded.high_water_mark("p", "neo4j") == "30"
+    assert reloaded.resume_after("p", ["neo4j", "bigquery"]) == "10"
+    assert reloaded._state["p"]["neo4j"]["rows"] == 20
+
+    reloaded.reset("p")
+    assert CheckpointStore(path).high_water_mark("p", "neo4j") is None
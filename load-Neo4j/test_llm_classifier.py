@@ -0,0 +1,83 @@
+import threading
+import time
+
+import llm_classifier
+from llm_classifier import ConcurrentClassifier, TokenBucket
+
+
+def test_token_bucket_disabled_never_waits(monkeypatch):
+    def sleep(seconds):
+        raise AssertionError(f"disabled bucket slept for {seconds}s")
+
+    monkeypatch.setattr(llm_classifier.time, "sleep", sleep)
+    bucket = TokenBucket(0)
+    for _ in range(1000):
+        bucket.acquire(10)
+
+
+def test_token_bucket_waits_for_refill_once_empty(monkeypatch):
+    clock = [100.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(llm_classifier.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(llm_classifier.time, "sleep", sleep)
+
+    bucket = TokenBucket(60, burst_seconds=5)  # 1 token/s, holds 5
+    for _ in range(5):
+        bucket.acquire()
+    assert slept == []
+
+    bucket.acquire(2)
+    assert sum(slept) == 2
+
+
+def test_token_bucket_caps_cost_at_capacity(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(llm_classifier.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(llm_classifier.time, "sleep", lambda seconds: clock.__setitem__(0, clock[0] + seconds))
+
+    bucket = TokenBucket(60, burst_seconds=5)
+    bucket.acquire(1_000)  # would otherwise wait forever
+    assert clock[0] == 0.0
+
+
+def test_classify_all_keeps_input_order_across_workers():
+    def classify(text):
+        time.sleep(0.001 * (len(text) % 5))
+        return {"text": text, "thread": threading.current_thread().name}
+
+    texts = [f"tweet {i}" + "x" * (i % 7) for i in range(40)]
+    classifier = ConcurrentClassifier(classify, workers=8, rpm=0, tpm=0)
+    results = classifier.classify_all(texts)
+
+    assert [result["text"] for result in results] == texts
+    assert len({result["thread"] for result in results}) > 1
+
+
+def test_packed_classification_falls_back_to_single_calls():
+    single_calls = []
+
+    def classify(text):
+        single_calls.append(text)
+        return {"label": "single", "text": text}
+
+    def classify_packed(texts):
+        return [None if text == "b" else {"label": "packed", "text": text} for text in texts]
+
+    classifier = ConcurrentClassifier(classify, classify_packed, pack_size=2, workers=2, rpm=0, tpm=0)
+    results = classifier.classify_all(["a", "b", "c"])
+
+    assert [(r["label"], r["text"]) for r in results] == [("packed", "a"), ("single", "b"), ("packed", "c")]
+    assert single_calls == ["b"]
+
+
+def test_packed_result_of_wrong_length_retries_every_item():
+    classifier = ConcurrentClassifier(
+        lambda text: {"label": "single"}, lambda texts: [{"label": "packed"}],
+        pack_size=3, workers=1, rpm=0, tpm=0,
+    )
+    assert [r["label"] for r in classifier.classify_all(["a", "b", "c"])] == ["single"] * 3
@@ -0,0 +1,124 @@
+import json
+from types import SimpleNamespace
+
+from load_data_into_neo4j import classify_pending_rows, classify_tweets_with_openai, parse_packed_classifications
+
+CLEAN = {"toxicity": "non-toxic", "misinfo": "non-misinformation", "bias": "non-biased"}
+
+
+def item(id, toxicity="non-toxic", misinformation="non-misinformation", bias="non-biased"):
+    return {"id": id, "toxicity": toxicity, "misinformation": misinformation, "bias": bias}
+
+
+def test_parse_packed_classifications_in_item_order():
+    raw = json.dumps({"results": [item(2, toxicity="toxic"), item(1)]})
+    assert parse_packed_classifications(raw, 2) == [CLEAN, {**CLEAN, "toxicity": "toxic"}]
+
+
+def test_parse_packed_classifications_keeps_complete_items_of_a_truncated_response():
+    raw = json.dumps({"results": [item(1), item(2)]})[:-30]
+    assert parse_packed_classifications(raw, 2) == [CLEAN, None]
+
+
+def test_parse_packed_classifications_rejects_bad_labels():
+    raw = json.dumps({"results": [item(1, bias="maybe"), item(2, toxicity="")]})
+    assert parse_packed_classifications(raw, 2) == [None, None]
+
+
+def test_parse_packed_classifications_accepts_string_ids():
+    raw = json.dumps({"results": [item("1"), item("two")]})
+    assert parse_packed_classifications(raw, 2) == [CLEAN, None]
+
+
+def test_parse_packed_classifications_ignores_out_of_range_and_duplicate_ids():
+    raw = json.dumps({"results": [item(0), item(3), item(1), item(1, toxicity="toxic")]})
+    assert parse_packed_classifications(raw, 2) == [CLEAN, None]
+
+
+def test_parse_packed_classifications_handles_empty_responses():
+    assert parse_packed_classifications(None, 2) == [None, None]
+    assert parse_packed_classifications("not json", 1) == [None]
+
+
+class FakeOpenAI:
+    def __init__(self, content=None, error=None):
+        self.chat = SimpleNamespace(completions=self)
+        self.content = content
+        self.error = error
+
+    def create(self, **kwargs):
+        if self.error:
+            raise self.error
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))])
+
+
+def test_classify_tweets_with_openai_parses_the_response():
+    client = FakeOpenAI(json.dumps({"results": [item(1)]}))
+    assert classify_tweets_with_openai(["a", "b"], client, "gpt-4o-mini") == [CLEAN, None]
+
+
+def test_classify_tweets_with_openai_returns_none_for_every_item_on_error():
+    client = FakeOpenAI(error=RuntimeError("rate limited"))
+    assert classify_tweets_with_openai(["a", "b"], client, "gpt-4o-mini") == [None, None]
+
+
+class FakeNeo4j:
+    """Driver whose session returns labels for the Tweet nodes in `nodes`."""
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.queried = []
+
+    def session(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, tweet_ids):
+        self.queried.append(tweet_ids)
+        return [{"tweet_id": tweet_id, **self.nodes[tweet_id]} for tweet_id in tweet_ids if tweet_id in self.nodes]
+
+
+class CountingClassifier:
+    def __init__(self):
+        self.texts = []
+
+    def classify_all(self, texts):
+        self.texts.extend(texts)
+        return [{**CLEAN, "toxicity": "toxic"} for _ in texts]
+
+
+def test_classify_pending_rows_reuses_labels_already_in_neo4j():
+    batch = [
+        {"tweet_id": "1", "text": "one"},
+        {"tweet_id": "2", "text": "two", "referenced_tweet_id": "9"},
+        {"tweet_id": "2", "text": "two", "referenced_tweet_id": "8"},
+        {"tweet_id": "3", "text": "three"},
+    ]
+    # Crashed after the neo4j commit up to "2": BigQuery still needs everything
+    driver = FakeNeo4j({"1": {"toxicity": "non-toxic", "misinformation": "non-misinformation", "bias": "non-biased"},
+                        "2": {"toxicity": "non-toxic", "misinformation": "misinformation", "bias": "non-biased"}})
+    classifier = CountingClassifier()
+
+    assert classify_pending_rows(classifier, driver, batch[3:], batch) == 1
+    assert classifier.texts == ["three"]
+    assert driver.queried == [["1", "2"]]
+    assert [(row["toxicity"], row["misinfo"]) for row in batch] == [
+        ("non-toxic", "non-misinformation"),
+        ("non-toxic", "misinformation"),
+        ("non-toxic", "misinformation"),
+        ("toxic", "non-misinformation"),
+    ]
+
+
+def test_classify_pending_rows_classifies_tweets_missing_labels_in_neo4j():
+    batch = [{"tweet_id": "1", "text": "one"}, {"tweet_id": "2", "text": "two"}]
+    classifier = CountingClassifier()
+
+    assert classify_pending_rows(classifier, FakeNeo4j({}), [], batch) == 2
+    assert classifier.texts == ["one", "two"]
+    assert all(row["toxicity"] == "toxic" for row in batch)